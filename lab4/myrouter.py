@@ -9,9 +9,15 @@ import switchyard
 from switchyard.lib.userlib import *
 from collections import *
 from ipaddress import *
+from array import array
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 ForwardItem = namedtuple('ForwardItem', ['ip', 'next_hop', 'intf'])
 ARPSendInfo = namedtuple('ARPSendInfo', ['send_time', 'remain_times', 'wait_packs', 'intf'])
+ANY_IP = IPv4Address('0.0.0.0')
 
 class Node:
     def __init__(self, key, value):
@@ -67,40 +73,152 @@ class DictQueue:
             return None
         return self.map[key].value
 
+class TrieNode:
+    __slots__ = ('child', 'item')
+
+    def __init__(self):
+        self.child = [None, None]
+        self.item = None
+
 class ForwardTable:
     def __init__(self):
-        self.table = []
-    
+        self.root = TrieNode()
+        self.size = 0
+        self.compiled = None
+        self.top = None
+
     def add(self, ip, next_hop, intf):
-        self.table.append(ForwardItem(ip, next_hop, intf))
-    
+        addr, node = int(ip.network_address), self.root
+        for i in range(31, 31 - ip.prefixlen, -1):
+            bit = addr >> i & 1
+            if node.child[bit] is None:
+                node.child[bit] = TrieNode()
+            node = node.child[bit]
+        # the first route added for a prefix wins, as with the old linear table
+        if node.item is None:
+            node.item = ForwardItem(ip, next_hop, intf)
+            self.size += 1
+            self.compiled = self.top = None
+
+    def remove(self, ip):
+        addr, node, path = int(ip.network_address), self.root, []
+        for i in range(31, 31 - ip.prefixlen, -1):
+            bit = addr >> i & 1
+            path.append((node, bit))
+            node = node.child[bit]
+            if node is None:
+                return None
+        item, node.item = node.item, None
+        if item is not None:
+            self.size -= 1
+            self.compiled = self.top = None
+        while path and node.item is None and node.child[0] is None and node.child[1] is None:
+            node, bit = path.pop()
+            node.child[bit] = None
+        return item
+
     def search(self, ip):
-        try:
-            return max(filter(lambda item: ip in item.ip, self.table), key=lambda item: item.ip.prefixlen)
-        except ValueError:
-            return None
+        addr, node, start = int(ip), self.root, 31
+        best = node.item
+        if self.top is not None:
+            # one index replaces the walk through the first 16 levels
+            best, node = self.top[addr >> 16]
+            if node is None:
+                return best
+            start = 15
+        for i in range(start, -1, -1):
+            node = node.child[addr >> i & 1]
+            if node is None:
+                break
+            if node.item is not None:
+                best = node.item
+        return best
+
+    def search_batch(self, ips):
+        if np is None or self.compiled is None or len(ips) < 2:
+            return [self.search(ip) for ip in ips]
+        addrs = np.fromiter((int(ip) for ip in ips), dtype=np.uint32, count=len(ips))
+        found = [None] * len(ips)
+        pending = np.arange(len(ips))
+        for mask, nets, items in self.compiled:
+            keys = addrs[pending] & np.uint32(mask)
+            nets = np.frombuffer(nets, dtype=np.uint32)
+            pos = np.minimum(np.searchsorted(nets, keys), len(nets) - 1)
+            hit = nets[pos] == keys
+            for i, p in zip(pending[hit].tolist(), pos[hit].tolist()):
+                found[i] = items[p]
+            pending = pending[~hit]
+            if len(pending) == 0:
+                break
+        return found
+
+    def compile(self):
+        # index the trie by the first 16 bits of an address: a slot holds the
+        # longest match of at most 16 bits, and the node at depth 16 if longer
+        # prefixes hang below it, so a lookup walks at most 16 levels
+        self.top = [None] * (1 << 16)
+        stack = [(self.root, 0, 0, None)]
+        while stack:
+            node, depth, prefix, best = stack.pop()
+            if node is not None and node.item is not None:
+                best = node.item
+            leaf = node is None or node.child == [None, None]
+            if depth == 16 or leaf:
+                span = 1 << (16 - depth)
+                self.top[prefix * span:(prefix + 1) * span] = [(best, None if leaf else node)] * span
+                continue
+            stack.append((node.child[0], depth + 1, prefix << 1, best))
+            stack.append((node.child[1], depth + 1, prefix << 1 | 1, best))
+        # for search_batch, also flatten the routes into one sorted integer
+        # array per prefix length, longest first, to probe with NumPy
+        routes = defaultdict(list)
+        for item in self.table:
+            routes[item.ip.prefixlen].append((int(item.ip.network_address), item))
+        self.compiled = []
+        for prefixlen in sorted(routes, reverse=True):
+            entries = sorted(routes[prefixlen], key=lambda entry: entry[0])
+            mask = 0xffffffff << (32 - prefixlen) & 0xffffffff
+            self.compiled.append((mask, array('I', (net for net, _ in entries)), [item for _, item in entries]))
+
+    @property
+    def table(self):
+        items, stack = [], [self.root]
+        while stack:
+            node = stack.pop()
+            if node.item is not None:
+                items.append(node.item)
+            stack.extend(child for child in reversed(node.child) if child is not None)
+        return items
 
 class Router(object):
-    def __init__(self, net: switchyard.llnetbase.LLNetBase):
+    def __init__(self, net: switchyard.llnetbase.LLNetBase, batch_size=1):
         self.net = net
+        self.batch_size = batch_size
         self.arp_table = {}
         self.forward_table = ForwardTable()
         self.arp_send = DictQueue()
+        self.update_interfaces()
         self.build_forward_table()
 
     def build_forward_table(self):
         for intf in self.net.interfaces():
             ipintf = intf.ipinterface.network
-            self.forward_table.add(ipintf, IPv4Address('0.0.0.0'), intf)
+            self.forward_table.add(ipintf, ANY_IP, intf)
         fp = open('forwarding_table.txt', 'r')
         for line in fp:
             ip, mask, next_hop, intf = line.split()
             self.forward_table.add(IPv4Network(f'{ip}/{mask}'), IPv4Address(next_hop), self.net.port_by_name(intf))
         fp.close()
+        self.forward_table.compile()
         log_info(f"forward table: {self.forward_table.table}")
 
+    def update_interfaces(self):
+        # call again whenever interfaces are added, removed or readdressed
+        self.intf_by_ip = {intf.ipaddr: intf for intf in self.net.interfaces()}
+        self.router_ips = frozenset(self.intf_by_ip)
+
     def is_ip_in_router(self, ip):
-        return ip in [intf.ipaddr for intf in self.net.interfaces()]
+        return ip in self.router_ips
 
     def handle_arp(self, arp, iface):
         if self.arp_table.get(arp.senderprotoaddr) != arp.senderhwaddr:
@@ -108,7 +226,7 @@ class Router(object):
             log_info(f'Update ARP Table: {self.arp_table}')
         if self.is_ip_in_router(arp.targetprotoaddr):
             if arp.operation == ArpOperation.Request:
-                intf = self.net.interface_by_ipaddr(arp.targetprotoaddr)
+                intf = self.intf_by_ip[arp.targetprotoaddr]
                 pkt = create_ip_arp_reply(intf.ethaddr, arp.senderhwaddr, intf.ipaddr, arp.senderprotoaddr)
                 log_info(f"get request, reply arp {pkt} to {iface}")
                 self.net.send_packet(iface, pkt)
@@ -125,20 +243,24 @@ class Router(object):
         forward =  None if self.is_ip_in_router(ip.dst) else self.forward_table.search(ip.dst)
         if forward is not None:
             log_info(f"forward table hit {forward}")
-            next_hop_ip = ip.dst if forward.next_hop == IPv4Address('0.0.0.0') else forward.next_hop
-            next_hop = self.arp_table.get(next_hop_ip)
+            next_hop_ip = ip.dst if forward.next_hop == ANY_IP else forward.next_hop
             packet[Ethernet].src = forward.intf.ethaddr
-            if next_hop is not None:
+            self.send_to_next_hop(forward.intf, next_hop_ip, [packet])
+
+    def send_to_next_hop(self, intf, next_hop_ip, packets):
+        next_hop = self.arp_table.get(next_hop_ip)
+        if next_hop is not None:
+            for packet in packets:
                 packet[Ethernet].dst = next_hop
-                log_info(f"arp cache hit: {next_hop}, send ip {packet} to {forward.intf}")
-                self.net.send_packet(forward.intf, packet)
+                log_info(f"arp cache hit: {next_hop}, send ip {packet} to {intf}")
+                self.net.send_packet(intf, packet)
+        else:
+            log_info(f"arp cache miss, pend ip {packets}")
+            wait_packs = self.arp_send.get(next_hop_ip)
+            if wait_packs is None:
+                self.arp_send.push(next_hop_ip, ARPSendInfo(0, 5, packets, intf))
             else:
-                log_info(f"arp cache miss, pend ip {packet}")
-                wait_packs = self.arp_send.get(next_hop_ip)
-                if wait_packs is None:
-                    self.arp_send.push(next_hop_ip, ARPSendInfo(0, 5, [packet], forward.intf))
-                else:
-                    wait_packs.wait_packs.append(packet)
+                wait_packs.wait_packs.extend(packets)
 
     def handle_packet(self, recv: switchyard.llnetbase.ReceivedPacket):
         _, ifaceName, packet = recv
@@ -152,6 +274,39 @@ class Router(object):
                 log_info(f"receive a ip packet {ifaceName} {ip}")
                 self.handle_ip(ip, packet)
 
+    def handle_batch(self, recvs):
+        # ARP and packets for the router itself go through the usual path,
+        # transit packets are looked up together and sent per (interface, next hop)
+        transit = []
+        for recv in recvs:
+            _, ifaceName, packet = recv
+            ip = packet.get_header(IPv4)
+            if packet.get_header(Arp) is None and ip is not None and not self.is_ip_in_router(ip.dst):
+                log_info(f"receive a ip packet {ifaceName} {ip}")
+                transit.append(packet)
+            else:
+                self.handle_packet(recv)
+        forwards = self.forward_table.search_batch([packet[IPv4].dst for packet in transit])
+        groups = defaultdict(list)
+        for packet, forward in zip(transit, forwards):
+            packet[IPv4].ttl -= 1
+            if forward is not None:
+                packet[Ethernet].src = forward.intf.ethaddr
+                next_hop_ip = packet[IPv4].dst if forward.next_hop == ANY_IP else forward.next_hop
+                groups[forward.intf, next_hop_ip].append(packet)
+        for (intf, next_hop_ip), packets in groups.items():
+            self.send_to_next_hop(intf, next_hop_ip, packets)
+
+    def recv_batch(self):
+        recvs = []
+        try:
+            recvs.append(self.net.recv_packet(timeout=1.0))
+            while len(recvs) < self.batch_size:
+                recvs.append(self.net.recv_packet(timeout=0))
+        except NoPackets:
+            pass
+        return recvs
+
     def resend_arp(self):
         while self.arp_send.peek() and time.time() - self.arp_send.peek().value.send_time >= 1:
             node = self.arp_send.pop()
@@ -169,6 +324,14 @@ class Router(object):
         while True:
             self.resend_arp()
 
+            if self.batch_size > 1:
+                try:
+                    recvs = self.recv_batch()
+                except Shutdown:
+                    break
+                self.handle_batch(recvs)
+                continue
+
             try:
                 recv = self.net.recv_packet(timeout=1.0)
             except NoPackets:
@@ -184,11 +347,12 @@ class Router(object):
         self.net.shutdown()
 
 
-def main(net):
+def main(net, **kwargs):
     '''
     Main entry point for router.  Just create Router
     object and get it going.
+    Pass `-g batch=N` to swyard to receive and forward up to N packets at once.
     '''
     type(net.interfaces()[0]).__repr__ = lambda self: self.name
-    router = Router(net)
+    router = Router(net, int(kwargs.get('batch', 1)))
     router.start()
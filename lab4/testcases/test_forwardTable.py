@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+'''Testcases for the longest-prefix match of ForwardTable
+
+Run from lab4/:
+    $ python3 -m unittest testcases.test_forwardTable
+'''
+
+import random
+import unittest
+from ipaddress import IPv4Address, IPv4Network
+from myrouter import ForwardTable, ANY_IP
+
+
+def randomTable(rand, count):
+    ''' Return `count` random routes, with /0 and /32 among them '''
+    routes = [IPv4Network("0.0.0.0/0"), IPv4Network((rand.getrandbits(32), 32))]
+    for _ in range(count):
+        prefixlen = rand.randrange(0, 33)
+        routes.append(IPv4Network((rand.getrandbits(32) >> (32 - prefixlen)
+                                   << (32 - prefixlen) if prefixlen else 0, prefixlen)))
+    return routes
+
+
+def longestMatch(routes, ip):
+    ''' Brute force over all routes; the first route of a prefix wins '''
+    best = None
+    for net in routes:
+        if ip in net and (best is None or net.prefixlen > best.prefixlen):
+            best = net
+    return best
+
+
+class TestForwardTable(unittest.TestCase):
+    def build(self, routes):
+        table = ForwardTable()
+        for i, net in enumerate(routes):
+            table.add(net, ANY_IP, f"eth{i}")
+        return table
+
+    def check(self, table, routes, ips):
+        first = {}
+        for i, net in enumerate(routes):
+            first.setdefault(net, f"eth{i}")
+        expected = [longestMatch(first, ip) for ip in ips]
+        expected = [None if net is None else (net, first[net]) for net in expected]
+        found = [None if item is None else (item.ip, item.intf) for item in
+                 (table.search(ip) for ip in ips)]
+        self.assertEqual(found, expected)
+        found = [None if item is None else (item.ip, item.intf)
+                 for item in table.search_batch(ips)]
+        self.assertEqual(found, expected)
+
+    def test_random(self):
+        rand = random.Random(2)
+        for count in (0, 5, 50, 500):
+            routes = randomTable(rand, count)
+            table = self.build(routes)
+            ips = [IPv4Address(rand.getrandbits(32)) for _ in range(300)]
+            ips += [net.network_address for net in routes]
+            ips += [net.broadcast_address for net in routes]
+            self.check(table, routes, ips)
+            table.compile()
+            self.check(table, routes, ips)
+
+    def test_no_route(self):
+        table = self.build([IPv4Network("10.0.0.0/8")])
+        table.compile()
+        self.assertIsNone(table.search(IPv4Address("11.0.0.1")))
+        self.assertEqual(table.search_batch([IPv4Address("11.0.0.1")] * 2), [None, None])
+
+    def test_first_route_wins(self):
+        table = self.build([IPv4Network("10.0.0.0/8"), IPv4Network("10.0.0.0/8")])
+        self.assertEqual(table.size, 1)
+        self.assertEqual(table.search(IPv4Address("10.1.2.3")).intf, "eth0")
+
+    def test_remove(self):
+        routes = [IPv4Network("10.0.0.0/8"), IPv4Network("10.1.0.0/16"),
+                  IPv4Network("10.1.2.0/24")]
+        table = self.build(routes)
+        table.compile()
+        ip = IPv4Address("10.1.2.3")
+        self.assertEqual(table.search(ip).ip, routes[2])
+        self.assertEqual(table.remove(routes[2]).ip, routes[2])
+        self.assertEqual(table.search(ip).ip, routes[1])
+        self.assertIsNone(table.remove(IPv4Network("192.168.0.0/16")))
+        self.assertEqual(table.size, 2)
+        self.assertEqual(sorted(item.ip for item in table.table), routes[:2])
+
+
+if __name__ == '__main__':
+    unittest.main()
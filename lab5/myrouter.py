@@ -10,9 +10,15 @@ from switchyard.lib.userlib import *
 from switchyard.lib.packet.common import *
 from collections import *
 from ipaddress import *
+from array import array
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 ForwardItem = namedtuple('ForwardItem', ['ip', 'next_hop', 'intf'])
 ARPSendInfo = namedtuple('ARPSendInfo', ['send_time', 'remain_times', 'wait_packs', 'intf'])
+ANY_IP = IPv4Address('0.0.0.0')
 
 class Node:
     def __init__(self, key, value):
@@ -68,37 +74,211 @@ class DictQueue:
             return None
         return self.map[key].value
 
-class ForwardTable:
+class LRUCache:
+    def __init__(self, cap):
+        self.cap = cap
+        self.size = 0
+        self.node = Node(None, None)
+        self.map = {}
+        self.hits = self.misses = 0
+
+    def remove_lru(self):
+        assert self.size > 0
+        node = self.node.prev
+        node.remove()
+        self.map.pop(node.key)
+        self.size -= 1
+
+    def flush_mru(self, key):
+        p = self.map[key]
+        p.remove()
+        self.node.add_next(p)
+
+    def put(self, key, value):
+        if key in self.map:
+            self.map[key].value = value
+        else:
+            if self.size == self.cap:
+                self.remove_lru()
+            self.node.add_next(Node(key, value))
+            self.map[key] = self.node.next
+            self.size += 1
+
+    def get(self, key):
+        if key in self.map:
+            self.hits += 1
+            self.flush_mru(key)
+            return self.map[key].value
+        self.misses += 1
+        return None
+
+    def clear(self):
+        self.node.prev = self.node.next = self.node
+        self.map.clear()
+        self.size = 0
+
+class TrieNode:
+    __slots__ = ('child', 'item')
+
     def __init__(self):
-        self.table = []
-    
+        self.child = [None, None]
+        self.item = None
+
+class ForwardTable:
+    def __init__(self, cache_size=1024):
+        self.root = TrieNode()
+        self.size = 0
+        self.compiled = None
+        self.top = None
+        self.cache = LRUCache(cache_size)
+
     def add(self, ip, next_hop, intf):
-        self.table.append(ForwardItem(ip, next_hop, intf))
-    
+        addr, node = int(ip.network_address), self.root
+        for i in range(31, 31 - ip.prefixlen, -1):
+            bit = addr >> i & 1
+            if node.child[bit] is None:
+                node.child[bit] = TrieNode()
+            node = node.child[bit]
+        # the first route added for a prefix wins, as with the old linear table
+        if node.item is None:
+            node.item = ForwardItem(ip, next_hop, intf)
+            self.size += 1
+            self.compiled = self.top = None
+            self.cache.clear()
+
+    def remove(self, ip):
+        addr, node, path = int(ip.network_address), self.root, []
+        for i in range(31, 31 - ip.prefixlen, -1):
+            bit = addr >> i & 1
+            path.append((node, bit))
+            node = node.child[bit]
+            if node is None:
+                return None
+        item, node.item = node.item, None
+        if item is not None:
+            self.size -= 1
+            self.compiled = self.top = None
+            self.cache.clear()
+        while path and node.item is None and node.child[0] is None and node.child[1] is None:
+            node, bit = path.pop()
+            node.child[bit] = None
+        return item
+
     def search(self, ip):
-        return max(filter(lambda item: ip in item.ip, self.table), key=lambda item: item.ip.prefixlen, default=None)
+        item = self.cache.get(ip)
+        if item is None:
+            item = self.lookup(ip)
+            if item is not None:
+                self.cache.put(ip, item)
+        return item
+
+    def lookup(self, ip):
+        addr, node, start = int(ip), self.root, 31
+        best = node.item
+        if self.top is not None:
+            # one index replaces the walk through the first 16 levels
+            best, node = self.top[addr >> 16]
+            if node is None:
+                return best
+            start = 15
+        for i in range(start, -1, -1):
+            node = node.child[addr >> i & 1]
+            if node is None:
+                break
+            if node.item is not None:
+                best = node.item
+        return best
+
+    def search_batch(self, ips):
+        if np is None or self.compiled is None or len(ips) < 2:
+            return [self.search(ip) for ip in ips]
+        # answer from the route cache first, and probe the arrays for the rest
+        found = [self.cache.get(ip) for ip in ips]
+        pending = np.array([i for i, item in enumerate(found) if item is None], dtype=np.intp)
+        if len(pending) == 0:
+            return found
+        addrs = np.fromiter((int(ips[i]) for i in pending.tolist()), dtype=np.uint32, count=len(pending))
+        rows = np.arange(len(pending))
+        for mask, nets, items in self.compiled:
+            keys = addrs[rows] & np.uint32(mask)
+            nets = np.frombuffer(nets, dtype=np.uint32)
+            pos = np.minimum(np.searchsorted(nets, keys), len(nets) - 1)
+            hit = nets[pos] == keys
+            for i, p in zip(pending[rows[hit]].tolist(), pos[hit].tolist()):
+                found[i] = items[p]
+                self.cache.put(ips[i], items[p])
+            rows = rows[~hit]
+            if len(rows) == 0:
+                break
+        return found
+
+    def compile(self):
+        # index the trie by the first 16 bits of an address: a slot holds the
+        # longest match of at most 16 bits, and the node at depth 16 if longer
+        # prefixes hang below it, so a lookup walks at most 16 levels
+        self.top = [None] * (1 << 16)
+        stack = [(self.root, 0, 0, None)]
+        while stack:
+            node, depth, prefix, best = stack.pop()
+            if node is not None and node.item is not None:
+                best = node.item
+            leaf = node is None or node.child == [None, None]
+            if depth == 16 or leaf:
+                span = 1 << (16 - depth)
+                self.top[prefix * span:(prefix + 1) * span] = [(best, None if leaf else node)] * span
+                continue
+            stack.append((node.child[0], depth + 1, prefix << 1, best))
+            stack.append((node.child[1], depth + 1, prefix << 1 | 1, best))
+        # for search_batch, also flatten the routes into one sorted integer
+        # array per prefix length, longest first, to probe with NumPy
+        routes = defaultdict(list)
+        for item in self.table:
+            routes[item.ip.prefixlen].append((int(item.ip.network_address), item))
+        self.compiled = []
+        for prefixlen in sorted(routes, reverse=True):
+            entries = sorted(routes[prefixlen], key=lambda entry: entry[0])
+            mask = 0xffffffff << (32 - prefixlen) & 0xffffffff
+            self.compiled.append((mask, array('I', (net for net, _ in entries)), [item for _, item in entries]))
+
+    @property
+    def table(self):
+        items, stack = [], [self.root]
+        while stack:
+            node = stack.pop()
+            if node.item is not None:
+                items.append(node.item)
+            stack.extend(child for child in reversed(node.child) if child is not None)
+        return items
 
 class Router(object):
-    def __init__(self, net: switchyard.llnetbase.LLNetBase):
+    def __init__(self, net: switchyard.llnetbase.LLNetBase, batch_size=1):
         self.net = net
+        self.batch_size = batch_size
         self.arp_table = {}
         self.forward_table = ForwardTable()
         self.arp_send = DictQueue()
+        self.update_interfaces()
         self.build_forward_table()
 
     def build_forward_table(self):
         for intf in self.net.interfaces():
             ipintf = intf.ipinterface.network
-            self.forward_table.add(ipintf, IPv4Address('0.0.0.0'), intf)
+            self.forward_table.add(ipintf, ANY_IP, intf)
         fp = open('forwarding_table.txt', 'r')
         for line in fp:
             ip, mask, next_hop, intf = line.split()
             self.forward_table.add(IPv4Network(f'{ip}/{mask}'), IPv4Address(next_hop), self.net.port_by_name(intf))
         fp.close()
+        self.forward_table.compile()
         log_info(f"forward table: {self.forward_table.table}")
 
+    def update_interfaces(self):
+        # call again whenever interfaces are added, removed or readdressed
+        self.intf_by_ip = {intf.ipaddr: intf for intf in self.net.interfaces()}
+        self.router_ips = frozenset(self.intf_by_ip)
+
     def is_ip_in_router(self, ip):
-        return ip in [intf.ipaddr for intf in self.net.interfaces()]
+        return ip in self.router_ips
 
     def handle_arp(self, arp, iface):
         if self.arp_table.get(arp.senderprotoaddr) != arp.senderhwaddr:
@@ -106,7 +286,7 @@ class Router(object):
             log_info(f'Update ARP Table: {self.arp_table}')
         if self.is_ip_in_router(arp.targetprotoaddr):
             if arp.operation == ArpOperation.Request:
-                intf = self.net.interface_by_ipaddr(arp.targetprotoaddr)
+                intf = self.intf_by_ip[arp.targetprotoaddr]
                 pkt = create_ip_arp_reply(intf.ethaddr, arp.senderhwaddr, intf.ipaddr, arp.senderprotoaddr)
                 log_info(f"get request, reply arp {pkt} to {iface}")
                 self.net.send_packet(iface, pkt)
@@ -127,7 +307,7 @@ class Router(object):
         icmp.icmpdata.data = origpkt.to_bytes()[:28]
         ip = IPv4()
         ip.dst = origpkt[IPv4].src
-        ip.src = IPv4Address('0.0.0.0')
+        ip.src = ANY_IP
         ip.protocol = IPProtocol.ICMP
         ip.ttl = 65
         eth = Ethernet()
@@ -137,30 +317,39 @@ class Router(object):
 
     def send_ip(self, packet):
         forward =  self.forward_table.search(packet[IPv4].dst)
+        next_hop_ip = self.prepare_forward(packet, forward)
+        if next_hop_ip is not None:
+            self.send_to_next_hop(forward.intf, next_hop_ip, [packet])
+
+    def prepare_forward(self, packet, forward):
         if forward is not None:
             log_info(f"forward table hit {forward}")
             packet[IPv4].ttl -= 1
             if packet[IPv4].ttl == 0:
                 self.send_ip(self.make_icmp_error(packet, ICMPType.TimeExceeded))
             else:
-                next_hop_ip = packet[IPv4].dst if forward.next_hop == IPv4Address('0.0.0.0') else forward.next_hop
-                next_hop = self.arp_table.get(next_hop_ip)
                 packet[Ethernet].src = forward.intf.ethaddr
-                if packet[IPv4].src == IPv4Address('0.0.0.0'):
+                if packet[IPv4].src == ANY_IP:
                     packet[IPv4].src = forward.intf.ipaddr
-                if next_hop is not None:
-                    packet[Ethernet].dst = next_hop
-                    log_info(f"arp cache hit: {next_hop}, send ip {packet} to {forward.intf}")
-                    self.net.send_packet(forward.intf, packet)
-                else:
-                    log_info(f"arp cache miss, pend ip {packet}")
-                    wait_packs = self.arp_send.get(next_hop_ip)
-                    if wait_packs is None:
-                        self.arp_send.push(next_hop_ip, ARPSendInfo(0, 5, [packet], forward.intf))
-                    else:
-                        wait_packs.wait_packs.append(packet)
+                return packet[IPv4].dst if forward.next_hop == ANY_IP else forward.next_hop
         else:
             self.send_ip(self.make_icmp_error(packet, ICMPType.DestinationUnreachable, 0))
+        return None
+
+    def send_to_next_hop(self, intf, next_hop_ip, packets):
+        next_hop = self.arp_table.get(next_hop_ip)
+        if next_hop is not None:
+            for packet in packets:
+                packet[Ethernet].dst = next_hop
+                log_info(f"arp cache hit: {next_hop}, send ip {packet} to {intf}")
+                self.net.send_packet(intf, packet)
+        else:
+            log_info(f"arp cache miss, pend ip {packets}")
+            wait_packs = self.arp_send.get(next_hop_ip)
+            if wait_packs is None:
+                self.arp_send.push(next_hop_ip, ARPSendInfo(0, 5, packets, intf))
+            else:
+                wait_packs.wait_packs.extend(packets)
 
     def handle_ip(self, packet):
         if self.is_ip_in_router(packet[IPv4].dst):
@@ -196,6 +385,37 @@ class Router(object):
                 log_info(f"receive a ip packet {ifaceName} {ip}")
                 self.handle_ip(packet)
 
+    def handle_batch(self, recvs):
+        # ARP and packets for the router itself go through the usual path,
+        # transit packets are looked up together and sent per (interface, next hop)
+        transit = []
+        for recv in recvs:
+            _, ifaceName, packet = recv
+            ip = packet.get_header(IPv4)
+            if packet.get_header(Arp) is None and ip is not None and not self.is_ip_in_router(ip.dst):
+                log_info(f"receive a ip packet {ifaceName} {ip}")
+                transit.append(packet)
+            else:
+                self.handle_packet(recv)
+        forwards = self.forward_table.search_batch([packet[IPv4].dst for packet in transit])
+        groups = defaultdict(list)
+        for packet, forward in zip(transit, forwards):
+            next_hop_ip = self.prepare_forward(packet, forward)
+            if next_hop_ip is not None:
+                groups[forward.intf, next_hop_ip].append(packet)
+        for (intf, next_hop_ip), packets in groups.items():
+            self.send_to_next_hop(intf, next_hop_ip, packets)
+
+    def recv_batch(self):
+        recvs = []
+        try:
+            recvs.append(self.net.recv_packet(timeout=1.0))
+            while len(recvs) < self.batch_size:
+                recvs.append(self.net.recv_packet(timeout=0))
+        except NoPackets:
+            pass
+        return recvs
+
     def resend_arp(self):
         while self.arp_send.peek() and time.time() - self.arp_send.peek().value.send_time >= 1:
             node = self.arp_send.pop()
@@ -216,6 +436,14 @@ class Router(object):
         while True:
             self.resend_arp()
 
+            if self.batch_size > 1:
+                try:
+                    recvs = self.recv_batch()
+                except Shutdown:
+                    break
+                self.handle_batch(recvs)
+                continue
+
             try:
                 recv = self.net.recv_packet(timeout=1.0)
             except NoPackets:
@@ -228,13 +456,16 @@ class Router(object):
         self.stop()
 
     def stop(self):
+        cache = self.forward_table.cache
+        log_info(f"route cache: {cache.size}/{cache.cap} entries, {cache.hits} hits, {cache.misses} misses")
         self.net.shutdown()
 
-def main(net):
+def main(net, **kwargs):
     '''
     Main entry point for router.  Just create Router
     object and get it going.
+    Pass `-g batch=N` to swyard to receive and forward up to N packets at once.
     '''
     type(net.interfaces()[0]).__repr__ = lambda self: self.name
-    router = Router(net)
+    router = Router(net, int(kwargs.get('batch', 1)))
     router.start()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+'''Testcases for the longest-prefix match of ForwardTable
+
+Run from lab5/:
+    $ python3 -m unittest testcases.test_forwardTable
+'''
+
+import random
+import unittest
+from ipaddress import IPv4Address, IPv4Network
+from myrouter import ForwardTable, ANY_IP
+
+
+def randomTable(rand, count):
+    ''' Return `count` random routes, with /0 and /32 among them '''
+    routes = [IPv4Network("0.0.0.0/0"), IPv4Network((rand.getrandbits(32), 32))]
+    for _ in range(count):
+        prefixlen = rand.randrange(0, 33)
+        routes.append(IPv4Network((rand.getrandbits(32) >> (32 - prefixlen)
+                                   << (32 - prefixlen) if prefixlen else 0, prefixlen)))
+    return routes
+
+
+def longestMatch(routes, ip):
+    ''' Brute force over all routes; the first route of a prefix wins '''
+    best = None
+    for net in routes:
+        if ip in net and (best is None or net.prefixlen > best.prefixlen):
+            best = net
+    return best
+
+
+class TestForwardTable(unittest.TestCase):
+    def build(self, routes):
+        table = ForwardTable()
+        for i, net in enumerate(routes):
+            table.add(net, ANY_IP, f"eth{i}")
+        return table
+
+    def check(self, table, routes, ips):
+        first = {}
+        for i, net in enumerate(routes):
+            first.setdefault(net, f"eth{i}")
+        expected = [longestMatch(first, ip) for ip in ips]
+        expected = [None if net is None else (net, first[net]) for net in expected]
+        found = [None if item is None else (item.ip, item.intf) for item in
+                 (table.search(ip) for ip in ips)]
+        self.assertEqual(found, expected)
+        found = [None if item is None else (item.ip, item.intf)
+                 for item in table.search_batch(ips)]
+        self.assertEqual(found, expected)
+
+    def test_random(self):
+        rand = random.Random(2)
+        for count in (0, 5, 50, 500):
+            routes = randomTable(rand, count)
+            table = self.build(routes)
+            ips = [IPv4Address(rand.getrandbits(32)) for _ in range(300)]
+            ips += [net.network_address for net in routes]
+            ips += [net.broadcast_address for net in routes]
+            self.check(table, routes, ips)
+            table.compile()
+            table.cache.clear()  # else the route cache answers for the compiled table
+            self.check(table, routes, ips)
+
+    def test_no_route(self):
+        table = self.build([IPv4Network("10.0.0.0/8")])
+        table.compile()
+        self.assertIsNone(table.search(IPv4Address("11.0.0.1")))
+        self.assertEqual(table.search_batch([IPv4Address("11.0.0.1")] * 2), [None, None])
+
+    def test_first_route_wins(self):
+        table = self.build([IPv4Network("10.0.0.0/8"), IPv4Network("10.0.0.0/8")])
+        self.assertEqual(table.size, 1)
+        self.assertEqual(table.search(IPv4Address("10.1.2.3")).intf, "eth0")
+
+    def test_remove(self):
+        routes = [IPv4Network("10.0.0.0/8"), IPv4Network("10.1.0.0/16"),
+                  IPv4Network("10.1.2.0/24")]
+        table = self.build(routes)
+        table.compile()
+        ip = IPv4Address("10.1.2.3")
+        self.assertEqual(table.search(ip).ip, routes[2])
+        self.assertEqual(table.remove(routes[2]).ip, routes[2])
+        self.assertEqual(table.search(ip).ip, routes[1])
+        self.assertIsNone(table.remove(IPv4Network("192.168.0.0/16")))
+        self.assertEqual(table.size, 2)
+        self.assertEqual(sorted(item.ip for item in table.table), routes[:2])
+
+
+class TestRouteCache(unittest.TestCase):
+    def setUp(self):
+        self.routes = [IPv4Network("10.0.0.0/8"), IPv4Network("10.1.0.0/16")]
+        self.table = ForwardTable(cache_size=2)
+        for i, net in enumerate(self.routes):
+            self.table.add(net, ANY_IP, f"eth{i}")
+
+    def counters(self):
+        return self.table.cache.hits, self.table.cache.misses
+
+    def test_counters(self):
+        ip = IPv4Address("10.1.2.3")
+        self.assertEqual(self.table.search(ip).ip, self.routes[1])
+        self.assertEqual(self.counters(), (0, 1))
+        self.assertEqual(self.table.search(ip).ip, self.routes[1])
+        self.assertEqual(self.counters(), (1, 1))
+        # no route is not cached
+        self.assertIsNone(self.table.search(IPv4Address("11.0.0.1")))
+        self.assertIsNone(self.table.search(IPv4Address("11.0.0.1")))
+        self.assertEqual(self.counters(), (1, 3))
+
+    def test_batch(self):
+        self.table.compile()
+        ips = [IPv4Address("10.1.2.3"), IPv4Address("10.2.0.1"), IPv4Address("10.1.2.3")]
+        found = [item.ip for item in self.table.search_batch(ips)]
+        self.assertEqual(found, [self.routes[1], self.routes[0], self.routes[1]])
+        hits, misses = self.counters()
+        self.assertEqual(hits + misses, len(ips))
+        found = [item.ip for item in self.table.search_batch(ips[:2])]
+        self.assertEqual(found, [self.routes[1], self.routes[0]])
+        self.assertEqual(self.counters(), (hits + 2, misses))
+
+    def test_eviction(self):
+        a, b, c = (IPv4Address(f"10.{i}.0.1") for i in range(3))
+        for ip in (a, b, a, c):  # c takes the place of b, used least recently
+            self.table.search(ip)
+        self.assertEqual(self.table.cache.size, 2)
+        hits, misses = self.counters()
+        self.table.search(a)
+        self.table.search(b)
+        self.assertEqual(self.counters(), (hits + 1, misses + 1))
+
+    def test_invalidation(self):
+        ip = IPv4Address("10.1.2.3")
+        self.assertEqual(self.table.search(ip).ip, self.routes[1])
+        longer = IPv4Network("10.1.2.0/24")
+        self.table.add(longer, ANY_IP, "eth2")
+        self.assertEqual(self.table.cache.size, 0)
+        self.assertEqual(self.table.search(ip).ip, longer)
+        self.table.remove(longer)
+        self.assertEqual(self.table.cache.size, 0)
+        self.assertEqual(self.table.search(ip).ip, self.routes[1])
+        self.table.remove(self.routes[1])
+        self.assertEqual(self.table.search(ip).ip, self.routes[0])
+
+    def test_unchanged(self):
+        # adding a prefix already routed and removing a missing one keep the cache
+        ip = IPv4Address("10.1.2.3")
+        self.table.search(ip)
+        self.table.add(self.routes[0], ANY_IP, "eth9")
+        self.table.remove(IPv4Network("192.168.0.0/16"))
+        self.assertEqual(self.table.cache.size, 1)
+        self.assertEqual(self.table.search(ip).intf, "eth1")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+'''Benchmark the body data path of the caching server
+
+Start a main server serving a generated file and a caching server in this
+process, then fetch the file through the caching server and report the MB/s
+and the peak bytes allocated per request, for misses, memory hits and, with
+--cache-dir, disk hits.
+
+Usage:
+    $ ./benchCache.py [-s SIZE] [-n COUNT] [--chunk-size CHUNK] [--cache-dir DIR]
+Example:
+    $ ./benchCache.py -s 16777216 --chunk-size 262144 --cache-dir /tmp/cdn
+'''
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from functools import partial
+from http.client import HTTPConnection
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from cachingServer.cachingServer import ThreadingCachingServer, \
+    CachingServerHttpHandler, BUFFER_SIZE
+
+
+def parse_args(argv):
+    ''' Parse arguments of the program '''
+    parser = argparse.ArgumentParser(description="Benchmark the caching server")
+    parser.add_argument("--size", "-s", default=8 * 1024 * 1024, type=int,
+                        help="bytes of the file to fetch (default: 8 MB)")
+    parser.add_argument("--count", "-n", default=20, type=int,
+                        help="number of requests of each kind (default: 20)")
+    parser.add_argument("--chunk-size", default=BUFFER_SIZE, type=int,
+                        help=f"chunk size of the caching server (default: {BUFFER_SIZE})")
+    parser.add_argument("--cache-dir", type=str,
+                        help="directory of the disk cache, to bench disk hits too")
+    return parser.parse_args(argv)
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, fmt, *args):
+        pass
+
+
+class QuietCachingHandler(CachingServerHttpHandler):
+    def log_message(self, fmt, *args):
+        pass
+
+
+def serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def fetch(port, path, buf):
+    ''' GET `path` into `buf` and return the bytes received '''
+    conn = HTTPConnection("localhost", port)
+    conn.request("GET", path)
+    res = conn.getresponse()
+    total = 0
+    while True:
+        sz = res.readinto(buf)
+        if sz == 0:
+            break
+        total += sz
+    conn.close()
+    return total
+
+
+def measure(port, paths, tracedPaths, buf):
+    ''' Return MB/s of fetching `paths` and the peak bytes allocated per
+    request while fetching `tracedPaths` under tracemalloc.
+    '''
+    tick = time.perf_counter()
+    total = sum(fetch(port, path, buf) for path in paths)
+    rate = total / (time.perf_counter() - tick) / 1024 / 1024
+    peaks = []
+    tracemalloc.start()
+    for path in tracedPaths:
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        fetch(port, path, buf)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+    return rate, max(peaks)
+
+
+def main(argv):
+    args = parse_args(argv)
+    root = tempfile.mkdtemp()
+    with open(os.path.join(root, "bench.bin"), "wb") as f:
+        f.write(os.urandom(args.size))
+    origin = serve(ThreadingHTTPServer(("localhost", 0),
+                                       partial(QuietHandler, directory=root)))
+    mainServer = f"localhost:{origin.server_address[1]}"
+    capacity = 0 if args.cache_dir else args.size * 2  # disk hits need a cold memory
+    cache = ThreadingCachingServer(("localhost", 0), QuietCachingHandler, mainServer,
+                                   cacheCapacity=capacity, cacheDir=args.cache_dir,
+                                   chunkSize=args.chunk_size)
+    cache.log_info = lambda msg: None
+    serve(cache)
+    port = cache.server_address[1]
+    buf = memoryview(bytearray(1024 * 1024))
+
+    # query strings are ignored by the main server but make distinct keys
+    misses = [f"/bench.bin?miss={i}" for i in range(args.count + 5)]
+    kinds = [("miss", misses[:args.count], misses[args.count:])]
+    fetch(port, "/bench.bin", buf)
+    hit = "disk hit" if args.cache_dir else "hit"
+    kinds.append((hit, ["/bench.bin"] * args.count, ["/bench.bin"] * 5))
+    print(f"{args.size} bytes, chunk size {args.chunk_size}")
+    for name, paths, tracedPaths in kinds:
+        rate, peak = measure(port, paths, tracedPaths, buf)
+        print(f"{name:>8}: {rate:8.1f} MB/s, {peak / 1024:8.1f} KB peak allocated per request")
+    cache.shutdown()
+    cache.server_close()
+    origin.shutdown()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+'''Benchmark the DNS request pipeline
+
+Without a server address, compare the old pipeline (format check, request
+decoding and response decoding each parse the packet again) with the
+single-parse one in the current process.
+With a server address, send queries to a running DNS server and report the
+queries per second it answers.
+
+Usage:
+    $ ./benchDNS.py [-n COUNT]
+    $ ./benchDNS.py --server localhost:9999 [-n COUNT] [domain]
+'''
+
+import sys
+import time
+import socket
+import argparse
+from dnslib import DNSRecord
+from utils.dns_utils import DNS_Request, DNS_Response
+
+
+def parse_args(argv):
+    ''' Parse arguments of the program '''
+    parser = argparse.ArgumentParser(description="Benchmark DNS request handling")
+    parser.add_argument("domain", default="home.nasa.org.", type=str, nargs='?',
+                        help="domain name to query (default: home.nasa.org.)")
+    parser.add_argument("--count", "-n", default=20000, type=int,
+                        help="number of queries (default: 20000)")
+    parser.add_argument("--server", "-s", type=str,
+                        help="address of a running DNS server, e.g. localhost:9999")
+    return parser.parse_args(argv)
+
+
+def old_pipeline(raw_data):
+    DNS_Request.check_valid_format(raw_data)
+    dns_request = DNS_Request(raw_data)
+    dns_response = dns_request.generate_response(("A", "10.0.0.1"))
+    return DNS_Response(dns_response.raw_data)
+
+
+def new_pipeline(raw_data):
+    dns_request = DNS_Request.parse(raw_data)
+    return dns_request.generate_response(("A", "10.0.0.1"))
+
+
+def measure(func, count):
+    tick = time.perf_counter()
+    func(count)
+    return count / (time.perf_counter() - tick)
+
+
+def bench_local(domain, count):
+    raw_data = DNSRecord.question(domain).pack()
+    for name, pipeline in (("before", old_pipeline), ("after", new_pipeline)):
+        def run(count):
+            for _ in range(count):
+                pipeline(raw_data)
+        print(f"{name:>6}: {measure(run, count):10.0f} queries/s")
+
+
+def bench_server(domain, count, server):
+    addr, port = server.split(":")
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(10)
+        sock.connect((addr, int(port)))
+        raw_data = DNSRecord.question(domain).pack()
+
+        def run(count):
+            for _ in range(count):
+                sock.send(raw_data)
+                sock.recv(1024)
+        print(f"{server}: {measure(run, count):10.0f} queries/s")
+
+
+def main(argv):
+    args = parse_args(argv)
+    if args.server is None:
+        bench_local(args.domain, args.count)
+    else:
+        bench_server(args.domain, args.count, args.server)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
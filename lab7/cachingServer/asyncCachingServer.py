@@ -0,0 +1,707 @@
+''' Asyncio engine of the Caching Server
+
+AsyncCachingServer is a CachingServer whose listening socket is served by an
+asyncio event loop instead of socketserver. Client connections and fetches
+from main server are coroutines on one thread, so thousands of them can be
+in flight at a time. The CacheTable, header filtering and logging are the
+ones of CachingServer.
+
+AsyncCachingHandler plays the role of CachingServerHttpHandler on asyncio
+streams. It keeps HTTP/1.1 connections alive and frames responses the same
+way. Byte ranges are served from complete items only; a range of an item
+still being fetched gets the whole body.
+
+Concurrent misses on the same path share one fetch like in CachingServer,
+but wait for it on asyncio events, since the waits of CacheTable would
+block the loop. Connections to main server and to peers are kept alive and
+reused by OriginPool, the ConnectionPool of asyncio streams.
+'''
+
+import sys
+import time
+import asyncio
+import threading
+import email.parser
+from datetime import datetime
+from email.utils import formatdate
+from http import HTTPStatus
+from http.client import HTTPMessage
+from http.server import BaseHTTPRequestHandler
+from typing import Optional
+
+from .cacheTable import HTTPCacheItem, validators, storable
+from .cachingServer import CachingServer, FileSlice, PEER_HEADER, KEEPALIVE_TIMEOUT, \
+    ORIGIN_IDLE_TIMEOUT, __version__, \
+    _mergeHeaders, _parseRange, _resolveRange, _bodyLength, _sliceBody, _closeBody
+from utils.tracer import trace
+
+
+__all__ = ["AsyncCachingServer", "AsyncCachingHandler"]
+
+MAX_HEADERS = 100  # same limit as http.client
+
+
+async def _readHeaders(reader: asyncio.StreamReader) -> HTTPMessage:
+    ''' Read header lines up to the empty line and parse them '''
+    lines = []
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        lines.append(line)
+        if len(lines) > MAX_HEADERS:
+            raise ValueError(f"got more than {MAX_HEADERS} headers")
+    text = b"".join(lines).decode("iso-8859-1")
+    return email.parser.Parser(_class=HTTPMessage).parsestr(text)
+
+
+async def _get(reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+               address: str, path: str, headers: dict) -> "OriginResponse":
+    ''' GET `path` from the server at `address` on the connection of
+    `reader` and `writer`, and return the response once its head is read.
+    '''
+    lines = [f"GET {path} HTTP/1.1", f"Host: {address}"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("iso-8859-1"))
+    statusLine = (await reader.readline()).decode("iso-8859-1").split(None, 2)
+    status = int(statusLine[1])
+    return OriginResponse(status, await _readHeaders(reader), reader, writer,
+                          statusLine[0])
+
+
+class OriginPool:
+    ''' Same as ConnectionPool, for asyncio streams. Only used on the loop.
+
+    Example:
+        >>> pool = OriginPool("localhost:8000")
+        >>> res = await pool.request("/index.html")
+        >>> body = await res.read(size)  # until it is b""
+        >>> res.close()  # gives the connection back
+    '''
+    def __init__(self, address: str, maxIdle: int = 8, idleTimeout: float = 30):
+        self.address = address
+        self.maxIdle = maxIdle
+        self.idleTimeout = idleTimeout
+        self.idle = []  # stack of (reader, writer, time it became idle)
+        self.connects = 0
+        self.reuses = 0
+
+    def _healthy(self, reader, writer, since: float) -> bool:
+        ''' Check that an idle connection is still usable '''
+        return not writer.is_closing() and not reader.at_eof() and \
+            time.monotonic() - since <= self.idleTimeout
+
+    async def _connect(self):
+        host, sep, port = self.address.rpartition(":")
+        if not sep:
+            host, port = self.address, 80
+        self.connects += 1
+        return await asyncio.open_connection(host, int(port))
+
+    async def request(self, path: str, headers: dict = None) -> "OriginResponse":
+        ''' Same as ConnectionPool.request() for a GET. Close the response
+        to give the connection back.
+        '''
+        while True:
+            fresh = True
+            while self.idle:
+                reader, writer, since = self.idle.pop()
+                if self._healthy(reader, writer, since):
+                    self.reuses += 1
+                    fresh = False
+                    break
+                writer.close()
+            if fresh:
+                reader, writer = await self._connect()
+            try:
+                response = await _get(reader, writer, self.address, path, headers or {})
+            except (ConnectionError, IndexError, ValueError, asyncio.IncompleteReadError):
+                writer.close()
+                if fresh:
+                    raise
+                continue  # closed by the server while idle
+            except BaseException:
+                writer.close()
+                raise
+            response.pool = self
+            return response
+
+    def release(self, response: "OriginResponse"):
+        ''' Take back the connection of `response`. It is kept if the body
+        has been read to the end and the server keeps it open.
+        '''
+        if response.done and not response.willClose and not response.writer.is_closing() \
+                and len(self.idle) < self.maxIdle:
+            self.idle.append((response.reader, response.writer, time.monotonic()))
+        else:
+            response.writer.close()
+
+    def stats(self) -> dict:
+        return {"idle": len(self.idle), "connects": self.connects, "reuses": self.reuses}
+
+    def close(self):
+        ''' Close the idle connections '''
+        idle, self.idle = self.idle, []
+        for _, writer, _ in idle:
+            writer.close()
+
+
+class Flight:
+    ''' A fetch of an item others can wait for on the event loop '''
+    def __init__(self, item: HTTPCacheItem, revalidating: bool = False):
+        self.item = item
+        self.revalidating = revalidating  # True while a conditional request is sent
+        self.changed = asyncio.Event()
+
+    def notify(self):
+        ''' Wake up all waiters, the item has changed '''
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    async def wait(self):
+        changed = self.changed
+        await changed.wait()
+
+    async def waitHeaders(self):
+        ''' Same as CacheTable.waitHeaders() '''
+        item = self.item
+        while item.headers is None and not item.complete:
+            await self.wait()
+        return None if item.failed else item.headers
+
+    def readBody(self, size: int):
+        ''' Same as CacheTable.readBody(), as an async iterator '''
+        return self._readBody(self.item.body, size)
+
+    async def _readBody(self, body: bytearray, size: int):
+        item = self.item
+        offset = 0
+        while True:
+            while offset >= len(body) and not item.complete:
+                await self.wait()
+            if offset >= len(body):
+                if item.failed:
+                    raise ConnectionAbortedError("filling the body was aborted")
+                return
+            chunk = body[offset:offset + size]
+            offset += len(chunk)
+            yield chunk
+
+
+class OriginResponse:
+    ''' A response of main server read from asyncio streams '''
+    def __init__(self, status: int, headers: HTTPMessage,
+                 reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 version: str = "HTTP/1.1"):
+        self.status = status
+        self.headers = list(headers.items())
+        self.reader = reader
+        self.writer = writer
+        self.chunked = "chunked" in headers.get("Transfer-Encoding", "").lower()
+        length = headers.get("Content-Length")
+        self.length = int(length) if length and length.isdigit() and not self.chunked else None
+        self.chunkLeft = 0
+        self.done = status in (HTTPStatus.NO_CONTENT, HTTPStatus.NOT_MODIFIED)
+        connection = headers.get("Connection", "").lower()
+        # if the server closes the connection after the response
+        self.willClose = "close" in connection or \
+            (version != "HTTP/1.1" and "keep-alive" not in connection) or \
+            (self.length is None and not self.chunked and not self.done)
+        self.peer = None  # the peer it comes from, None for main server
+        self.pool = None  # the OriginPool to give the connection back to
+        self.closed = False
+
+    async def read(self, size: int) -> bytes:
+        ''' Read up to `size` bytes of the body, b"" at its end '''
+        if self.done:
+            return b""
+        if self.chunked:
+            return await self._readChunked(size)
+        if self.length is None:
+            data = await self.reader.read(size)  # the body ends with the connection
+            self.done = not data
+            return data
+        if self.length == 0:
+            self.done = True
+            return b""
+        data = await self.reader.read(min(size, self.length))
+        if not data:
+            raise ConnectionAbortedError("main server closed the connection early")
+        self.length -= len(data)
+        return data
+
+    async def _readChunked(self, size: int) -> bytes:
+        if self.chunkLeft == 0:
+            line = await self.reader.readline()
+            self.chunkLeft = int(line.split(b";")[0], 16)
+            if self.chunkLeft == 0:
+                await _readHeaders(self.reader)  # trailers
+                self.done = True
+                return b""
+        data = await self.reader.read(min(size, self.chunkLeft))
+        if not data:
+            raise ConnectionAbortedError("main server closed the connection early")
+        self.chunkLeft -= len(data)
+        if self.chunkLeft == 0:
+            await self.reader.readexactly(2)  # CRLF after the chunk
+        return data
+
+    def close(self):
+        ''' Give the connection back to its pool, or close it '''
+        if self.closed:
+            return
+        self.closed = True
+        if self.pool is not None:
+            self.pool.release(self)
+        else:
+            self.writer.close()
+
+
+class AsyncCachingServer(CachingServer):
+    ''' A caching server serving all clients on an asyncio event loop '''
+    keepAlive = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.flights = {}  # path -> Flight
+        self.loop = None
+        self.stopped = None
+        self.serving = threading.Event()  # set once the loop serves
+
+    def serve_forever(self, poll_interval=None):
+        ''' Serve until shutdown() is called '''
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        server = await asyncio.start_server(self.handleConnection, sock=self.socket)
+        self.serving.set()
+        async with server:
+            await self.stopped.wait()
+        for pool in self.connectionPools.values():
+            pool.close()
+
+    def connectionPool(self, address: str) -> OriginPool:
+        ''' Return the pool of connections to the server at `address` '''
+        if address not in self.connectionPools:
+            self.connectionPools[address] = OriginPool(
+                address, maxIdle=self.originMaxIdle, idleTimeout=ORIGIN_IDLE_TIMEOUT)
+        return self.connectionPools[address]
+
+    def shutdown(self):
+        ''' Stop serve_forever(). Can be called from any thread. '''
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.stopped.set)
+
+    async def handleConnection(self, reader, writer):
+        await self.RequestHandlerClass(reader, writer, self).handle()
+
+    def prefetchItem(self, path: str) -> Optional[int]:
+        ''' Same as CachingServer.prefetchItem(). Called from other threads,
+        it waits until the loop serves.
+        '''
+        self.serving.wait()
+        return asyncio.run_coroutine_threadsafe(self._prefetchItem(path), self.loop).result()
+
+    async def _prefetchItem(self, path: str) -> Optional[int]:
+        head, body = await self.touchItem(path, "gzip")
+        if not body:
+            return None
+        if isinstance(body, list):
+            _closeBody(body)
+            return 0
+        size = 0
+        async for chunk in body:
+            size += len(chunk)
+        return size
+
+    @trace
+    async def requestMainServer(self, path: str, conditions: dict = None) -> Optional[OriginResponse]:
+        ''' Same as CachingServer.requestMainServer(). Close the response to
+        give its connection back.
+        '''
+        try:
+            response = await self.connectionPool(self.mainServerAddress).request(path, conditions)
+        except ConnectionRefusedError:
+            self.log_error(f"Cannot connect to main server '{self.mainServerAddress}'")
+            return None
+        except (IndexError, ValueError, ConnectionError):
+            self.log_error(f"Bad response from main server '{self.mainServerAddress}'")
+            return None
+        status = response.status
+        if status == HTTPStatus.OK:
+            self.log_info(f"Fetched '{path}' from main server "
+                          f"'{self.mainServerAddress}'")
+            return response
+        response.close()
+        if status == HTTPStatus.NOT_MODIFIED and conditions:
+            self.log_info(f"Revalidated '{path}' with main server "
+                          f"'{self.mainServerAddress}'")
+            return response
+
+        # else: status isn't ok
+        self.log_error(f"File not found on main server '{self.mainServerAddress}'")
+        return None
+
+    async def requestUpstream(self, path: str, forwarded: bool = False) -> Optional[OriginResponse]:
+        ''' Same as CachingServer.requestUpstream() '''
+        if forwarded or self.owns(path):
+            return await self.requestMainServer(path)
+        peer = self.ring.owner(path)
+        try:
+            response = await self.connectionPool(peer).request(path, {PEER_HEADER: self.selfAddress})
+        except (OSError, IndexError, ValueError) as e:
+            self.log_warning(f"Cannot connect to peer '{peer}': {e}")
+            return await self.requestMainServer(path)
+        if response.status == HTTPStatus.OK:
+            response.peer = peer
+            self.log_info(f"Fetched '{path}' from peer '{peer}'")
+            return response
+        response.close()
+        if response.status == HTTPStatus.NOT_FOUND:
+            self.log_error(f"File not found on peer '{peer}'")
+            return None
+        self.log_warning(f"Peer '{peer}' answered {response.status} for '{path}'")
+        return await self.requestMainServer(path)
+
+    def _land(self, path: str, flight: Flight):
+        ''' End `flight` and wake up the ones waiting for it '''
+        flight.notify()
+        if self.flights.get(path) is flight:
+            del self.flights[path]
+
+    async def touchItem(self, path: str, acceptEncoding: Optional[str] = None,
+                        forwarded: bool = False):
+        ''' Same as CachingServer.touchItem(), but the body may be an async
+        iterator, which must be iterated to the end.
+        '''
+        while True:
+            flight = self.flights.get(path)
+            if flight is not None and flight.revalidating:
+                await flight.wait()
+                continue
+            stale, follow, reserved = None, None, None
+            with self.cacheTable.lock:
+                if path in self.cacheTable and not self.cacheTable.expired(path):
+                    item = self.cacheTable.getItem(path)
+                    if item.complete:
+                        return self.encodeItem(self.cacheTable.getHeaders(path), item,
+                                               acceptEncoding)
+                    follow = self.flights[path]
+                elif path in self.cacheTable:
+                    stale = self.cacheTable.getItem(path)
+                    self.cacheTable.startRevalidation(path)  # keeps the sweeper off
+                else:
+                    reserved = self.cacheTable.reserve(path)
+            break
+        if follow is not None:
+            if await follow.waitHeaders() is None:
+                return None, None
+            item = follow.item
+            with self.cacheTable.lock:
+                # the headers and body of one variant, see CachingServer.touchItem()
+                if item.complete and not item.failed:
+                    return self.encodeItem(item.headers, item, acceptEncoding)
+                return item.headers, follow.readBody(self.chunkSize)
+
+        if stale is not None:
+            flight = self.flights[path] = Flight(stale, revalidating=True)
+            try:
+                res = await self.requestMainServer(path, validators(stale.headers))
+            except BaseException:
+                if stale.file is not None:
+                    stale.file.close()
+                self.cacheTable.endRevalidation(path)
+                self._land(path, flight)
+                raise
+            if res is not None and res.status == HTTPStatus.NOT_MODIFIED:
+                head = _mergeHeaders(stale.headers, self._filterHeaders(res.headers))
+                self.cacheTable.refresh(path, stale, head)
+                self._land(path, flight)
+                return self.encodeItem(head, stale, acceptEncoding)
+            if stale.file is not None:
+                stale.file.close()
+            self._land(path, flight)
+            with self.cacheTable.lock:
+                self.cacheTable.endRevalidation(path)
+                reserved = self.cacheTable.reserve(path)
+            flight = self.flights[path] = Flight(reserved)
+        else:
+            flight = self.flights[path] = Flight(reserved)
+            try:
+                res = await self.requestUpstream(path, forwarded)
+            except BaseException:
+                self.cacheTable.finishBody(path, failed=True)
+                self._land(path, flight)
+                raise
+        if res is None:
+            self.cacheTable.finishBody(path, failed=True)
+            self._land(path, flight)
+            return None, None
+        head = self._filterHeaders(res.headers)
+        self.cacheTable.setHeaders(path, head)
+        flight.notify()
+        body = self.resReader(path, res, flight)
+        await body.__anext__()
+        return head, body
+
+    async def resReader(self, path: str, res: OriginResponse, flight: Flight):
+        ''' Yield the body of `res` while filling the cache with it.
+        It is started by touchItem(), so that closing it unread, or losing
+        it, still fills the cache and lands the flight.
+        '''
+        sending, complete = True, False
+        try:
+            try:
+                yield
+            except GeneratorExit:
+                sending = False
+            while True:
+                chunk = await res.read(self.chunkSize)
+                if not chunk:
+                    break
+                self.cacheTable.appendBody(path, chunk)
+                flight.notify()
+                if sending:
+                    try:
+                        yield chunk
+                    except GeneratorExit:
+                        sending = False  # keep filling the cache for the others
+            complete = True
+        finally:
+            res.close()
+            self.cacheTable.finishBody(path, failed=not complete, pack=False)
+            self._land(path, flight)
+            if complete and (res.peer is not None or not storable(flight.item.headers)):
+                # the peer keeps it, and no one may keep a no-store response
+                self.cacheTable.discard(path, flight.item)
+            elif complete:
+                # compressing or writing a large body would block the loop
+                await self.loop.run_in_executor(None, self.cacheTable.pack, path, flight.item)
+            self.log_cache_stats()
+
+
+class AsyncCachingHandler:
+    ''' CachingServerHttpHandler on asyncio streams.
+    One handler serves all requests of a client connection, until it is
+    idle for KEEPALIVE_TIMEOUT.
+    '''
+
+    server_version = "CachingServerHTTP/" + __version__
+
+    protocol_version = "HTTP/1.1"
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 server: AsyncCachingServer):
+        self.reader = reader
+        self.writer = writer
+        self.server = server
+        self.client_address = writer.get_extra_info("peername")[:2]
+        self.close_connection = True
+        self.chunked = False
+
+    async def handle(self):
+        ''' Handle requests until the connection is to be closed '''
+        try:
+            self.close_connection = False
+            while not self.close_connection:
+                await self.handleOneRequest()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.writer.close()
+
+    async def handleOneRequest(self):
+        self.close_connection = True
+        try:
+            line = await asyncio.wait_for(self.reader.readline(), KEEPALIVE_TIMEOUT)
+        except asyncio.TimeoutError:
+            return  # idle for too long
+        except ValueError:
+            return await self.sendError(HTTPStatus.REQUEST_URI_TOO_LONG)
+        if not line:
+            return
+        self.requestline = line.decode("iso-8859-1").rstrip("\r\n")
+        words = self.requestline.split()
+        if len(words) != 3 or not words[2].startswith("HTTP/"):
+            self.request_version = "HTTP/1.0"
+            return await self.sendError(HTTPStatus.BAD_REQUEST)
+        self.command, self.path, self.request_version = words
+        try:
+            self.headers = await _readHeaders(self.reader)
+        except ValueError:
+            return await self.sendError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+        connection = self.headers.get("Connection", "").lower()
+        if self.request_version == "HTTP/1.1":
+            self.close_connection = connection == "close"
+        else:
+            self.close_connection = connection != "keep-alive"
+        method = getattr(self, "do_" + self.command, None)
+        if method is None:
+            return await self.sendError(HTTPStatus.NOT_IMPLEMENTED)
+        await method()
+
+    def sendResponse(self, status, headers):
+        self.log_request(status)
+        lines = [f"{self.protocol_version} {status.value} {status.phrase}",
+                 f"Server: {self.server_version}",
+                 f"Date: {formatdate(usegmt=True)}"]
+        lines += [f"{name}: {value}" for name, value in headers]
+        if self.close_connection:
+            lines.append("Connection: close")
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1", "strict"))
+
+    async def sendError(self, status):
+        ''' Same as BaseHTTPRequestHandler.send_error() '''
+        self.close_connection = True
+        body = (BaseHTTPRequestHandler.error_message_format % {
+            "code": status.value, "message": status.phrase,
+            "explain": status.description}).encode("utf-8", "replace")
+        self.sendResponse(status, [
+            ("Content-Type", BaseHTTPRequestHandler.error_content_type),
+            ("Content-Length", str(len(body)))])
+        if getattr(self, "command", None) != "HEAD":
+            self.writer.write(body)
+        await self.writer.drain()
+
+    @trace
+    async def sendHeaders(self, headers, status=HTTPStatus.OK):
+        ''' Send HTTP headers to client'''
+        self.sendResponse(HTTPStatus(status), headers)
+        await self.writer.drain()
+
+    async def sendBody(self, body):
+        ''' Same as CachingServerHttpHandler.sendBody(), for a body that may
+        also be an async iterator.
+        '''
+        if hasattr(body, "__aiter__"):
+            async for b in body:
+                await self.sendChunk(b)
+        else:
+            for b in body:
+                await self.sendChunk(b)
+        if self.chunked:
+            self.writer.write(b"0\r\n\r\n")
+            await self.writer.drain()
+
+    async def sendChunk(self, b):
+        if isinstance(b, FileSlice) or hasattr(b, "fileno"):
+            file, offset, count = b if isinstance(b, FileSlice) else (b, 0, None)
+            with file:
+                await self.writer.drain()
+                await self.server.loop.sendfile(self.writer.transport, file, offset, count)
+            return
+        size = self.server.chunkSize
+        view = memoryview(b)
+        for i in range(0, len(view), size):
+            if self.chunked:
+                piece = view[i:i + size]
+                self.writer.write(b"%x\r\n" % len(piece))
+                self.writer.write(piece)
+                self.writer.write(b"\r\n")
+            else:
+                self.writer.write(view[i:i + size])
+            await self.writer.drain()
+
+    async def drainBody(self, body):
+        ''' Iterate `body` without sending it, to let its fetch finish '''
+        if hasattr(body, "__aiter__"):
+            async for _ in body:
+                pass
+        else:
+            _closeBody(body)
+
+    def frameHeaders(self, headers, body):
+        ''' Same as CachingServerHttpHandler.frameHeaders() '''
+        self.chunked = False
+        if isinstance(body, list):
+            return [header for header in headers
+                    if header[0].lower() != "content-length"] + \
+                   [("Content-Length", str(_bodyLength(headers, body)))]
+        if any(header[0].lower() == "content-length" for header in headers):
+            return headers
+        if self.request_version == "HTTP/1.1":
+            self.chunked = True
+            return headers + [("Transfer-Encoding", "chunked")]
+        self.close_connection = True
+        return headers
+
+    @trace
+    async def do_GET(self):
+        ''' Logic when receive a HTTP GET '''
+        head, item = await self.server.touchItem(self.path, self.acceptEncoding(),
+                                                 PEER_HEADER in self.headers)
+        if not item:
+            await self.sendError(HTTPStatus.NOT_FOUND)
+            return
+        try:
+            byteRange = _parseRange(self.headers.get("Range"))
+            if byteRange is not None and not hasattr(item, "__aiter__") \
+                    and self.rangeApplies(head):
+                await self.sendRange(head, item, byteRange)
+            else:
+                await self.sendHeaders(self.frameHeaders(head, item))
+                await self.sendBody(item)
+        finally:
+            await self.drainBody(item)  # a fetch not sent to the end still finishes
+
+    @trace
+    async def do_HEAD(self):
+        ''' Logic when receive a HTTP HEAD '''
+        head, item = await self.server.touchItem(self.path, self.acceptEncoding(),
+                                                 PEER_HEADER in self.headers)
+        if not item:
+            await self.sendError(HTTPStatus.NOT_FOUND)
+            return
+        try:
+            await self.sendHeaders(self.frameHeaders(head, item))
+        finally:
+            await self.drainBody(item)
+
+    def acceptEncoding(self):
+        ''' Same as CachingServerHttpHandler.acceptEncoding() '''
+        if "Range" in self.headers:
+            return None
+        return self.headers.get("Accept-Encoding")
+
+    def rangeApplies(self, headers) -> bool:
+        ''' Same as CachingServerHttpHandler.rangeApplies() '''
+        condition = self.headers.get("If-Range")
+        if condition is None:
+            return True
+        fields = {name.lower(): value for name, value in headers}
+        return condition in (fields.get("etag"), fields.get("last-modified"))
+
+    async def sendRange(self, headers, body, byteRange):
+        ''' Same as CachingServerHttpHandler.sendRange() '''
+        length = _bodyLength(headers, body)
+        if length is None:
+            await self.sendHeaders(self.frameHeaders(headers, body))
+            await self.sendBody(body)
+            return
+        span = _resolveRange(byteRange, length)
+        if span is None:
+            _closeBody(body)
+            self.sendResponse(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE,
+                              [("Content-Range", f"bytes */{length}"),
+                               ("Content-Length", "0")])
+            await self.writer.drain()
+            return
+        start, stop = span
+        self.chunked = False
+        await self.sendHeaders([header for header in headers
+                                if header[0].lower() != "content-length"] +
+                               [("Content-Range", f"bytes {start}-{stop - 1}/{length}"),
+                                ("Content-Length", str(stop - start))],
+                               HTTPStatus.PARTIAL_CONTENT)
+        await self.sendBody(_sliceBody(body, start, stop))
+
+    def log_request(self, code="-", size="-"):
+        self.log_message('"%s" %s %s', self.requestline, str(int(code)), str(size))
+
+    def log_message(self, fmt, *args):
+        ''' Same as CachingServerHttpHandler.log_message() '''
+        info = f"[From {self.client_address[0]}:{self.client_address[1]}]"
+        now = datetime.now().strftime("%Y/%m/%d-%H:%M:%S")
+        sys.stdout.write(f"{now}| {info} {fmt % args}\n")
@@ -4,48 +4,201 @@
 
 CacheTable is a dict-like table storing <path, CacheItem>.
 
-CacheTable is stored in memory, but may be implemented to use disk in the
-future.
+CacheTable is stored in memory. Given a DiskCache, it also writes large
+bodies to disk, and serves them from there once they leave memory, see
+diskCache.py.
+
+All methods of CacheTable are thread-safe. Hold `CacheTable.lock` to make a
+sequence of calls atomic.
+
+CacheTable may be bounded by the bytes of headers and bodies it stores. Over
+the capacity, complete items are evicted in the order of an eviction policy,
+see evictionPolicy.py.
+
+A response whose Cache-Control forbids a shared cache to store it, see
+storable(), should not be kept: its item only lives while it is filled.
+
+An item expires after the time its Cache-Control or Expires header allows,
+or after the timeout of the table if it has neither. Expired items are
+dropped when they are visited, and in bulk by startSweeper(). An expired
+item with an ETag or Last-Modified is kept for a grace period, so that it
+can be revalidated with a conditional request and refreshed by refresh()
+instead of being fetched again.
+
+Given `compress`, complete bodies of text-like content are stored gzipped,
+see compression.py. Their headers keep the Content-Length of the
+uncompressed body, and decompress() yields the body back.
 '''
 import time
+import heapq
+import itertools
+import threading
 from collections import UserDict
+from email.utils import parsedate_to_datetime
 
 from utils.tracer import trace
+from .evictionPolicy import POLICIES
+from . import compression
 
 
-__all__ = ["HTTPCacheItem", "CacheTable"]
+__all__ = ["HTTPCacheItem", "CacheTable", "validators", "storable"]
 
 
 class HTTPCacheItem:
     ''' The value of the CacheTable '''
-    def __init__(self, headers: list, body: bytearray):
+    def __init__(self, headers: list, body: bytearray, complete: bool = True):
         ''' Initiate an item that stores info of an HTTP response.
-        headers: HTTP headers
-        body: HTTP body
-        timestamp: created time of this item. Used for expiration.
+        headers: HTTP headers. None until the response head is known.
+        body: HTTP body, None if it is only on disk.
+        complete: False while the body is still being filled.
+        timestamp: created time of this item.
+        expires: time to expire, known with the headers. None for never.
+        failed: True if filling the body was aborted.
+        file: the body opened from disk, or None if it is in memory.
+        encoding: "gzip" if the body is stored compressed, else None.
+        saved: bytes the compression of the body saves.
         '''
         self.headers = headers  # list of pairs
         self.body = body
-        self.timestamp = time.time()  # to see if it's expired
+        self.complete = complete
+        self.failed = False
+        self.timestamp = time.time()
+        self.expires = None  # to see if it's expired
+        self.size = 0  # bytes of headers and body
+        self.file = None
+        self.encoding = None
+        self.saved = 0
 
 
 class CacheTable(UserDict):
     ''' A dict-based cache table storing <path, CacheItem>.
 
+    An item created by setHeaders() or reserve() is incomplete until
+    finishBody() is called. Meanwhile other threads can wait for its
+    headers with waitHeaders() and stream its body with readBody().
+
     Example:
         >>> ct = CacheTable()
         >>> ct.setHeaders(path, headers)
         >>> ct.appendBody(path, body)
+        >>> ct.finishBody(path)
         >>> headers = ct.getHeaders(path)
         >>> body = ct.getBody(path)
     '''
-    def __init__(self, timeout=-1):
+    def __init__(self, timeout=-1, capacity=-1, policy="lru", disk=None, grace=0,
+                 compress=False):
         ''' Initiate a CacheTable.
         Params:
             timeout: seconds for a item to live. Negative for forever.
+            capacity: bytes of headers and bodies to keep. Negative for no
+                limit.
+            policy: eviction policy, one of "lru", "lfu" and "tinylfu".
+            disk: DiskCache of the second tier. None for memory only.
+            grace: seconds to keep an expired item that can be revalidated.
+            compress: True to store compressible bodies gzipped.
         '''
         self.timeout = timeout  # seconds. None for no timeout
+        self.grace = grace
+        self.revalidating = set()  # keys being revalidated
+        self.capacity = capacity
+        self.disk = disk
+        self.policy = POLICIES[policy]()
+        self.bytes = 0  # bytes of all items
+        self.evictions = 0
+        self.lock = threading.RLock()
+        self.filled = threading.Condition(self.lock)  # notified when items grow
+        self.deadlines = []  # heap of (expires, seq, key)
+        self.seq = itertools.count()  # breaks ties of deadlines
+        self.expirations = 0
+        self.sweeper = None
+        self.stopSweeper = threading.Event()
+        self.compress = compress
+        self.saved = 0  # bytes saved by compression of the items
+        self.compressTime = 0.0  # CPU seconds spent compressing
+        self.decompressTime = 0.0  # CPU seconds spent decompressing
         super().__init__()
+        if disk is not None:
+            for key, entry in disk.index.items():
+                self._schedule(key, entry)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.data or (self.disk is not None and key in self.disk)
+
+    def _insert(self, key: str, item: HTTPCacheItem):
+        if key in self.data:
+            self._remove(key)
+        if self.disk is not None:
+            self.disk.remove(key)  # would outlive the new item otherwise
+        self.data[key] = item
+        self.policy.insert(key)
+
+    def _remove(self, key: str):
+        item = self.data.pop(key)
+        self.bytes -= item.size
+        self.saved -= item.saved
+        self.policy.remove(key)
+
+    def _grow(self, item: HTTPCacheItem, size: int):
+        item.size += size
+        self.bytes += size
+
+    def _evict(self):
+        ''' Evict complete items until the table fits in its capacity.
+        Items still being filled are kept even if the table stays over it.
+        '''
+        while self.capacity >= 0 and self.bytes > self.capacity:
+            victim = next((key for key in self.policy.victims()
+                           if self.data[key].complete), None)
+            if victim is None:
+                return
+            self._remove(victim)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        ''' Return the bytes, items and evictions of the table, and what
+        compression saves and costs if it is enabled.
+        '''
+        with self.lock:
+            stats = {"bytes": self.bytes, "items": len(self.data),
+                     "capacity": self.capacity, "evictions": self.evictions,
+                     "expirations": self.expirations}
+            if self.disk is not None:
+                stats.update(diskBytes=self.disk.bytes, diskItems=len(self.disk),
+                             diskCapacity=self.disk.capacity,
+                             diskEvictions=self.disk.evictions)
+            if self.compress:
+                stats.update(saved=self.saved, compressTime=self.compressTime,
+                             decompressTime=self.decompressTime)
+            return stats
+
+    def reserve(self, key: str) -> HTTPCacheItem:
+        ''' Create an incomplete item without headers for `key`, replacing
+        any existing one, and return it.
+        '''
+        with self.lock:
+            item = HTTPCacheItem(None, bytearray(), False)
+            self._insert(key, item)
+            return item
+
+    def getItem(self, key: str) -> HTTPCacheItem:
+        ''' Return the item of `key` and count it as a use.
+        An item only on disk is returned with its body file opened, and no
+        body in memory. The caller must close the file.
+        '''
+        with self.lock:
+            if key not in self.data and self.disk is not None and key in self.disk:
+                entry = self.disk.entry(key)
+                file = self.disk.open(key)
+                item = HTTPCacheItem(entry.headers, None)
+                item.timestamp = entry.timestamp
+                item.expires = entry.expires
+                item.encoding = entry.encoding
+                item.file = file
+                return item
+            item = self.data[key]
+            self.policy.access(key)
+            return item
 
     @trace
     def setHeaders(self, key: str, headers):
@@ -54,10 +207,17 @@ class CacheTable(UserDict):
             key: str, key to visit
             headers: List[Tuple[str, str]], headers to store
         '''
-        if key in self.data:
-            self.data[key].headers = headers
-        else:
-            self.data[key] = HTTPCacheItem(headers, bytearray())
+        with self.lock:
+            if key not in self.data:
+                self._insert(key, HTTPCacheItem(None, bytearray(), False))
+            item = self.data[key]
+            if item.headers is not None:
+                self._grow(item, -_headersSize(item.headers))
+            item.headers = headers
+            self._grow(item, _headersSize(headers))
+            item.expires = self._expiresOf(headers, item.timestamp)
+            self.filled.notify_all()
+            self._evict()
 
     @trace
     def getHeaders(self, key: str):
@@ -65,22 +225,346 @@ class CacheTable(UserDict):
         Returns:
             List[Tuple[str, str]] headers.
         '''
-        return self.data[key].headers
+        with self.lock:
+            if key not in self.data and self.disk is not None:
+                return self.disk.entry(key).headers
+            return self.data[key].headers
 
     def appendBody(self, key: str, body: bytearray):
         ''' Append the body to the CacheItem corresponding to key. 
         `key` should already in self.data, which means this should be called
         after calling self.setHeaders().
         '''
-        self.data[key].body.extend(body)
+        with self.lock:
+            item = self.data[key]
+            item.body.extend(body)
+            self._grow(item, len(body))
+            self.filled.notify_all()
+            self._evict()
 
     def getBody(self, key: str) -> bytearray:
-        return self.data[key].body
+        ''' Get body of `key` item, a memory map if it is only on disk. '''
+        with self.lock:
+            if key not in self.data and self.disk is not None:
+                with self.disk.open(key) as file:
+                    return self.disk.mapFile(file)
+            return self.data[key].body
+
+    def finishBody(self, key: str, failed: bool = False, pack: bool = True):
+        ''' Mark the body of `key` complete. If `failed`, the item is dropped
+        and readers stop where the body ends.
+        The body is then packed by pack(), outside the lock, unless `pack`
+        is False, in which case the caller may call pack() later.
+        '''
+        with self.lock:
+            item = self.data[key]
+            item.complete = True
+            if failed:
+                item.failed = True
+                self._remove(key)
+            else:
+                self._schedule(key, item)
+            self.filled.notify_all()
+            self._evict()
+        if not failed and pack:
+            self.pack(key, item)
+
+    def discard(self, key: str, item: HTTPCacheItem):
+        ''' Drop `item` of `key` if it is still the item of `key`. Readers
+        of its body can still finish.
+        '''
+        with self.lock:
+            if self.data.get(key) is item:
+                self._remove(key)
+
+    def pack(self, key: str, item: HTTPCacheItem):
+        ''' Compress the complete `item` of `key` if it is worth it, and write
+        it to disk if it is large enough.
+        '''
+        if not item.failed:
+            self._compress(key, item)
+            self._spill(key, item)
+
+    def _compress(self, key: str, item: HTTPCacheItem):
+        if not self.compress or item.encoding is not None or \
+                not compression.compressible(item.headers, len(item.body)):
+            return
+        tick = time.thread_time()
+        body = compression.compress(item.body)
+        spent = time.thread_time() - tick
+        with self.lock:
+            self.compressTime += spent
+            if len(body) >= len(item.body) or self.data.get(key, item) is not item:
+                return  # no gain, or the key was fetched again meanwhile
+            # readers of the plain body keep the bytearray they hold
+            headers = [header for header in item.headers
+                       if header[0].lower() != "content-length"] + \
+                      [("Content-Length", str(len(item.body)))]
+            if self.data.get(key) is item:  # else evicted, but may go to disk
+                item.saved = len(item.body) - len(body)
+                self.saved += item.saved
+                self._grow(item, _headersSize(headers) - _headersSize(item.headers) - item.saved)
+            item.headers, item.body, item.encoding = headers, body, "gzip"
+
+    def decompress(self, item: HTTPCacheItem, size: int):
+        ''' Yield the body of the compressed `item` decompressed, in chunks
+        of up to `size` bytes. Its file, if any, is mapped into memory only
+        then, and closed at the end, or when the result is closed unread.
+        '''
+        def reader():
+            spent, body, chunks = 0.0, item.body, None
+            try:
+                yield  # started below, so that close() always runs the finally
+                if item.file is not None:
+                    body = self.disk.mapFile(item.file)
+                chunks = compression.decompress(body, size)
+                while True:
+                    tick = time.thread_time()
+                    chunk = next(chunks, None)
+                    spent += time.thread_time() - tick
+                    if chunk is None:
+                        return
+                    yield chunk
+            finally:
+                if chunks is not None:
+                    chunks.close()  # releases its view of the map
+                if item.file is not None:
+                    if hasattr(body, "close"):
+                        body.close()
+                    item.file.close()
+                with self.lock:
+                    self.decompressTime += spent
+        chunks = reader()
+        next(chunks)
+        return chunks
+
+    def _spill(self, key: str, item: HTTPCacheItem):
+        if self.disk is None or item.failed or len(item.body) < self.disk.minSize:
+            return
+        tmp = self.disk.write(item.body)
+        with self.lock:
+            # keep it unless the key was fetched again meanwhile
+            if self.data.get(key, item) is item and not (
+                    key in self.disk and self.disk.entry(key).timestamp > item.timestamp):
+                entry = self.disk.commit(key, tmp, item.headers, item.timestamp,
+                                         item.expires, item.encoding)
+                self._schedule(key, entry)
+            else:
+                self.disk.discard(tmp)
+
+    def waitHeaders(self, item: HTTPCacheItem):
+        ''' Wait until the headers of `item` are set. Return them, or None
+        if the item failed first.
+        '''
+        with self.lock:
+            while item.headers is None and not item.complete:
+                self.filled.wait()
+            return None if item.failed else item.headers
+
+    def readBody(self, item: HTTPCacheItem, size: int):
+        ''' Return an iterator over the body of `item` in chunks of up to
+        `size` bytes, waiting for the parts that are still being filled.
+        It reads the body `item` has now, so it keeps to the plain body even
+        if the item is compressed once complete. Call it with the lock held
+        together with reading the headers.
+        Raise ConnectionAbortedError after the last chunk if filling the
+        body was aborted, since the body is cut short.
+        '''
+        return self._readBody(item, item.body, size)
+
+    def _readBody(self, item: HTTPCacheItem, body: bytearray, size: int):
+        offset = 0
+        while True:
+            with self.lock:
+                while offset >= len(body) and not item.complete:
+                    self.filled.wait()
+                if offset >= len(body):
+                    if item.failed:
+                        raise ConnectionAbortedError("filling the body was aborted")
+                    return
+                chunk = body[offset:offset + size]  # body may grow, copy
+            offset += len(chunk)
+            yield chunk
+
+    def _expiresOf(self, headers, timestamp):
+        ''' Return the time a response with `headers` received at `timestamp`
+        expires, None for never.
+        '''
+        ttl = _freshness(headers)
+        if ttl is None:
+            if self.timeout is None or self.timeout <= 0:
+                return None
+            ttl = self.timeout
+        return timestamp + ttl
+
+    def _deadline(self, owner):
+        ''' Return the time to drop `owner`, an item or a DiskEntry '''
+        if owner.expires is None:
+            return None
+        if validators(owner.headers):
+            return owner.expires + self.grace
+        return owner.expires
+
+    def _schedule(self, key: str, owner):
+        ''' Let the sweeper drop `owner`, an item or a DiskEntry of `key` '''
+        deadline = self._deadline(owner)
+        if deadline is not None:
+            heapq.heappush(self.deadlines, (deadline, next(self.seq), key))
+
+    def _expire(self, key: str):
+        if key in self.data:
+            self._remove(key)
+        if self.disk is not None:
+            self.disk.remove(key)
+        self.expirations += 1
 
     def expired(self, key):
-        ''' Check if the item of `key` expired. Return True if expired. '''
-        if self.timeout > 0:
-            if time.time() - self.data[key].timestamp > self.timeout:
-                del self.data[key]  # remove key
-                return True
-        return False
+        ''' Check if the item of `key` expired. Return True if expired.
+        Items still being filled never expire. An expired item is removed,
+        unless it is in its grace period for revalidation.
+        '''
+        with self.lock:
+            if key in self.data:
+                owner = self.data[key]
+                if not owner.complete:
+                    return False
+            else:
+                owner = self.disk.entry(key)
+            now = time.time()
+            if owner.expires is None or now <= owner.expires:
+                return False
+            if now > self._deadline(owner):
+                self._expire(key)
+            return True
+
+    def startRevalidation(self, key: str):
+        ''' Mark `key` as being revalidated. Others wait in
+        waitRevalidation() until endRevalidation() or refresh() is called.
+        '''
+        with self.lock:
+            self.revalidating.add(key)
+
+    def waitRevalidation(self, key: str):
+        with self.lock:
+            while key in self.revalidating:
+                self.filled.wait()
+
+    def endRevalidation(self, key: str):
+        with self.lock:
+            self.revalidating.discard(key)
+            self.filled.notify_all()
+
+    def refresh(self, key: str, item: HTTPCacheItem, headers):
+        ''' Make the expired `item` of `key` fresh again with the `headers`
+        of a 304 response, without touching its body, and end revalidation.
+        '''
+        with self.lock:
+            now = time.time()
+            expires = self._expiresOf(headers, now)
+            if self.data.get(key) is item:
+                self._grow(item, _headersSize(headers) - _headersSize(item.headers))
+            if self.disk is not None and key in self.disk:
+                entry = self.disk.refresh(key, headers, now, expires)
+                self._schedule(key, entry)
+            item.headers, item.timestamp, item.expires = headers, now, expires
+            if self.data.get(key) is item:
+                self._schedule(key, item)
+            self.endRevalidation(key)
+
+    def sweep(self) -> int:
+        ''' Drop all expired items and return how many. The cost depends on
+        the number of expired items, not on the size of the table.
+        '''
+        swept = 0
+        with self.lock:
+            now = time.time()
+            while self.deadlines and self.deadlines[0][0] < now:
+                deadline, _, key = heapq.heappop(self.deadlines)
+                # skip deadlines of items replaced, evicted or refreshed since
+                item = self.data.get(key)
+                entry = self.disk.index.get(key) if self.disk is not None else None
+                if key in self.revalidating:
+                    continue  # refresh() schedules it again
+                if (item is not None and item.complete and self._deadline(item) == deadline) or \
+                        (entry is not None and self._deadline(entry) == deadline):
+                    self._expire(key)
+                    swept += 1
+        return swept
+
+    def startSweeper(self, interval: float):
+        ''' Call sweep() every `interval` seconds on a background thread '''
+        def run():
+            while not self.stopSweeper.wait(interval):
+                self.sweep()
+        self.stopSweeper.clear()
+        self.sweeper = threading.Thread(target=run, name="CacheTableSweeper", daemon=True)
+        self.sweeper.start()
+
+    def stopSweeping(self):
+        if self.sweeper is not None:
+            self.stopSweeper.set()
+            self.sweeper.join()
+            self.sweeper = None
+
+
+def _headersSize(headers) -> int:
+    return sum(len(name) + len(value) for name, value in headers)
+
+
+def validators(headers) -> dict:
+    ''' Return the headers of a conditional request for a response with
+    `headers`, empty if it has neither ETag nor Last-Modified.
+    '''
+    conditions = {}
+    for name, value in headers or ():
+        if name.lower() == "etag":
+            conditions["If-None-Match"] = value
+        elif name.lower() == "last-modified":
+            conditions["If-Modified-Since"] = value
+    return conditions
+
+
+def storable(headers) -> bool:
+    ''' Check if a shared cache may store a response with `headers`, that is
+    if its Cache-Control has neither no-store nor private.
+    '''
+    return not {"no-store", "private"} & _directives(headers).keys()
+
+
+def _directives(headers) -> dict:
+    ''' Return the directives of the Cache-Control in `headers` by name '''
+    value = next((value for name, value in headers or () if name.lower() == "cache-control"), "")
+    directives = {}
+    for directive in value.split(","):
+        name, _, value = directive.strip().partition("=")
+        directives[name.lower()] = value.strip('"')
+    return directives
+
+
+def _freshness(headers):
+    ''' Return seconds a response with `headers` may be cached, following
+    Cache-Control (as a shared cache) and then Expires. None if they tell
+    nothing.
+    '''
+    fields = {}
+    for name, value in headers:
+        fields.setdefault(name.lower(), value)
+    directives = _directives(headers)
+    if {"no-store", "no-cache", "private"} & directives.keys():
+        return 0
+    try:
+        age = max(0, int(fields.get("age", 0)))
+    except ValueError:
+        age = 0
+    for name in ("s-maxage", "max-age"):
+        if name in directives:
+            try:
+                return max(0, int(directives[name]) - age)
+            except ValueError:
+                return 0
+    if "expires" in fields:
+        try:
+            return max(0, parsedate_to_datetime(fields["expires"]).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return 0  # an invalid date means already expired
+    return None
@@ -1,6 +1,8 @@
 ''' Caching Server for Content Delivery Network (CDN)
 
-CachingServer is a subclass of TCPServer that runs a server.
+CachingServer is a subclass of TCPServer that runs a server. It serves one
+client at a time. ThreadingCachingServer and PooledCachingServer serve
+clients concurrently.
 CachingServerHttpHandler is a subclass of BaseHTTPRequestHandler that handles
 HTTP reqeust.
 
@@ -19,33 +21,81 @@ shall store and response to client simultaneously.
 '''
 
 import io
+import os
 import sys
+import threading
 from datetime import datetime
-from typing import Type, Optional, Tuple, List
+from typing import Type, Optional, Tuple, List, NamedTuple, Sequence
 from http import HTTPStatus
 from http.server import BaseHTTPRequestHandler
-from http.client import HTTPConnection, HTTPResponse
-from socketserver import TCPServer
-
-from .cacheTable import CacheTable
+from http.client import HTTPResponse, HTTPException
+from socketserver import TCPServer, ThreadingMixIn
+from concurrent.futures import ThreadPoolExecutor
+
+from .cacheTable import CacheTable, validators, storable
+from .diskCache import DiskCache
+from .connectionPool import ConnectionPool
+from .compression import acceptsGzip
+from .hashRing import HashRing
 from utils.tracer import trace
 
 
-__all__ = ["CachingServer", "CachingServerHttpHandler"]
+__all__ = ["CachingServer", "ThreadingCachingServer", "PooledCachingServer",
+           "CachingServerHttpHandler"]
 
 __version__ = "0.1"
 
-CACHE_TIMEOUT = 10
+CACHE_TIMEOUT = 10  # seconds. For responses without Cache-Control or Expires
+
+SWEEP_INTERVAL = 1  # seconds between sweeps of expired items
+
+REVALIDATE_GRACE = 60  # seconds to keep expired items with ETag or Last-Modified
+
+CACHE_CAPACITY = 256 * 1024 * 1024  # bytes. 256 MB
+
+CACHE_POLICY = "lru"  # one of "lru", "lfu", "tinylfu"
+
+DISK_CAPACITY = 4 * 1024 * 1024 * 1024  # bytes. 4 GB
+
+DISK_MIN_SIZE = 1024 * 1024  # bytes. Smaller bodies are kept in memory only
+
+BUFFER_SIZE = 64 * 1024  # bytes. 64 KB. Default chunk size of bodies
+
+POOL_WORKERS = 16  # threads of PooledCachingServer
+
+KEEPALIVE_TIMEOUT = 5  # seconds an idle client connection is kept open
 
-BUFFER_SIZE = 64 * 1024  # bytes. 64 KB
+ORIGIN_MAX_IDLE = 8  # idle connections kept to each origin
+
+ORIGIN_IDLE_TIMEOUT = 30  # seconds before an idle origin connection is closed
+
+PREFETCH_WORKERS = 8  # paths prefetched at a time
+
+PEER_HEADER = "X-Cache-Peer"  # marks requests from a peer, which must not go on to another
 
 
 class CachingServer(TCPServer):
     ''' The caching server for CDN '''
+
+    # if clients may keep their connections open. Not for a server handling
+    # one client at a time, which an idle connection would block
+    keepAlive = False
+
     def __init__(self,
                  serverAddress:        Tuple[str, str],
                  serverRequestHandler: Type[BaseHTTPRequestHandler],
                  mainServerAddress:    str,
+                 cacheCapacity:        int = CACHE_CAPACITY,
+                 cachePolicy:          str = CACHE_POLICY,
+                 cacheDir:             Optional[str] = None,
+                 diskCapacity:         int = DISK_CAPACITY,
+                 chunkSize:            int = BUFFER_SIZE,
+                 cacheTimeout:         float = CACHE_TIMEOUT,
+                 originMaxIdle:        int = ORIGIN_MAX_IDLE,
+                 revalidateGrace:      float = REVALIDATE_GRACE,
+                 compress:             bool = False,
+                 peers:                Sequence[str] = (),
+                 selfAddress:          Optional[str] = None,
                  ):
         ''' Construct a server.
         Params:
@@ -54,69 +104,317 @@ class CachingServer(TCPServer):
                 BaseHTTPRequestHandler.
             mainServerAddress: the address(include port) to main server,
                 e.g. 172.0.10.1:8080
+            cacheCapacity: bytes the cache keeps. Negative for no limit.
+            cachePolicy: how the cache evicts items, "lru", "lfu" or "tinylfu"
+            cacheDir: directory to keep large bodies in. None for memory only.
+            diskCapacity: bytes the directory keeps. Negative for no limit.
+            chunkSize: bytes of body read from main server or sent to
+                client at a time.
+            cacheTimeout: seconds to cache a response that doesn't tell.
+                Negative for forever.
+            originMaxIdle: idle connections kept to each origin server.
+            revalidateGrace: seconds to keep an expired response that can be
+                revalidated with a conditional request.
+            compress: True to store text-like bodies gzipped, and send them
+                so to clients accepting gzip.
+            peers: addresses of the other caching servers of a cluster
+                sharing the paths by consistent hashing, see hashRing.py.
+            selfAddress: the address of this server the peers know.
+                Required with `peers`.
         '''
         self.mainServerAddress = mainServerAddress
-        self.cacheTable = CacheTable(timeout=CACHE_TIMEOUT)
+        self.originMaxIdle = originMaxIdle
+        self.connectionPools = {}  # address -> ConnectionPool
+        self.connectionPoolsLock = threading.Lock()
+        self.chunkSize = chunkSize
+        self.selfAddress = selfAddress
+        self.ring = None
+        if peers:
+            if selfAddress is None:
+                raise ValueError("selfAddress is required with peers")
+            self.ring = HashRing([*peers, selfAddress])
+        disk = None
+        if cacheDir is not None:
+            disk = DiskCache(cacheDir, capacity=diskCapacity, minSize=DISK_MIN_SIZE)
+        self.cacheTable = CacheTable(timeout=cacheTimeout, capacity=cacheCapacity,
+                                     policy=cachePolicy, disk=disk, grace=revalidateGrace,
+                                     compress=compress)
+        self.cacheTable.startSweeper(SWEEP_INTERVAL)
         self.allow_reuse_address = True
         super().__init__(serverAddress, serverRequestHandler, True)
 
+    def server_close(self):
+        super().server_close()
+        self.cacheTable.stopSweeping()
+        for pool in self.connectionPools.values():
+            pool.close()
+        if self.cacheTable.disk is not None:
+            self.cacheTable.disk.close()
+
+    def connectionPool(self, address: str) -> ConnectionPool:
+        ''' Return the pool of connections to the server at `address` '''
+        with self.connectionPoolsLock:
+            if address not in self.connectionPools:
+                self.connectionPools[address] = ConnectionPool(
+                    address, maxIdle=self.originMaxIdle, idleTimeout=ORIGIN_IDLE_TIMEOUT)
+            return self.connectionPools[address]
+
     def _filterHeaders(self, headers: List[Tuple[str, str]]):
         ''' discard some headers and return the left '''
-        discardHeaders = {"server", "date", "connection"}
+        discardHeaders = {"server", "date", "connection", "keep-alive",
+                          "transfer-encoding"}  # hop-by-hop, set per client
         return [header for header in headers
                 if header[0].lower() not in discardHeaders]
 
     @trace
-    def requestMainServer(self, path: str) -> Optional[HTTPResponse]:
+    def requestMainServer(self, path: str, conditions: dict = None) -> Optional[HTTPResponse]:
         ''' GET `path` from main server.
         Called by self.touchItem().
         Params:
             path: path of target
+            conditions: If-None-Match and If-Modified-Since to revalidate a
+                cached response
         Return:
-            HTTPResponse if successfully requested.
+            HTTPResponse if successfully requested, or 304 Not Modified to a
+            conditional request. Give it back to the connection pool with
+            releaseMainServer() once it is read.
             None if failed (server is down or file not found).
         '''
-        conn = HTTPConnection(self.mainServerAddress)
+        pool = self.connectionPool(self.mainServerAddress)
         try:
-            conn.request("GET", path)
+            response: HTTPResponse = pool.request("GET", path, conditions)
         except ConnectionRefusedError:
             self.log_error(f"Cannot connect to main server '{self.mainServerAddress}'")
             return None
-        response: HTTPResponse = conn.getresponse()
         if response.status == HTTPStatus.OK:
             self.log_info(f"Fetched '{path}' from main server "
                           f"'{self.mainServerAddress}'")
             return response
+        if response.status == HTTPStatus.NOT_MODIFIED and conditions:
+            response.read()
+            pool.release(response)
+            self.log_info(f"Revalidated '{path}' with main server "
+                          f"'{self.mainServerAddress}'")
+            return response
 
         # else: status isn't ok
+        response.read()
+        pool.release(response)
         self.log_error(f"File not found on main server '{self.mainServerAddress}'")
         return None
 
-    def touchItem(self, path: str):
+    def owns(self, path: str) -> bool:
+        ''' Check if `path` belongs to this server in its cluster, if any '''
+        return self.ring is None or self.ring.owner(path) == self.selfAddress
+
+    def requestUpstream(self, path: str, forwarded: bool = False) -> Optional[HTTPResponse]:
+        ''' GET `path` from the peer owning it, or from main server if this
+        server owns it or the request was `forwarded` by a peer already.
+        Main server is asked instead of a peer that is down or failing.
+        Called by self.touchItem().
+        Return:
+            Same as self.requestMainServer(). A response of a peer is
+            given back with releaseMainServer() too.
+        '''
+        if forwarded or self.owns(path):
+            return self.requestMainServer(path)
+        peer = self.ring.owner(path)
+        pool = self.connectionPool(peer)
+        try:
+            response: HTTPResponse = pool.request("GET", path, {PEER_HEADER: self.selfAddress})
+        except (OSError, HTTPException) as e:
+            self.log_warning(f"Cannot connect to peer '{peer}': {e}")
+            return self.requestMainServer(path)
+        if response.status == HTTPStatus.OK:
+            response.peer = peer  # the pool to give it back to
+            self.log_info(f"Fetched '{path}' from peer '{peer}'")
+            return response
+        response.read()
+        pool.release(response)
+        if response.status == HTTPStatus.NOT_FOUND:
+            # the peer asked main server already
+            self.log_error(f"File not found on peer '{peer}'")
+            return None
+        self.log_warning(f"Peer '{peer}' answered {response.status} for '{path}'")
+        return self.requestMainServer(path)
+
+    def requestRange(self, path: str, byteRange: str) -> Optional[HTTPResponse]:
+        ''' GET the `byteRange` of `path` from main server, bypassing the
+        cache. Whatever its status, give the response back with
+        releaseMainServer() once it is read.
+        '''
+        try:
+            return self.connectionPool(self.mainServerAddress).request(
+                "GET", path, {"Range": byteRange})
+        except ConnectionRefusedError:
+            self.log_error(f"Cannot connect to main server '{self.mainServerAddress}'")
+            return None
+
+    def cached(self, path: str) -> bool:
+        ''' Check if `path` is cached or being fetched '''
+        with self.cacheTable.lock:
+            return path in self.cacheTable and not self.cacheTable.expired(path)
+
+    def releaseMainServer(self, response: HTTPResponse, reusable: bool = True):
+        ''' Give back the connection of a response of requestMainServer() or
+        requestUpstream()
+        '''
+        address = getattr(response, "peer", self.mainServerAddress)
+        self.connectionPool(address).release(response, reusable)
+
+    def touchItem(self, path: str, acceptEncoding: Optional[str] = None,
+                  forwarded: bool = False):
         ''' Touch the item of path.
         This method, called by HttpHandler, serves as a bridge of server and
         handler.
         If the target doesn't exsit or expires, fetch from main server.
         Write the headers to local cache and return the body.
+        Concurrent misses on the same path share one fetch: the first request
+        fetches, the others stream the body from the cache as it arrives.
+        An expired item with validators is revalidated with a conditional
+        request first; on 304 Not Modified it is refreshed and served.
+        The returned body must be iterated to the end or closed, or the fetch
+        stalls; closing it before the end still fetches the rest.
+        Its chunks are bytes-like objects valid until the next one is taken,
+        or files opened from the disk cache.
+        A compressed item is sent as it is if `acceptEncoding`, the
+        Accept-Encoding of the client, allows it, see encodeItem().
+        In a cluster, a path of another server is fetched from it, unless
+        the request is `forwarded` by a peer, and is not kept once sent.
+        Neither is a response that must not be stored, see storable().
         '''
         # implement the logic described in doc-string
-        def res_reader(res):
-          buf = bytearray(BUFFER_SIZE)
-          while True:
-            sz = res.readinto(buf)
-            if sz == 0:
-              break
-            self.cacheTable.appendBody(path, buf[:sz])
-            yield buf[:sz]
-        if path not in self.cacheTable or self.cacheTable.expired(path):
-          res = self.requestMainServer(path)
-          if not res:
+        def res_reader(res, item):
+          buf = memoryview(bytearray(self.chunkSize))  # reused for every chunk
+          sending, complete = True, False
+          try:
+            try:
+              # started by touchItem(), so that closing the body unread
+              # still fills the cache and releases the connection below
+              yield
+            except GeneratorExit:
+              sending = False
+            while True:
+              sz = res.readinto(buf)
+              if sz == 0:
+                if res.length:  # readinto() does not raise for a short body
+                  raise ConnectionAbortedError("main server closed the connection early")
+                break
+              chunk = buf[:sz]
+              self.cacheTable.appendBody(path, chunk)
+              if sending:
+                try:
+                  yield chunk
+                except GeneratorExit:
+                  # the client went away, keep filling the cache for the others
+                  sending = False
+            complete = True
+          finally:
+            self.releaseMainServer(res, reusable=complete)
+            # the peer keeps it, and no one may keep a no-store response
+            keep = not hasattr(res, "peer") and storable(item.headers)
+            self.cacheTable.finishBody(path, failed=not complete, pack=keep)
+            if not keep:
+              self.cacheTable.discard(path, item)
+            self.log_cache_stats()
+        with self.cacheTable.lock:
+          self.cacheTable.waitRevalidation(path)
+          stale = None
+          if path in self.cacheTable and not self.cacheTable.expired(path):
+            item = self.cacheTable.getItem(path)
+            if item.complete:
+              return self.encodeItem(self.cacheTable.getHeaders(path), item, acceptEncoding)
+            leader = False
+          elif path in self.cacheTable:
+            # expired but kept for revalidation, the others wait for it
+            stale = self.cacheTable.getItem(path)
+            self.cacheTable.startRevalidation(path)
+            leader = True
+          else:
+            # single-flight: later requests for path attach to this fetch
+            reserved = self.cacheTable.reserve(path)
+            leader = True
+        if not leader:
+          if self.cacheTable.waitHeaders(item) is None:
             return None, None
-          head, item = self._filterHeaders(res.getheaders()), res_reader(res)
-          self.cacheTable.setHeaders(path, head)
+          with self.cacheTable.lock:
+            # a complete item may be compressed meanwhile, so take its headers
+            # and body together, of the same variant
+            if item.complete and not item.failed:
+              return self.encodeItem(item.headers, item, acceptEncoding)
+            return item.headers, self.cacheTable.readBody(item, self.chunkSize)
+        if stale is not None:
+          try:
+            res = self.requestMainServer(path, validators(stale.headers))
+          except BaseException:
+            if stale.file is not None:
+              stale.file.close()
+            self.cacheTable.endRevalidation(path)
+            raise
+          if res is not None and res.status == HTTPStatus.NOT_MODIFIED:
+            head = _mergeHeaders(stale.headers, self._filterHeaders(res.getheaders()))
+            self.cacheTable.refresh(path, stale, head)
+            return self.encodeItem(head, stale, acceptEncoding)
+          if stale.file is not None:
+            stale.file.close()
+          with self.cacheTable.lock:
+            self.cacheTable.endRevalidation(path)
+            reserved = self.cacheTable.reserve(path)
         else:
-          head, item = self.cacheTable.getHeaders(path), [self.cacheTable.getBody(path)]
-        return head, item
+          try:
+            res = self.requestUpstream(path, forwarded)
+          except BaseException:
+            self.cacheTable.finishBody(path, failed=True)
+            raise
+        if not res:
+          self.cacheTable.finishBody(path, failed=True)
+          return None, None
+        head = self._filterHeaders(res.getheaders())
+        self.cacheTable.setHeaders(path, head)
+        body = res_reader(res, reserved)
+        next(body)
+        return head, body
+
+    def prefetchItem(self, path: str) -> Optional[int]:
+        ''' Fetch `path` into the cache as a client would, see prefetch.py.
+        Return the bytes fetched, 0 if it was cached already, or None if
+        main server doesn't have it.
+        '''
+        # a compressed hit is then sent as it is, not decompressed for nothing
+        head, body = self.touchItem(path, "gzip")
+        if not body:
+            return None
+        if isinstance(body, list):
+            _closeBody(body)
+            return 0
+        return sum(len(chunk) for chunk in body)
+
+    def encodeItem(self, headers, item, acceptEncoding: Optional[str]):
+        ''' Return the `headers` and body of the complete `item` for a client
+        with `acceptEncoding`. A compressed body is sent as it is to clients
+        accepting it, and decompressed while it is sent to the others.
+        '''
+        body = item.file if item.file is not None else item.body
+        if item.encoding is None:
+            return headers, [body]
+        headers = headers + [("Vary", "Accept-Encoding")]
+        if acceptsGzip(acceptEncoding):
+            return headers + [("Content-Encoding", item.encoding)], [body]
+        return headers, self.cacheTable.decompress(item, self.chunkSize)
+
+    def log_cache_stats(self):
+        stats = self.cacheTable.stats()
+        self.log_info(f"Cache: {stats['items']} items, {stats['bytes']}/"
+                      f"{stats['capacity']} bytes, {stats['evictions']} evictions, "
+                      f"{stats['expirations']} expirations")
+        if "diskItems" in stats:
+            self.log_info(f"Disk cache: {stats['diskItems']} items, "
+                          f"{stats['diskBytes']}/{stats['diskCapacity']} bytes, "
+                          f"{stats['diskEvictions']} evictions")
+        if "saved" in stats:
+            self.log_info(f"Compression: {stats['saved']} bytes saved, "
+                          f"{stats['compressTime']:.3f}s compressing, "
+                          f"{stats['decompressTime']:.3f}s decompressing")
 
     def log_info(self, msg):
         self._logMsg("Info", msg)
@@ -136,6 +434,39 @@ class CachingServer(TCPServer):
         sys.stdout.write(f"{now}| {info} {msg}\n")
 
 
+class ThreadingCachingServer(ThreadingMixIn, CachingServer):
+    ''' A caching server handling each client in a new thread '''
+    daemon_threads = True
+    keepAlive = True
+
+
+class PooledCachingServer(CachingServer):
+    ''' A caching server handling clients on a bounded pool of threads.
+    Connections beyond `workers` wait in the pool's queue.
+    '''
+    keepAlive = True
+
+    def __init__(self, *args, workers: int = POOL_WORKERS, **kwargs):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        super().__init__(*args, **kwargs)
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        ''' Same as ThreadingMixIn.process_request_thread '''
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+
+
 class CachingServerHttpHandler(BaseHTTPRequestHandler):
     ''' A caching server for CDN network.
     An HTTP request or response should have a head and an optional body.
@@ -144,6 +475,18 @@ class CachingServerHttpHandler(BaseHTTPRequestHandler):
     The path in URL will be stored in self.path. It will call self.do_GET() or
     self.do_HEAD() according to the request's method. You can simply consider
     one of them the entry of the handler.
+
+    The handler speaks HTTP/1.1, so a client may send many requests, even
+    pipelined, over one connection, which is closed once idle for
+    KEEPALIVE_TIMEOUT. Every response is framed with Content-Length, or with
+    chunked transfer coding when a body is streamed from main server without
+    a known length. For a server without keepAlive it speaks HTTP/1.0 and
+    closes the connection after each response.
+
+    A GET with a single byte range is answered with 206 Partial Content from
+    the cache. A range not starting at 0 of a path not in the cache is
+    forwarded to main server instead, so seeking in a large file does not
+    wait for the whole file; a range starting at 0 fills the cache.
     
     The response head is consist of status, version and multiple headers. At
     least it should have headers "Content-Type" and "Content-Length". The
@@ -158,11 +501,35 @@ class CachingServerHttpHandler(BaseHTTPRequestHandler):
 
     server_version = "CachingServerHTTP/" + __version__
 
+    protocol_version = "HTTP/1.1"
+
+    chunked = False  # if the body being sent uses chunked transfer coding
+
+    def frameHeaders(self, headers, body):
+        ''' Return `headers` with the framing of `body` for this client.
+        A complete body gets its exact Content-Length. A streamed one keeps
+        the length from main server, or else goes chunked to HTTP/1.1
+        clients and ends with the connection for older ones.
+        '''
+        self.chunked = False
+        if isinstance(body, list):
+          length = _bodyLength(headers, body)
+          return [header for header in headers
+                  if header[0].lower() != "content-length"] + \
+                 [("Content-Length", str(length))]
+        if any(header[0].lower() == "content-length" for header in headers):
+          return headers
+        if self.request_version == "HTTP/1.1" and self.protocol_version == "HTTP/1.1":
+          self.chunked = True
+          return headers + [("Transfer-Encoding", "chunked")]
+        self.close_connection = True
+        return headers
+
     @trace
-    def sendHeaders(self, headers):
+    def sendHeaders(self, headers, status=HTTPStatus.OK):
         ''' Send HTTP headers to client'''
         # implement the logic of sending headers
-        self.send_response(HTTPStatus.OK)
+        self.send_response(status)
         for key, value in headers:
           self.send_header(key, value)
         self.end_headers()
@@ -171,9 +538,49 @@ class CachingServerHttpHandler(BaseHTTPRequestHandler):
         ''' Send HTTP body to client.
         Should be called after calling self.sendHeaders(). Else you may get
         broken pipe error.
+        Files are sent with sendfile(), bytes-like chunks in slices of the
+        server's chunk size without copying them.
         '''
+        size = self.server.chunkSize
         for b in body:
-          self.wfile.write(b)
+          if isinstance(b, FileSlice):
+            with b.file:
+              self.wfile.flush()
+              self.connection.sendfile(b.file, b.offset, b.count)
+            continue
+          if hasattr(b, "fileno"):
+            with b:
+              self.wfile.flush()
+              self.connection.sendfile(b)
+            continue
+          with memoryview(b) as view:
+            for i in range(0, len(view), size):
+              if self.chunked:
+                piece = view[i:i + size]
+                self.wfile.write(b"%x\r\n" % len(piece))
+                self.wfile.write(piece)
+                self.wfile.write(b"\r\n")
+              else:
+                self.wfile.write(view[i:i + size])
+        if self.chunked:
+          self.wfile.write(b"0\r\n\r\n")
+
+    def setup(self):
+        super().setup()
+        if not self.server.keepAlive:
+          self.protocol_version = "HTTP/1.0"  # one response per connection
+
+    def handle_one_request(self):
+        # the timeout only bounds the wait for a request, see parse_request()
+        self.connection.settimeout(KEEPALIVE_TIMEOUT)
+        super().handle_one_request()
+
+    def parse_request(self):
+        if not super().parse_request():
+          return False
+        # a client may take its time to read the response
+        self.connection.settimeout(None)
+        return True
 
     @trace
     def do_GET(self):
@@ -183,12 +590,81 @@ class CachingServerHttpHandler(BaseHTTPRequestHandler):
         '''
         # implement the logic to response a GET.
         # Remember to leverage the methods in CachingServer.
-        head, item = self.server.touchItem(self.path)
-        if item:
-          self.sendHeaders(head)
-          self.sendBody(item)
-        else:
+        byteRange = _parseRange(self.headers.get("Range"))
+        if byteRange is not None and byteRange[0] != 0 and not self.server.cached(self.path):
+          self.forwardRange()
+          return
+        head, item = self.server.touchItem(self.path, self.acceptEncoding(),
+                                           PEER_HEADER in self.headers)
+        if not item:
           self.send_error(HTTPStatus.NOT_FOUND)
+          return
+        try:
+          if byteRange is not None and self.rangeApplies(head):
+            self.sendRange(head, item, byteRange)
+          else:
+            self.sendHeaders(self.frameHeaders(head, item))
+            self.sendBody(item)
+        finally:
+          _closeBody(item)  # a fetch not sent to the end still finishes
+
+    def acceptEncoding(self) -> Optional[str]:
+        ''' Return the Accept-Encoding of the request. A range is always of
+        the plain body, so it is None for a range request.
+        '''
+        if "Range" in self.headers:
+          return None
+        return self.headers.get("Accept-Encoding")
+
+    def rangeApplies(self, headers) -> bool:
+        ''' Check the If-Range of the request against cached `headers` '''
+        condition = self.headers.get("If-Range")
+        if condition is None:
+          return True
+        validators = {name.lower(): value for name, value in headers}
+        return condition in (validators.get("etag"), validators.get("last-modified"))
+
+    def sendRange(self, headers, body, byteRange):
+        ''' Send the part of `body` in `byteRange` with 206 Partial Content,
+        or 416 if the range is out of the body. The whole body is sent if
+        its length is not known yet.
+        '''
+        length = _bodyLength(headers, body)
+        if length is None:
+          self.sendHeaders(self.frameHeaders(headers, body))
+          self.sendBody(body)
+          return
+        span = _resolveRange(byteRange, length)
+        if span is None:
+          _closeBody(body)  # a fetch of it still fills the cache
+          self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+          self.send_header("Content-Range", f"bytes */{length}")
+          self.send_header("Content-Length", "0")
+          self.end_headers()
+          return
+        start, stop = span
+        self.chunked = False
+        self.sendHeaders([header for header in headers
+                          if header[0].lower() != "content-length"] +
+                         [("Content-Range", f"bytes {start}-{stop - 1}/{length}"),
+                          ("Content-Length", str(stop - start))],
+                         HTTPStatus.PARTIAL_CONTENT)
+        self.sendBody(_sliceBody(body, start, stop))
+
+    def forwardRange(self):
+        ''' Relay the ranged response of main server without caching it '''
+        res = self.server.requestRange(self.path, self.headers["Range"])
+        if res is None:
+          self.send_error(HTTPStatus.BAD_GATEWAY)
+          return
+        complete = False
+        try:
+          head = self.server._filterHeaders(res.getheaders())
+          self.sendHeaders(self.frameHeaders(head, res), res.status)
+          self.sendBody(iter(lambda: res.read(self.server.chunkSize), b""))
+          complete = True
+        finally:
+          self.server.releaseMainServer(res, reusable=complete)
 
     @trace
     def do_HEAD(self):
@@ -198,11 +674,15 @@ class CachingServerHttpHandler(BaseHTTPRequestHandler):
         '''
         # implement the logic to response a HEAD.
         # Similar to do_GET()
-        head, item = self.server.touchItem(self.path)
-        if item:
-          self.sendHeaders(head)
-        else:
+        head, item = self.server.touchItem(self.path, self.acceptEncoding(),
+                                           PEER_HEADER in self.headers)
+        if not item:
           self.send_error(HTTPStatus.NOT_FOUND)
+          return
+        try:
+          self.sendHeaders(self.frameHeaders(head, item))
+        finally:
+          _closeBody(item)  # a fetch started by this request fills the cache
 
     def version_string(self):
         ''' Return the server software version string. '''
@@ -213,3 +693,99 @@ class CachingServerHttpHandler(BaseHTTPRequestHandler):
         info = f"[From {self.client_address[0]}:{self.client_address[1]}]"
         now = datetime.now().strftime("%Y/%m/%d-%H:%M:%S")
         sys.stdout.write(f"{now}| {info} {fmt % args}\n")
+
+
+class FileSlice(NamedTuple):
+    ''' `count` bytes of an open file from `offset`, to send with sendfile() '''
+    file: io.BufferedReader
+    offset: int
+    count: int
+
+
+def _parseRange(value: Optional[str]):
+    ''' Parse a Range header of a single byte range.
+    Return (first, last), last None for open ranges, or (None, n) for the
+    last n bytes. Return None if there is none, or it is invalid or has
+    many ranges, in which case the whole body is sent.
+    '''
+    if not value:
+        return None
+    unit, _, spec = value.partition("=")
+    first, sep, last = spec.strip().partition("-")
+    if unit.strip().lower() != "bytes" or not sep or "," in spec:
+        return None
+    if any(part and not part.isdigit() for part in (first, last)):
+        return None
+    if not first:
+        return (None, int(last)) if last else None
+    if last and int(last) < int(first):
+        return None
+    return int(first), int(last) if last else None
+
+
+def _resolveRange(byteRange, length: int):
+    ''' Return [start, stop) of `byteRange` in a body of `length` bytes, or
+    None if the range is not satisfiable.
+    '''
+    first, last = byteRange
+    if first is None:
+        return (max(0, length - last), length) if last > 0 and length > 0 else None
+    if first >= length:
+        return None
+    return first, length if last is None else min(last + 1, length)
+
+
+def _bodyLength(headers, body) -> Optional[int]:
+    ''' Return the length of `body` as returned by touchItem(), None if it
+    is still streaming and main server didn't tell.
+    '''
+    if isinstance(body, list):
+        return sum(os.fstat(b.fileno()).st_size if hasattr(b, "fileno") else len(b)
+                   for b in body)
+    for name, value in headers:
+        if name.lower() == "content-length" and value.isdigit():
+            return int(value)
+    return None
+
+
+def _sliceBody(body, start: int, stop: int):
+    ''' Yield the bytes in [start, stop) of `body` without copying them.
+    A streaming body is closed at the end, which lets its fetch finish.
+    '''
+    offset = 0
+    try:
+        for b in body:
+            if hasattr(b, "fileno"):
+                size = os.fstat(b.fileno()).st_size
+                if offset < stop and offset + size > start:
+                    lo = max(0, start - offset)
+                    yield FileSlice(b, lo, min(size, stop - offset) - lo)
+                else:
+                    b.close()
+            else:
+                size = len(b)
+                if offset < stop and offset + size > start:
+                    yield memoryview(b)[max(0, start - offset):stop - offset]
+            offset += size
+            if offset >= stop:
+                break
+    finally:
+        _closeBody(body)
+
+
+def _mergeHeaders(headers, updates):
+    ''' Return cached `headers` updated by the headers of a 304 response '''
+    updated = {name.lower(): (name, value) for name, value in updates
+               if name.lower() != "content-length"}
+    merged = [updated.pop(name.lower(), (name, value)) for name, value in headers]
+    return merged + list(updated.values())
+
+
+def _closeBody(body):
+    ''' Close a body returned by touchItem(), sent to the end or not '''
+    if isinstance(body, list):
+        for b in body:
+            if hasattr(b, "close"):
+                b.close()
+    elif hasattr(body, "close"):
+        body.close()
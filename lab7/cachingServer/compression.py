@@ -0,0 +1,80 @@
+''' Compression of cached bodies.
+
+CacheTable may store the bodies of text-like content gzipped, see
+compressible(). CachingServer sends such a body as it is to clients whose
+Accept-Encoding allows gzip, and decompresses it while sending for the
+others, see decompress().
+'''
+import zlib
+
+
+__all__ = ["compressible", "compress", "decompress", "acceptsGzip"]
+
+COMPRESS_LEVEL = 6  # zlib level, a balance of ratio and CPU time
+
+MIN_SIZE = 1024  # bytes. Smaller bodies gain too little
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript",
+                      "application/xml", "application/x-javascript", "image/svg+xml")
+
+GZIP_WBITS = 16 + zlib.MAX_WBITS  # gzip header and trailer
+
+
+def compressible(headers, size: int) -> bool:
+    ''' Check if a body of `size` bytes with `headers` is worth compressing.
+    Bodies already encoded, or whose transformation is forbidden, are not.
+    '''
+    fields = {name.lower(): value.lower() for name, value in headers}
+    if size < MIN_SIZE or fields.get("content-encoding", "identity") != "identity":
+        return False
+    if "no-transform" in fields.get("cache-control", "") or "content-range" in fields:
+        return False
+    contentType = fields.get("content-type", "").split(";")[0].strip()
+    return contentType.startswith(COMPRESSIBLE_TYPES) or \
+        contentType.endswith(("+xml", "+json"))
+
+
+def compress(body, level: int = COMPRESS_LEVEL) -> bytes:
+    ''' Return `body` in gzip format '''
+    compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+    return compressor.compress(body) + compressor.flush()
+
+
+def decompress(body, size: int):
+    ''' Yield the gzipped `body` decompressed, in chunks of up to `size`
+    bytes, so that a large body is never inflated at once.
+    '''
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+    with memoryview(body) as view:
+        for offset in range(0, len(view), size):
+            data = view[offset:offset + size]
+            while data:
+                chunk = decompressor.decompress(data, size)
+                data = decompressor.unconsumed_tail
+                if chunk:
+                    yield chunk
+    rest = decompressor.flush()
+    if rest:
+        yield rest
+
+
+def acceptsGzip(value) -> bool:
+    ''' Check if an Accept-Encoding header `value` allows gzip '''
+    if not value:
+        return False
+    qualities = {}
+    for coding in value.split(","):
+        name, _, params = coding.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, number = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        qualities[name.strip().lower()] = q
+    for name in ("gzip", "x-gzip", "*"):
+        if name in qualities:
+            return qualities[name] > 0
+    return False
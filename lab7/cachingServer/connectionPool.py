@@ -0,0 +1,107 @@
+''' Pool of persistent HTTP connections to a server.
+
+ConnectionPool lends HTTPConnections to the threads fetching from a server
+and takes them back once the response has been read, so that later requests
+skip the TCP handshake. Connections the server will close, or has closed
+while they were idle, are not reused.
+'''
+import time
+import select
+import threading
+from http.client import HTTPConnection, HTTPResponse, HTTPException
+
+
+__all__ = ["ConnectionPool"]
+
+
+class ConnectionPool:
+    ''' Persistent connections to one server.
+
+    Example:
+        >>> pool = ConnectionPool("localhost:8000")
+        >>> res = pool.request("GET", "/index.html")
+        >>> body = res.read()
+        >>> pool.release(res)
+    '''
+    def __init__(self, address: str, maxIdle: int = 8, idleTimeout: float = 30):
+        ''' Params:
+            address: host and port of the server, e.g. localhost:8000
+            maxIdle: idle connections to keep at most
+            idleTimeout: seconds before an idle connection is closed
+        '''
+        self.address = address
+        self.maxIdle = maxIdle
+        self.idleTimeout = idleTimeout
+        self.idle = []  # stack of (HTTPConnection, time it became idle)
+        self.lent = {}  # HTTPResponse -> HTTPConnection
+        self.lock = threading.Lock()
+        self.connects = 0
+        self.reuses = 0
+
+    def _healthy(self, conn: HTTPConnection, since: float) -> bool:
+        ''' Check that an idle connection is still usable. A socket readable
+        while idle has been closed by the server, or is out of sync.
+        '''
+        if conn.sock is None or time.monotonic() - since > self.idleTimeout:
+            return False
+        readable, _, _ = select.select([conn.sock], [], [], 0)
+        return not readable
+
+    def acquire(self) -> HTTPConnection:
+        ''' Return an idle connection, or a new one if none is healthy '''
+        with self.lock:
+            while self.idle:
+                conn, since = self.idle.pop()
+                if self._healthy(conn, since):
+                    self.reuses += 1
+                    return conn
+                conn.close()
+            self.connects += 1
+        return HTTPConnection(self.address)
+
+    def request(self, method: str, path: str, headers: dict = None) -> HTTPResponse:
+        ''' Send a request and return its response. The response must be
+        given back with release() once it is read.
+        A reused connection found broken is replaced once.
+        '''
+        while True:
+            conn = self.acquire()
+            fresh = conn.sock is None
+            try:
+                conn.request(method, path, headers=headers or {})
+                response = conn.getresponse()
+            except (ConnectionError, HTTPException):
+                conn.close()
+                if fresh:
+                    raise
+                continue
+            with self.lock:
+                self.lent[response] = conn
+            return response
+
+    def release(self, response: HTTPResponse, reusable: bool = True):
+        ''' Take back the connection of `response`. It is kept if `reusable`,
+        the response has been read to the end and the server keeps it open.
+        '''
+        with self.lock:
+            conn = self.lent.pop(response, None)
+            if conn is None:
+                return
+            if reusable and response.isclosed() and not response.will_close \
+                    and conn.sock is not None and len(self.idle) < self.maxIdle:
+                self.idle.append((conn, time.monotonic()))
+                return
+        response.close()
+        conn.close()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"idle": len(self.idle), "lent": len(self.lent),
+                    "connects": self.connects, "reuses": self.reuses}
+
+    def close(self):
+        ''' Close the idle connections '''
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn, _ in idle:
+            conn.close()
@@ -0,0 +1,229 @@
+''' Disk tier of CacheTable.
+
+DiskCache keeps large bodies in files under a directory, one file per key,
+and serves them back as open files, to be sent with sendfile(), or as
+read-only memory maps. An append-only journal
+records which keys are stored together with their headers, timestamps and
+expiration times, so the cache is still warm after a restart.
+
+DiskCache is not thread-safe by itself. CacheTable calls it while holding
+its lock, except for write(), which only touches a fresh temporary file.
+
+The cache lives in its own subdirectory, SUBDIR, of the directory it is
+given, so that it can share a directory with other files. Startup only
+deletes files of the cache no record refers to.
+
+Layout of the subdirectory:
+    index.log: journal, one JSON record per line
+    <sha1 of key>: body of key
+    <TMP_PREFIX>*.tmp: files being written
+'''
+import os
+import re
+import json
+import mmap
+import stat
+import hashlib
+import tempfile
+
+from .evictionPolicy import LRUPolicy
+
+
+__all__ = ["DiskEntry", "DiskCache"]
+
+SUBDIR = "cdn-cache"
+
+JOURNAL = "index.log"
+
+TMP_PREFIX = "partial-"
+
+BODY_NAME = re.compile(r"[0-9a-f]{40}")  # sha1 hex digest
+
+
+class DiskEntry:
+    ''' What the index knows about a stored body '''
+    __slots__ = ('headers', 'timestamp', 'size', 'expires', 'encoding')
+
+    def __init__(self, headers: list, timestamp: float, size: int, expires=None,
+                 encoding=None):
+        self.headers = headers
+        self.timestamp = timestamp
+        self.size = size
+        self.expires = expires  # time to expire. None for never
+        self.encoding = encoding  # "gzip" if the body is compressed
+
+
+class DiskCache:
+    ''' A directory of cached bodies bounded by their total bytes.
+
+    Example:
+        >>> dc = DiskCache("/var/cache/cdn")  # in /var/cache/cdn/cdn-cache
+        >>> tmp = dc.write(body)
+        >>> dc.commit(path, tmp, headers, timestamp, expires)
+        >>> file = dc.open(path)
+        >>> body = dc.mapFile(file)  # mmap
+    '''
+    def __init__(self, directory: str, capacity: int = -1, minSize: int = 0):
+        ''' Open or create a disk cache in SUBDIR of `directory`.
+        Params:
+            capacity: bytes of bodies to keep. Negative for no limit.
+            minSize: bodies smaller than this are not worth a file.
+        '''
+        self.directory = os.path.join(directory, SUBDIR)
+        self.capacity = capacity
+        self.minSize = minSize
+        self.index = {}  # key -> DiskEntry
+        self.policy = LRUPolicy()
+        self.bytes = 0
+        self.evictions = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+        self._compact()
+        self._clean()
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def _load(self):
+        ''' Replay the journal. Records of missing files are dropped. '''
+        try:
+            journal = open(os.path.join(self.directory, JOURNAL))
+        except FileNotFoundError:
+            return
+        with journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn write of the last line
+                key = record["key"]
+                if key in self.index:
+                    self._drop(key)
+                if record["op"] == "put" and os.path.exists(self._path(key)):
+                    headers = [tuple(header) for header in record["headers"]]
+                    self._add(key, DiskEntry(headers, record["timestamp"], record["size"],
+                                             record.get("expires"), record.get("encoding")))
+
+    def _compact(self):
+        ''' Rewrite the journal with the live records only. '''
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=TMP_PREFIX, suffix=".tmp")
+        with os.fdopen(fd, "w") as journal:
+            for key, entry in self.index.items():
+                journal.write(self._record("put", key, entry))
+        os.replace(tmp, os.path.join(self.directory, JOURNAL))
+        self.journal = open(os.path.join(self.directory, JOURNAL), "a")
+        self.records = len(self.index)
+
+    def _clean(self):
+        ''' Delete the files of the cache no record refers to, e.g. left by a
+        crash. Other files are left alone.
+        '''
+        live = {os.path.basename(self._path(key)) for key in self.index}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                name = entry.name
+                ours = BODY_NAME.fullmatch(name) or \
+                    (name.startswith(TMP_PREFIX) and name.endswith(".tmp"))
+                if ours and name not in live and \
+                        stat.S_ISREG(entry.stat(follow_symlinks=False).st_mode):
+                    os.unlink(entry.path)
+
+    def _record(self, op: str, key: str, entry: DiskEntry = None) -> str:
+        record = {"op": op, "key": key}
+        if entry is not None:
+            record.update(headers=entry.headers, timestamp=entry.timestamp,
+                          size=entry.size, expires=entry.expires,
+                          encoding=entry.encoding)
+        return json.dumps(record) + "\n"
+
+    def _log(self, op: str, key: str, entry: DiskEntry = None):
+        self.journal.write(self._record(op, key, entry))
+        self.journal.flush()
+        self.records += 1
+        if self.records > 4 * len(self.index) + 1024:
+            self.journal.close()
+            self._compact()
+
+    def _add(self, key: str, entry: DiskEntry):
+        self.index[key] = entry
+        self.policy.insert(key)
+        self.bytes += entry.size
+
+    def _drop(self, key: str):
+        entry = self.index.pop(key)
+        self.policy.remove(key)
+        self.bytes -= entry.size
+
+    def write(self, body) -> str:
+        ''' Write `body` to a temporary file and return its path. Pass the
+        path to commit() or discard().
+        '''
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=TMP_PREFIX, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(body)
+        return tmp
+
+    def discard(self, tmp: str):
+        os.unlink(tmp)
+
+    def commit(self, key: str, tmp: str, headers: list, timestamp: float,
+               expires: float = None, encoding: str = None) -> DiskEntry:
+        ''' Store the file written by write() as the body of `key`,
+        compressed with `encoding` if not None.
+        '''
+        size = os.path.getsize(tmp)
+        if key in self.index:
+            self._drop(key)
+        os.replace(tmp, self._path(key))
+        entry = DiskEntry(headers, timestamp, size, expires, encoding)
+        self._add(key, entry)
+        self._log("put", key, entry)
+        self._evict()
+        return entry
+
+    def refresh(self, key: str, headers: list, timestamp: float,
+                expires: float = None) -> DiskEntry:
+        ''' Update what the index knows about the body of `key` '''
+        entry = self.index[key]
+        entry.headers, entry.timestamp, entry.expires = headers, timestamp, expires
+        self._log("put", key, entry)
+        return entry
+
+    def remove(self, key: str):
+        ''' Remove `key` if it is stored '''
+        if key not in self.index:
+            return
+        self._drop(key)
+        os.unlink(self._path(key))
+        self._log("del", key)
+
+    def _evict(self):
+        while self.capacity >= 0 and self.bytes > self.capacity and self.index:
+            self.remove(next(self.policy.victims()))
+            self.evictions += 1
+
+    def entry(self, key: str) -> DiskEntry:
+        return self.index[key]
+
+    def open(self, key: str):
+        ''' Open the body of `key` and count it as a use.
+        The file stays readable even if the key is removed meanwhile.
+        '''
+        self.policy.access(key)
+        return open(self._path(key), "rb")
+
+    @staticmethod
+    def mapFile(file):
+        ''' Map a file returned by open() into memory '''
+        if os.fstat(file.fileno()).st_size == 0:
+            return b""  # an empty file cannot be mapped
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        self.journal.close()
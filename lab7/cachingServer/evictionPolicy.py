@@ -0,0 +1,171 @@
+''' Eviction policies used by CacheTable.
+
+A policy only orders keys; CacheTable does the byte accounting and asks the
+policy for victims when it is over capacity.
+
+Every policy implements:
+    insert(key): a new key is stored
+    access(key): a stored key is read
+    remove(key): a key left the table
+    victims(): iterate keys, the one to evict first coming first. The
+        iterator is lazy, so call victims() again after removing a key.
+'''
+import random
+from collections import OrderedDict
+
+
+__all__ = ["LRUPolicy", "LFUPolicy", "TinyLFUPolicy", "POLICIES"]
+
+
+class LRUPolicy:
+    ''' Evict the least recently used key '''
+    def __init__(self):
+        self.order = OrderedDict()
+
+    def insert(self, key):
+        self.order[key] = None
+
+    def access(self, key):
+        self.order.move_to_end(key)
+
+    def remove(self, key):
+        self.order.pop(key, None)
+
+    def victims(self):
+        return iter(self.order)
+
+
+class LFUPolicy:
+    ''' Evict the least frequently used key, the least recent one on ties '''
+    def __init__(self):
+        self.freq = {}  # key -> number of uses
+        self.buckets = {}  # number of uses -> OrderedDict of keys
+
+    def _place(self, key, freq):
+        self.freq[key] = freq
+        self.buckets.setdefault(freq, OrderedDict())[key] = None
+
+    def _unplace(self, key):
+        freq = self.freq.pop(key)
+        bucket = self.buckets[freq]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[freq]
+        return freq
+
+    def insert(self, key):
+        if key in self.freq:
+            self._unplace(key)
+        self._place(key, 1)
+
+    def access(self, key):
+        self._place(key, self._unplace(key) + 1)
+
+    def remove(self, key):
+        if key in self.freq:
+            self._unplace(key)
+
+    def victims(self):
+        for freq in sorted(self.buckets):
+            yield from self.buckets[freq]
+
+
+class CountMinSketch:
+    ''' Approximate use counts of keys in fixed memory, halved periodically
+    so that old popularity fades.
+    '''
+    DEPTH = 4
+    MAX_COUNT = 15
+
+    def __init__(self, width=4096):
+        self.width = width
+        self.rows = [[0] * width for _ in range(self.DEPTH)]
+        self.seeds = [random.getrandbits(32) for _ in range(self.DEPTH)]
+        self.additions = 0
+        self.sampleSize = 10 * width
+
+    def _cells(self, key):
+        for row, seed in zip(self.rows, self.seeds):
+            yield row, hash((seed, key)) % self.width
+
+    def add(self, key):
+        for row, i in self._cells(key):
+            if row[i] < self.MAX_COUNT:
+                row[i] += 1
+        self.additions += 1
+        if self.additions >= self.sampleSize:
+            self.rows = [[count // 2 for count in row] for row in self.rows]
+            self.additions //= 2
+
+    def estimate(self, key):
+        return min(row[i] for row, i in self._cells(key))
+
+
+class TinyLFUPolicy:
+    ''' A W-TinyLFU policy.
+
+    New keys enter a small LRU window. Keys pushed out of the window join
+    the probation segment of a segmented LRU, and a second use promotes them
+    to the protected segment. When something must go, the oldest window key
+    competes with the oldest probation key, and the one a count-min sketch
+    estimates to be used less often is evicted.
+    '''
+    WINDOW_RATIO = 0.01
+    PROTECTED_RATIO = 0.8
+
+    def __init__(self, sketchWidth=4096):
+        self.window = OrderedDict()
+        self.probation = OrderedDict()
+        self.protected = OrderedDict()
+        self.sketch = CountMinSketch(sketchWidth)
+
+    def __len__(self):
+        return len(self.window) + len(self.probation) + len(self.protected)
+
+    def insert(self, key):
+        self.remove(key)
+        self.sketch.add(key)
+        self.window[key] = None
+        if len(self.window) > max(1, int(len(self) * self.WINDOW_RATIO)):
+            candidate, _ = self.window.popitem(last=False)
+            self.probation[candidate] = None
+
+    def access(self, key):
+        self.sketch.add(key)
+        if key in self.window:
+            self.window.move_to_end(key)
+        elif key in self.probation:
+            del self.probation[key]
+            self.protected[key] = None
+            mainSize = len(self.probation) + len(self.protected)
+            if len(self.protected) > max(1, int(mainSize * self.PROTECTED_RATIO)):
+                demoted, _ = self.protected.popitem(last=False)
+                self.probation[demoted] = None
+        else:
+            self.protected.move_to_end(key)
+
+    def remove(self, key):
+        for segment in (self.window, self.probation, self.protected):
+            segment.pop(key, None)
+
+    def victims(self):
+        candidate = next(iter(self.window), None)
+        victim = next(iter(self.probation or self.protected), None)
+        first = None
+        if candidate is not None and victim is not None:
+            if self.sketch.estimate(candidate) > self.sketch.estimate(victim):
+                first = victim
+            else:
+                first = candidate
+            yield first
+        for segment in (self.window, self.probation, self.protected):
+            for key in segment:
+                if key != first:
+                    yield key
+
+
+POLICIES = {
+    "lru": LRUPolicy,
+    "lfu": LFUPolicy,
+    "tinylfu": TinyLFUPolicy,
+}
@@ -0,0 +1,63 @@
+''' Consistent hashing of paths to the caching servers of a cluster.
+
+Every server of the cluster is placed at many points, its virtual nodes, on
+a ring of hash values. A path belongs to the server at the first point after
+the hash of the path. Adding or removing a server only moves the paths next
+to its points, and the virtual nodes spread the paths evenly.
+'''
+import bisect
+import hashlib
+
+
+__all__ = ["HashRing"]
+
+VIRTUAL_NODES = 100  # points of each server on the ring
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    ''' A ring of servers to find the owner of a path.
+
+    Example:
+        >>> ring = HashRing(["10.0.0.1:1222", "10.0.0.2:1222"])
+        >>> ring.owner("/index.html")
+        '10.0.0.2:1222'
+    '''
+    def __init__(self, nodes=(), replicas: int = VIRTUAL_NODES):
+        ''' Params:
+            nodes: addresses of the servers
+            replicas: virtual nodes of each server
+        '''
+        self.replicas = replicas
+        self.nodes = set()
+        self.points = []  # sorted hashes of the virtual nodes
+        self.owners = []  # server of each point
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def _build(self):
+        ring = sorted((_hash(f"{node}#{i}"), node)
+                      for node in self.nodes for i in range(self.replicas))
+        self.points = [point for point, _ in ring]
+        self.owners = [node for _, node in ring]
+
+    def add(self, node: str):
+        self.nodes.add(node)
+        self._build()
+
+    def remove(self, node: str):
+        self.nodes.discard(node)
+        self._build()
+
+    def owner(self, key: str):
+        ''' Return the server owning `key`, None if the ring is empty '''
+        if not self.points:
+            return None
+        i = bisect.bisect(self.points, _hash(key)) % len(self.points)
+        return self.owners[i]
@@ -0,0 +1,115 @@
+''' Warm-up of the cache.
+
+Prefetcher fetches a list of paths into the cache of a CachingServer, with a
+few threads, until a byte budget is reached, so that the first clients after
+a restart do not all miss.
+
+The paths come from readPaths(), which reads a manifest, one path per line,
+or the request log the server writes to stdout, or a mix of both. Paths
+requested more often in the log are fetched first. In a cluster, each server
+fetches only the paths it owns.
+'''
+import re
+import threading
+from collections import Counter
+from http.client import HTTPException
+
+
+__all__ = ["Prefetcher", "readPaths"]
+
+# a request line logged by log_message(), e.g.
+# 2021/01/01-00:00:00| [From 127.0.0.1:50000] "GET /index.html HTTP/1.1" 200 -
+LOG_PATTERN = re.compile(r'\] "(?:GET|HEAD) (\S+) HTTP/[\d.]+" (\d{3})')
+
+CACHEABLE_STATUS = {"200", "206", "304"}
+
+
+def readPaths(lines) -> list:
+    ''' Return the paths in `lines` of a manifest or a request log, the most
+    requested first, then in the order they appear.
+    Blank lines, comments starting with "#" and failed requests are skipped.
+    '''
+    counts = Counter()
+    for line in lines:
+        line = line.strip()
+        match = LOG_PATTERN.search(line)
+        if match:
+            if match.group(2) in CACHEABLE_STATUS:
+                counts[match.group(1)] += 1
+        elif line.startswith("/"):
+            counts[line.split()[0]] += 1
+    # Counter keeps insertion order, and sorted() is stable
+    return sorted(counts, key=lambda path: -counts[path])
+
+
+class Prefetcher:
+    ''' Fetch paths into the cache of a server.
+
+    Example:
+        >>> with open("paths.txt") as f:
+        >>>     prefetcher = Prefetcher(server, readPaths(f), budget=1 << 30)
+        >>> prefetcher.start()  # or run() to wait for it
+    '''
+    def __init__(self, server, paths: list, workers: int = 8, budget: int = -1):
+        ''' Params:
+            server: CachingServer to fill
+            paths: paths to fetch, in order
+            workers: fetches to run at a time
+            budget: bytes to fetch at most. Negative for no limit. Fetches
+                running when it is reached still finish.
+        '''
+        self.server = server
+        self.paths = iter(paths)
+        self.workers = workers
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.fetched = 0  # paths fetched
+        self.bytes = 0  # bytes fetched
+        self.skipped = 0  # paths already cached, or of another server
+        self.failed = 0
+        self.thread = None
+
+    def _next(self):
+        ''' Return the next path to fetch, or None to stop '''
+        with self.lock:
+            if 0 <= self.budget <= self.bytes:
+                return None
+            return next(self.paths, None)
+
+    def _work(self):
+        while True:
+            path = self._next()
+            if path is None:
+                return
+            if not self.server.owns(path) or self.server.cached(path):
+                size = 0  # the owner of the path fetches it in a cluster
+            else:
+                try:
+                    size = self.server.prefetchItem(path)
+                except (OSError, ValueError, HTTPException) as e:
+                    self.server.log_error(f"Cannot prefetch '{path}': {e}")
+                    size = None
+            with self.lock:
+                if size is None:
+                    self.failed += 1
+                elif size == 0:
+                    self.skipped += 1
+                else:
+                    self.fetched += 1
+                    self.bytes += size
+
+    def run(self):
+        ''' Fetch the paths and wait until it is done '''
+        threads = [threading.Thread(target=self._work, name=f"Prefetcher-{i}", daemon=True)
+                   for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.server.log_info(f"Prefetched {self.fetched} paths, {self.bytes} bytes, "
+                             f"{self.skipped} skipped, {self.failed} failed")
+
+    def start(self):
+        ''' Fetch the paths on a background thread '''
+        self.thread = threading.Thread(target=self.run, name="Prefetcher", daemon=True)
+        self.thread.start()
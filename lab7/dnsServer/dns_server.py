@@ -3,27 +3,200 @@
 
 import random
 import sys
+import time
+import socket
+import asyncio
+import traceback
+import functools
 from socketserver import UDPServer, BaseRequestHandler
 from utils.dns_utils import DNS_Request, DNS_Rcode
 from utils.ip_utils import IP_Utils
 from datetime import datetime
 import math
-from itertools import zip_longest
 
 import re
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 
 
-__all__ = ["DNSServer", "DNSHandler"]
+__all__ = ["DNSServer", "AsyncDNSServer", "DNSHandler", "ZoneIndex", "ResponseCache"]
+
+RESPONSE_CACHE_SIZE = 4096
+
+RESPONSE_CACHE_TTL = 30  # seconds
+
+NEAREST_CACHE_SIZE = 65536  # (client ip, record) pairs
+
+EARTH_RADIUS = 6371  # km
 
 DNS_Record = namedtuple('DNS_Record', ['domain', 'type', 'value'])
 
-class DNSServer(UDPServer):
-    def __init__(self, server_address, dns_file, RequestHandlerClass, bind_and_activate=True):
-        super().__init__(server_address, RequestHandlerClass, bind_and_activate)
+
+def locate(ip):
+    ''' Location of `ip`, or None if it is not in the database '''
+    try:
+        return IP_Utils.getIpLocation(ip)
+    except ValueError:
+        return None
+
+
+def great_circle_distance(pointA, pointB):
+    ''' Distance in km between two (latitude, longitude) points '''
+    latA, lonA, latB, lonB = map(math.radians, (*pointA, *pointB))
+    h = math.sin((latB - latA) / 2) ** 2 \
+        + math.cos(latA) * math.cos(latB) * math.sin((lonB - lonA) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(min(1, math.sqrt(h)))
+
+
+class _ZoneNode:
+    ''' A node of the wildcard trie in ZoneIndex '''
+    __slots__ = ("children", "index")
+
+    def __init__(self):
+        self.children = {}  # label -> _ZoneNode
+        self.index = None  # position of the first record ending here
+
+
+class ZoneIndex:
+    ''' An index over DNS records for lookups in O(labels).
+
+    Names are compared label by label from the left, where a `*` label in a
+    record matches any one label and trailing dots are optional. Records
+    without `*` go to a dict keyed on their labels, the others to a label
+    trie. Both keep each record's position in the zone file, so the first
+    matching record still wins.
+
+    Example:
+        >>> zone = ZoneIndex(records)
+        >>> record = zone.search("home.nasa.org.")
+    '''
+    def __init__(self, records=()):
+        self.records = []
+        self.exact = {}  # labels -> position of the first record
+        self.wildcard = _ZoneNode()
+        for record in records:
+            self.add(record)
+
+    @staticmethod
+    def labels(name):
+        ''' Split `name` into labels, dropping the trailing empty ones '''
+        labels = name.split('.')
+        while labels and not labels[-1]:
+            labels.pop()
+        return tuple(labels)
+
+    def add(self, record):
+        ''' Append `record`. Earlier records take precedence. '''
+        index = len(self.records)
+        self.records.append(record)
+        labels = self.labels(record.domain)
+        if '*' not in labels:
+            self.exact.setdefault(labels, index)
+            return
+        node = self.wildcard
+        for label in labels:
+            node = node.children.setdefault(label, _ZoneNode())
+        if node.index is None:
+            node.index = index
+
+    def search(self, name):
+        ''' Return the first record matching `name`, or None. '''
+        labels = self.labels(name)
+        found = [self.exact.get(labels), self._search(self.wildcard, labels, 0)]
+        found = [index for index in found if index is not None]
+        return self.records[min(found)] if found else None
+
+    def _search(self, node, labels, depth):
+        if depth == len(labels):
+            # a record may be longer than the name if the rest is `*` or empty
+            found = [node.index]
+            nexts = ('*', '')
+        else:
+            found = []
+            nexts = {labels[depth], '*'}
+            depth += 1
+        for label in nexts:
+            child = node.children.get(label)
+            if child is not None:
+                found.append(self._search(child, labels, depth))
+        found = [index for index in found if index is not None]
+        return min(found) if found else None
+
+class ResponseCache:
+    ''' A bounded LRU cache of packed DNS responses.
+
+    Keys are (qname, client location) pairs and values are the wire bytes of
+    the response. An entry expires `ttl` seconds after it was stored.
+
+    Example:
+        >>> cache = ResponseCache()
+        >>> cache.put(("home.nasa.org.", (20, 0)), raw_data)
+        >>> raw_data = cache.get(("home.nasa.org.", (20, 0)))
+    '''
+    def __init__(self, capacity=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.data = OrderedDict()  # key -> (expire time, raw data)
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        ''' Return the raw response of `key`, or None if absent or expired. '''
+        entry = self.data.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            del self.data[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.data.move_to_end(key)
+        return entry[1]
+
+    def put(self, key, raw_data):
+        ''' Store `raw_data`, evicting the least recently used entry if full. '''
+        self.data[key] = (time.monotonic() + self.ttl, raw_data)
+        self.data.move_to_end(key)
+        if len(self.data) > self.capacity:
+            self.data.popitem(last=False)
+
+
+class DNSTableMixIn:
+    ''' Loads the dns table and the per-server state used by DNSHandler.
+    Shared by DNSServer and AsyncDNSServer.
+    '''
+    def load_dns_file(self, dns_file):
         self._dns_table = []
         self.parse_dns_file(dns_file)
-        
+        self.locate_servers()
+
+    def locate_servers(self):
+        ''' Look up the server locations once per A record, and start over
+        the caches of the answers, which depend on them and on the zone.
+        '''
+        self.locations_generation = IP_Utils.generation
+        self.response_cache = ResponseCache()
+        self.server_locations = {
+            record: [(ip, location) for ip, location in zip(record.value, map(locate, record.value))
+                     if location is not None]
+            for record in self._dns_table if record.type == 'A'
+        }
+        self.nearest_server = functools.lru_cache(maxsize=NEAREST_CACHE_SIZE)(self._nearest_server)
+
+    def check_locations(self):
+        ''' Call locate_servers() if the location database changed since '''
+        if self.locations_generation != IP_Utils.generation:
+            self.locate_servers()
+
+    def _nearest_server(self, client_ip, record):
+        ''' The server of A `record` closest to `client_ip`.
+        None if either the client or all the servers have no known location.
+        Called through self.nearest_server, which memoizes the answers.
+        '''
+        src = locate(client_ip)
+        candidates = self.server_locations[record]
+        if src is None or not candidates:
+            return None
+        return min(candidates, key=lambda candidate: great_circle_distance(src, candidate[1]))[0]
+
     def parse_dns_file(self, dns_file):
       # ---------------------------------------------------
       # your codes here. Parse the dns_table.txt file
@@ -35,12 +208,74 @@ class DNSServer(UDPServer):
           if record[1] == 'CNAME':
             self._dns_table.append(DNS_Record(record[0], record[1], record[2]))
           else:
-            self._dns_table.append(DNS_Record(record[0], record[1], record[2:]))
+            self._dns_table.append(DNS_Record(record[0], record[1], tuple(record[2:])))
+      self._zone = ZoneIndex(self._dns_table)
 
     @property
     def table(self):
         return self._dns_table
 
+    @property
+    def zone(self):
+        return self._zone
+
+
+class DNSServer(DNSTableMixIn, UDPServer):
+    def __init__(self, server_address, dns_file, RequestHandlerClass, bind_and_activate=True):
+        super().__init__(server_address, RequestHandlerClass, bind_and_activate)
+        self.load_dns_file(dns_file)
+
+
+class AsyncDNSServer(DNSTableMixIn, asyncio.DatagramProtocol):
+    ''' An asyncio front-end serving the same DNSHandler as DNSServer.
+
+    Each datagram is handed to RequestHandlerClass with the transport in
+    place of the socket, so the handler runs unchanged on the event loop.
+
+    Example:
+        >>> asyncio.run(AsyncDNSServer.serve(("", 9999), dns_file, DNSHandler))
+    '''
+    def __init__(self, server_address, dns_file, RequestHandlerClass):
+        self.server_address = server_address
+        self.RequestHandlerClass = RequestHandlerClass
+        self.transport = None
+        self.load_dns_file(dns_file)
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.server_address = transport.get_extra_info("sockname")
+
+    def datagram_received(self, data, client_address):
+        try:
+            self.RequestHandlerClass((data, self.transport), client_address, self)
+        except Exception:
+            print('-'*40, file=sys.stderr)
+            print(f"Exception occurred during processing of request from {client_address}",
+                  file=sys.stderr)
+            traceback.print_exc()
+            print('-'*40, file=sys.stderr)
+
+    @classmethod
+    async def serve(cls, server_address, dns_file, RequestHandlerClass, reuse_port=False):
+        ''' Serve forever on `server_address`.
+        Params:
+            reuse_port: set SO_REUSEPORT so several processes can serve the
+                same address and let the kernel spread datagrams over them.
+        '''
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(server_address)
+        loop = asyncio.get_running_loop()
+        transport, server = await loop.create_datagram_endpoint(
+            lambda: cls(server_address, dns_file, RequestHandlerClass), sock=sock)
+        print(f"DNS server serving on {server.server_address[0]}:"
+              f"{server.server_address[1]}", flush=True)
+        try:
+            await loop.create_future()
+        finally:
+            transport.close()
+
 
 class DNSHandler(BaseRequestHandler):
     """
@@ -61,15 +296,21 @@ class DNSHandler(BaseRequestHandler):
     """
     
     def __init__(self, request, client_address, server):
+        server.check_locations()
         self.table = server.table
+        self.zone = server.zone
+        self.response_cache = server.response_cache
+        self.nearest_server = server.nearest_server
         super().__init__(request, client_address, server)
 
     def calc_distance(self, pointA, pointB):
-        ''' calculate distance between two points '''
-        return math.sqrt((pointA[0] - pointB[0]) ** 2 + (pointA[1] - pointB[1]) ** 2)
+        ''' calculate great-circle distance between two points '''
+        return great_circle_distance(pointA, pointB)
 
-    def match(self, name, domain):
-      return all(y == '*' or x == y or (not x and not y) for x, y in zip_longest(name.split('.'), domain.split('.')))
+    def client_location(self):
+        ''' Location of the client, or None if it is not in the database '''
+        client_ip, _ = self.client_address
+        return locate(client_ip)
 
     def get_response(self, request_domain_name):
         response_type, response_val = (None, None)
@@ -78,18 +319,16 @@ class DNSHandler(BaseRequestHandler):
         # Determine an IP to response according to the client's IP address.
         #       set "response_ip" to "the best IP address".
         client_ip, _ = self.client_address
-        for domain, type, value in self.table:
-          if self.match(request_domain_name, domain):
-            response_type = type
-            if type == 'CNAME':
-              response_val = value
-            else:
-              src = IP_Utils.getIpLocation(client_ip)
-              if src:
-                response_val = min(value, key=lambda ip: self.calc_distance(src, IP_Utils.getIpLocation(ip)))
-              else:
-                response_val = random.choice(value)
-            break
+        record = self.zone.search(request_domain_name)
+        if record is not None:
+          _, type, value = record
+          response_type = type
+          if type == 'CNAME':
+            response_val = value
+          else:
+            response_val = self.nearest_server(client_ip, record)
+            if response_val is None:
+              response_val = random.choice(value)
         # -------------------------------------------------
         return (response_type, response_val)
 
@@ -103,31 +342,40 @@ class DNSHandler(BaseRequestHandler):
         ## read client-side ip address and udp port.
         client_ip, client_port = self.client_address
 
-        ## check dns format.
-        valid = DNS_Request.check_valid_format(udp_data)
-        if valid:
-            ## decode request into dns object and read domain_name property.
-            dns_request = DNS_Request(udp_data)
+        ## check dns format and decode request into dns object.
+        dns_request = DNS_Request.parse(udp_data)
+        if dns_request is not None:
+            ## read domain_name property.
             request_domain_name = str(dns_request.domain_name)
             self.log_info(f"Receving DNS request from '{client_ip}' asking for "
                           f"'{request_domain_name}'")
 
-            # get caching server address
-            response = self.get_response(request_domain_name)
+            # answers depend only on the name and the client's location,
+            # so responses are cached on both with the transaction id patched in
+            location = self.client_location()
+            key = (request_domain_name, location)
+            raw_data = self.response_cache.get(key)
+            if raw_data is None:
+                # get caching server address
+                response = self.get_response(request_domain_name)
 
-            # response to client with response_ip
-            if None not in response:
-                dns_response = dns_request.generate_response(response)
-            else:
-                dns_response = DNS_Request.generate_error_response(
-                                             error_code=DNS_Rcode.NXDomain)
+                # response to client with response_ip
+                if None not in response:
+                    dns_response = dns_request.generate_response(response)
+                else:
+                    dns_response = DNS_Request.generate_error_response(
+                                                 error_code=DNS_Rcode.NXDomain)
+                raw_data = dns_response.raw_data
+                if location is not None:
+                    self.response_cache.put(key, raw_data)
+            raw_data = udp_data[:2] + raw_data[2:]
         else:
             self.log_error(f"Receiving invalid dns request from "
                            f"'{client_ip}:{client_port}'")
-            dns_response = DNS_Request.generate_error_response(
-                                         error_code=DNS_Rcode.FormErr)
+            raw_data = DNS_Request.generate_error_response(
+                                      error_code=DNS_Rcode.FormErr).raw_data
 
-        socket.sendto(dns_response.raw_data, self.client_address)
+        socket.sendto(raw_data, self.client_address)
 
     def log_info(self, msg):
         self._logMsg("Info", msg)
@@ -8,17 +8,72 @@ Command line arguments:
     [port]: port number, default: 1222.
             Notice that if you run the program not in root, the port number
             should be greater than 1024.
+    --engine: how clients are served, one of
+              single (default), threading, pool, asyncio.
+    --workers: number of threads of the pool engine.
+    --cache-size: bytes of content to cache, default: 256 MB. Negative for
+                  no limit.
+    --cache-policy: how cached content is evicted, one of
+                    lru (default), lfu, tinylfu.
+    --cache-dir: directory to keep large content in, so that it survives
+                 restarts, in its subdirectory cdn-cache. Memory only if not
+                 given.
+    --disk-size: bytes of content to keep in --cache-dir, default: 4 GB.
+    --chunk-size: bytes of content read or sent at a time, default: 64 KB.
+    --cache-timeout: seconds to cache content whose response has neither
+                     Cache-Control nor Expires, default: 10.
+    --origin-max-idle: idle connections kept to the main server, default: 8.
+    --revalidate-grace: seconds to keep expired content with ETag or
+                        Last-Modified for revalidation, default: 60.
+    --compress: store text-like content gzipped, and send it so to clients
+                accepting gzip.
+    --prefetch: file of paths to fetch into the cache at startup, one per
+                line, or a log of this server to replay. The most requested
+                paths are fetched first. With --peers, only the paths of this
+                server are.
+    --prefetch-workers: paths prefetched at a time, default: 8.
+    --prefetch-budget: bytes to prefetch at most, default: --cache-size.
+    --prefetch-wait: prefetch before serving instead of while serving.
+                     Not supported by the asyncio engine.
+    --peers: comma-separated addresses of the other caching servers of a
+             cluster. Each path is cached by one of them, found by
+             consistent hashing, and the others fetch it from there.
+    --self: address of this server as the peers know it. Required with
+            --peers.
 Usage:
-    $ ./runCachingServer.py <mainserver> [port]
+    $ ./runCachingServer.py <mainserver> [port] [--engine ENGINE]
 Example:
     $ ./runCachingServer.py localhost:8000 1222
+    $ ./runCachingServer.py localhost:8000 1222 --engine pool --workers 32
+    $ ./runCachingServer.py localhost:8000 1222 --engine asyncio
+    $ ./runCachingServer.py localhost:8000 1222 --cache-size 1048576 --cache-policy tinylfu
+    $ ./runCachingServer.py localhost:8000 1222 --cache-dir /var/cache/cdn
+    $ ./runCachingServer.py localhost:8000 1222 --compress
+    $ ./runCachingServer.py localhost:8000 1222 --prefetch cache.log --prefetch-wait
+    $ ./runCachingServer.py localhost:8000 1222 --self 10.0.0.1:1222 \
+          --peers 10.0.0.2:1222,10.0.0.3:1222
 '''
 
 import sys
 import argparse
 import pathlib
 import shutil
-from cachingServer.cachingServer import CachingServer, CachingServerHttpHandler
+from functools import partial
+from cachingServer.cachingServer import CachingServer, CachingServerHttpHandler, \
+    ThreadingCachingServer, PooledCachingServer, \
+    CACHE_CAPACITY, CACHE_POLICY, DISK_CAPACITY, BUFFER_SIZE, CACHE_TIMEOUT, \
+    ORIGIN_MAX_IDLE, REVALIDATE_GRACE, PREFETCH_WORKERS
+from cachingServer.asyncCachingServer import AsyncCachingServer, AsyncCachingHandler
+from cachingServer.evictionPolicy import POLICIES
+from cachingServer.prefetch import Prefetcher, readPaths
+
+
+ENGINES = {
+    "single": CachingServer,
+    "threading": ThreadingCachingServer,
+    "pool": PooledCachingServer,
+    "asyncio": AsyncCachingServer,
+}
 
 
 def parse_args(argv):
@@ -28,8 +83,53 @@ def parse_args(argv):
     parser.add_argument("port", action='store', default=1222, type=int, nargs='?',
                         help="port to start the http service (default: 1222)")
     parser.add_argument("--rpcserver", "-r", type=str, help="rpc server for tracing (used in test mode)")
+    parser.add_argument("--engine", "-e", choices=ENGINES.keys(), default="single",
+                        help="how clients are served (default: single)")
+    parser.add_argument("--workers", "-w", type=int, default=None,
+                        help="number of threads of the pool engine")
+    parser.add_argument("--cache-size", type=int, default=CACHE_CAPACITY,
+                        help=f"bytes of content to cache (default: {CACHE_CAPACITY})")
+    parser.add_argument("--cache-policy", choices=POLICIES.keys(), default=CACHE_POLICY,
+                        help=f"how cached content is evicted (default: {CACHE_POLICY})")
+    parser.add_argument("--cache-dir", type=str, default=None,
+                        help="directory to keep large content in (default: memory only)")
+    parser.add_argument("--disk-size", type=int, default=DISK_CAPACITY,
+                        help=f"bytes of content to keep in --cache-dir (default: {DISK_CAPACITY})")
+    parser.add_argument("--chunk-size", type=int, default=BUFFER_SIZE,
+                        help=f"bytes of content read or sent at a time (default: {BUFFER_SIZE})")
+    parser.add_argument("--cache-timeout", type=float, default=CACHE_TIMEOUT,
+                        help="seconds to cache content without Cache-Control or "
+                             f"Expires (default: {CACHE_TIMEOUT})")
+    parser.add_argument("--origin-max-idle", type=int, default=ORIGIN_MAX_IDLE,
+                        help="idle connections kept to the main server "
+                             f"(default: {ORIGIN_MAX_IDLE})")
+    parser.add_argument("--revalidate-grace", type=float, default=REVALIDATE_GRACE,
+                        help="seconds to keep expired content for revalidation "
+                             f"(default: {REVALIDATE_GRACE})")
+    parser.add_argument("--compress", action="store_true",
+                        help="store text-like content gzipped")
+    parser.add_argument("--prefetch", type=str, default=None,
+                        help="file of paths, or log of this server, to fetch at startup")
+    parser.add_argument("--prefetch-workers", type=int, default=PREFETCH_WORKERS,
+                        help=f"paths prefetched at a time (default: {PREFETCH_WORKERS})")
+    parser.add_argument("--prefetch-budget", type=int, default=None,
+                        help="bytes to prefetch at most (default: --cache-size)")
+    parser.add_argument("--prefetch-wait", action="store_true",
+                        help="prefetch before serving")
+    parser.add_argument("--peers", type=lambda value: [peer for peer in value.split(",") if peer],
+                        default=[], help="comma-separated addresses of the other caching servers")
+    parser.add_argument("--self", dest="self_address", type=str, default=None,
+                        help="address of this server as the peers know it")
     args = parser.parse_args(argv)
-    return args.mainserver, args.port, args.rpcserver
+    if args.workers is not None and args.engine != "pool":
+        parser.error("--workers requires --engine pool")
+    if args.prefetch_wait and args.engine == "asyncio":
+        parser.error("--prefetch-wait is not supported by --engine asyncio")
+    if args.peers and args.self_address is None:
+        parser.error("--peers requires --self")
+    if args.prefetch_budget is None:
+        args.prefetch_budget = args.cache_size
+    return args
 
 
 def connectRPC(rpcAddr):
@@ -43,17 +143,46 @@ def connectRPC(rpcAddr):
         utils.tracer.initateRPCServerProxy(addr, port)
 
 
+def prefetch(httpd, args):
+    ''' Fill the cache of `httpd` with the paths in args.prefetch '''
+    try:
+        with open(args.prefetch) as f:
+            paths = readPaths(f)
+    except OSError as e:
+        print(f"cannot read prefetch file '{args.prefetch}': {e}", file=sys.stderr)
+        return
+    prefetcher = Prefetcher(httpd, paths, workers=args.prefetch_workers,
+                            budget=args.prefetch_budget)
+    if args.prefetch_wait:
+        prefetcher.run()
+    else:
+        prefetcher.start()
+
+
 def main(argv):
     ''' Entry of the program '''
-    mainserver, port, rpcAddr = parse_args(argv)
-    connectRPC(rpcAddr)
+    args = parse_args(argv)
+    connectRPC(args.rpcserver)
+    serverClass = partial(ENGINES[args.engine], cacheCapacity=args.cache_size,
+                          cachePolicy=args.cache_policy, cacheDir=args.cache_dir,
+                          diskCapacity=args.disk_size, chunkSize=args.chunk_size,
+                          cacheTimeout=args.cache_timeout,
+                          originMaxIdle=args.origin_max_idle,
+                          revalidateGrace=args.revalidate_grace,
+                          compress=args.compress, peers=args.peers,
+                          selfAddress=args.self_address)
+    if args.workers is not None:
+        serverClass = partial(serverClass, workers=args.workers)
 
     # start a server
     # if you run locally, this will start a http service at
     # http://localhost:<port>
-    with CachingServer(("", port), CachingServerHttpHandler, mainserver) as httpd:
+    handler = AsyncCachingHandler if args.engine == "asyncio" else CachingServerHttpHandler
+    with serverClass(("", args.port), handler, args.mainserver) as httpd:
         print(f"Caching server serving on http://{httpd.server_address[0]}:"
               f"{httpd.server_address[1]}")
+        if args.prefetch is not None:
+            prefetch(httpd, args)
         try:
             httpd.serve_forever()
         except KeyboardInterrupt:
@@ -7,15 +7,23 @@ Command line arguments:
     [port]: port number, default: 9999.
             Notice that if you run the program not in root, the port number
             should be greater than 1024.
+    [file]: dns table, default: ./dnsServer/dns_table.txt
+    --engine: "socketserver" (default) or "asyncio".
+    --workers: number of asyncio processes sharing the port via SO_REUSEPORT.
+    --geoip: ip range table used to locate clients and servers
+             (see utils/genRangeTable.py).
 Usage:
-    $ ./runDNSServer.py [port]
+    $ ./runDNSServer.py [port] [file] [--engine asyncio [--workers N]] [--geoip FILE]
 '''
 
 import sys
+import asyncio
 import argparse
 import pathlib
 import shutil
-from dnsServer.dns_server import DNSServer, DNSHandler
+import multiprocessing
+from dnsServer.dns_server import DNSServer, AsyncDNSServer, DNSHandler
+from utils.ip_utils import IP_Utils, RangeTableBackend
 
 
 def parse_args(argv):
@@ -25,14 +33,52 @@ def parse_args(argv):
                         help="port to start the dns service (default: 9999)")
     parser.add_argument("file", action='store', default="./dnsServer/dns_table.txt", 
                         type=str, nargs='?', help="file used to load dns table (default: ./dnsServer/dns_table.txt)")
+    parser.add_argument("--engine", "-e", choices=["socketserver", "asyncio"], default="socketserver",
+                        help="server implementation (default: socketserver)")
+    parser.add_argument("--workers", "-w", default=1, type=int,
+                        help="number of asyncio worker processes sharing the port (default: 1)")
+    parser.add_argument("--geoip", "-g", type=str,
+                        help="ip range table for client and server locations")
     args = parser.parse_args(argv)
-    return (args.port, args.file)
+    if args.workers > 1 and args.engine != "asyncio":
+        parser.error("--workers requires --engine asyncio")
+    return (args.port, args.file, args.engine, args.workers, args.geoip)
+
+
+def loadGeoIP(geoip):
+    if geoip is not None:
+        IP_Utils.setBackend(RangeTableBackend(geoip))
+
+
+def runAsync(port, dns_file, reuse_port, geoip):
+    loadGeoIP(geoip)
+    try:
+        asyncio.run(AsyncDNSServer.serve(("", port), dns_file, DNSHandler, reuse_port))
+    except KeyboardInterrupt:
+        pass
 
 
 def main(argv):
     ''' Entry of the program '''
-    port,dns_file = parse_args(argv)
+    port, dns_file, engine, workers, geoip = parse_args(argv)
+
+    if engine == "asyncio":
+        if workers == 1:
+            runAsync(port, dns_file, False, geoip)
+            return
+        procs = [multiprocessing.Process(target=runAsync, args=(port, dns_file, True, geoip))
+                 for _ in range(workers)]
+        for p in procs:
+            p.start()
+        try:
+            for p in procs:
+                p.join()
+        except KeyboardInterrupt:
+            for p in procs:
+                p.join()
+        return
 
+    loadGeoIP(geoip)
     # start a server
     # if you run locally, this will start a dns service at
     # localhost:<port>
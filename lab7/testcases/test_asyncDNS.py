@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+'''Testcases of test_dns for the asyncio DNS server
+
+Run from lab7/:
+    $ python3 -m unittest testcases.test_asyncDNS
+'''
+
+import os
+import sys
+import socket
+import signal
+import asyncio
+import threading
+import unittest
+import contextlib
+from subprocess import Popen, DEVNULL
+from concurrent.futures import ThreadPoolExecutor
+from dnsServer.dns_server import AsyncDNSServer, DNSHandler
+from utils.dns_utils import DNS_Request
+from utils.network import resolve_domain_name
+from testcases import test_dns
+
+
+DNS_FILE = "dnsServer/dns_table.txt"
+
+
+def freePort():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def waitServing(port):
+    ''' Wait until a DNS server answers on `port` '''
+    request = DNS_Request.construct_dns_request("home.nasa.org.").to_bytes()
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(0.1)
+        for _ in range(100):
+            sock.sendto(request, ("127.0.0.1", port))
+            try:
+                sock.recv(1024)
+                return
+            except OSError:  # lost until the port is bound
+                pass
+
+
+class QuietHandler(DNSHandler):
+    def _logMsg(self, info, msg):
+        pass
+
+
+class AsyncDNSMixin:
+    ''' Runs the cases of test_dns against servers on `self.port` '''
+    port = None
+
+    def resolveDomain(self, domain_name):
+        return resolve_domain_name(domain_name, "127.0.0.1", self.port)
+
+    def test_concurrent(self):
+        names = ["home.nasa.org.", "lab.nasa.org", "test.cncourse.org.", "domain.non.exists"] * 50
+        with ThreadPoolExecutor(16) as executor:
+            found = list(executor.map(self.resolveDomain, names))
+        expected = {"home.nasa.org.": "10.0.0.1", "lab.nasa.org": "10.0.0.5",
+                    "test.cncourse.org.": "home.nasa.org.", "domain.non.exists": None}
+        self.assertEqual([None if res is None else str(res.response_val) for res in found],
+                         [expected[name] for name in names])
+
+
+class TestAsyncDNS(AsyncDNSMixin, test_dns.TestDNS):
+    ''' AsyncDNSServer on an event loop of this process, as with
+    --engine asyncio. Two of them share the port by SO_REUSEPORT.
+    '''
+    @classmethod
+    def setUpClass(cls):
+        cls.port = freePort()
+        cls.loop = None
+        cls.stopped = None
+        cls.thread = threading.Thread(target=asyncio.run, args=(cls.serve(),), daemon=True)
+        with contextlib.redirect_stdout(None):
+            cls.thread.start()
+            waitServing(cls.port)
+
+    @classmethod
+    async def serve(cls):
+        cls.loop = asyncio.get_running_loop()
+        cls.stopped = asyncio.Event()
+        servers = [asyncio.create_task(AsyncDNSServer.serve(
+            ("127.0.0.1", cls.port), DNS_FILE, QuietHandler, reuse_port=True))
+            for _ in range(2)]
+        await cls.stopped.wait()
+        for server in servers:
+            server.cancel()
+        await asyncio.gather(*servers, return_exceptions=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.call_soon_threadsafe(cls.stopped.set)
+        cls.thread.join(5)
+
+
+class TestAsyncDNSWorkers(AsyncDNSMixin, test_dns.TestDNS):
+    ''' runDNSServer.py --engine asyncio --workers 2 '''
+    @classmethod
+    def setUpClass(cls):
+        cls.port = freePort()
+        # a session of its own, so that the workers are stopped with it
+        cls.process = Popen([sys.executable, "runDNSServer.py", str(cls.port), DNS_FILE,
+                             "--engine", "asyncio", "--workers", "2"],
+                            stdout=DEVNULL, stderr=DEVNULL, start_new_session=True)
+        waitServing(cls.port)
+
+    @classmethod
+    def tearDownClass(cls):
+        os.killpg(cls.process.pid, signal.SIGTERM)
+        cls.process.wait(5)
+
+
+if __name__ == '__main__':
+    unittest.main()
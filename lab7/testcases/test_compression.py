@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+'''Testcases for the compression of cached bodies
+
+Run from lab7/:
+    $ python3 -m unittest testcases.test_compression
+'''
+
+import gzip
+import os
+import tempfile
+import unittest
+from cachingServer.cacheTable import CacheTable, HTTPCacheItem
+from cachingServer.compression import compressible, compress, decompress, acceptsGzip
+from cachingServer.diskCache import DiskCache
+
+
+TEXT = b"".join(b"line %d of some text\n" % i for i in range(10000))
+
+
+class TestAcceptsGzip(unittest.TestCase):
+    def test_accepted(self):
+        for value in ("gzip", "gzip, deflate, br", "deflate, GZIP;q=0.5", "x-gzip",
+                      "*", "br, *;q=0.1", "gzip;q=1.0, *;q=0", " gzip ; q=0.8 "):
+            self.assertTrue(acceptsGzip(value), value)
+
+    def test_refused(self):
+        for value in (None, "", "identity", "deflate, br", "gzip;q=0", "gzip;q=0.0",
+                      "*;q=0", "gzip;q=0, *", "gzip;q=bad"):
+            self.assertFalse(acceptsGzip(value), value)
+
+
+class TestDecompress(unittest.TestCase):
+    def test_round_trip(self):
+        body = compress(TEXT)
+        self.assertEqual(gzip.decompress(body), TEXT)
+        chunks = list(decompress(body, 4096))
+        self.assertEqual(b"".join(chunks), TEXT)
+        self.assertTrue(all(len(chunk) <= 4096 for chunk in chunks))
+
+    def test_buffers(self):
+        body = compress(TEXT)
+        self.assertEqual(b"".join(decompress(bytearray(body), 1000)), TEXT)
+        self.assertEqual(b"".join(decompress(memoryview(body), 1 << 20)), TEXT)
+        self.assertEqual(b"".join(decompress(compress(b""), 1000)), b"")
+
+    def test_incompressible(self):
+        data = os.urandom(5000)
+        self.assertEqual(b"".join(decompress(compress(data), 512)), data)
+
+
+class TestCompressible(unittest.TestCase):
+    def test_types(self):
+        size = len(TEXT)
+        self.assertTrue(compressible([("Content-Type", "text/html; charset=utf-8")], size))
+        self.assertTrue(compressible([("Content-Type", "application/ld+json")], size))
+        self.assertFalse(compressible([("Content-Type", "image/jpeg")], size))
+        self.assertFalse(compressible([("Content-Type", "text/plain")], 100))
+
+    def test_forbidden(self):
+        size = len(TEXT)
+        for header in (("Content-Encoding", "br"), ("Cache-Control", "no-transform"),
+                       ("Content-Range", "bytes 0-9/100")):
+            self.assertFalse(compressible([("Content-Type", "text/plain"), header], size))
+
+
+class TestCacheTableDecompress(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.disk = DiskCache(self.tmpdir.name)
+        self.table = CacheTable(disk=self.disk)
+        self.path = os.path.join(self.tmpdir.name, "body.gz")
+        with open(self.path, "wb") as f:
+            f.write(compress(TEXT))
+
+    def tearDown(self):
+        self.disk.close()
+        self.tmpdir.cleanup()
+
+    def item(self, file=None):
+        item = HTTPCacheItem([], None if file else compress(TEXT))
+        item.encoding, item.file = "gzip", file
+        return item
+
+    def test_memory(self):
+        self.assertEqual(b"".join(self.table.decompress(self.item(), 4096)), TEXT)
+
+    def test_disk(self):
+        file = open(self.path, "rb")
+        self.assertEqual(b"".join(self.table.decompress(self.item(file), 4096)), TEXT)
+        self.assertTrue(file.closed)
+
+    def test_closed_unread(self):
+        file = open(self.path, "rb")
+        self.table.decompress(self.item(file), 4096).close()
+        self.assertTrue(file.closed)
+        file = open(self.path, "rb")
+        chunks = self.table.decompress(self.item(file), 4096)
+        next(chunks)
+        chunks.close()
+        self.assertTrue(file.closed)
+
+
+class TestFollower(unittest.TestCase):
+    def test_attached_before_compression(self):
+        table = CacheTable(compress=True)
+        table.setHeaders("/t", [("Content-Type", "text/plain"),
+                                ("Content-Length", str(len(TEXT)))])
+        table.appendBody("/t", TEXT[:1000])
+        with table.lock:
+            headers, body = table.getHeaders("/t"), table.readBody(table.getItem("/t"), 4096)
+        table.appendBody("/t", TEXT[1000:])
+        table.finishBody("/t")  # compresses the item
+        self.assertEqual(table.getItem("/t").encoding, "gzip")
+        self.assertIn(("Content-Length", str(len(TEXT))), headers)
+        self.assertEqual(b"".join(body), TEXT)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+'''Testcases for the pool of connections to main server
+
+Run from lab7/:
+    $ python3 -m unittest testcases.test_connectionPool
+'''
+
+import time
+import asyncio
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from cachingServer.connectionPool import ConnectionPool
+from cachingServer.asyncCachingServer import OriginPool
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections.append(self.connection)
+
+    def do_GET(self):
+        body = b"hello"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        if self.path == "/close":
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.server.connections = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.pool = ConnectionPool("%s:%d" % self.server.server_address, maxIdle=2)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get(self, path="/", reusable=True, read=True):
+        res = self.pool.request("GET", path)
+        if read:
+            self.assertEqual(res.read(), b"hello")
+        self.pool.release(res, reusable=reusable)
+
+    def test_reuse(self):
+        for _ in range(5):
+            self.get()
+        self.assertEqual(len(self.server.connections), 1)
+        self.assertEqual(self.pool.stats(), {"idle": 1, "lent": 0, "connects": 1, "reuses": 4})
+
+    def test_not_reused(self):
+        self.get("/close")
+        self.get(read=False)
+        self.get(reusable=False)
+        self.assertEqual(self.pool.stats()["idle"], 0)
+        self.get()
+        self.assertEqual(self.pool.stats()["connects"], 4)
+
+    def test_closed_by_server(self):
+        self.get()
+        for connection in self.server.connections:
+            connection.shutdown(2)
+        time.sleep(0.1)
+        self.get()
+        self.assertEqual(self.pool.stats()["connects"], 2)
+        self.assertEqual(len(self.server.connections), 2)
+
+    def test_idle_timeout(self):
+        self.pool.idleTimeout = 0
+        self.get()
+        time.sleep(0.01)
+        self.get()
+        self.assertEqual(self.pool.stats()["reuses"], 0)
+
+    def test_max_idle(self):
+        responses = [self.pool.request("GET", "/") for _ in range(4)]
+        self.assertEqual(self.pool.stats()["lent"], 4)
+        for res in responses:
+            res.read()
+            self.pool.release(res)
+        self.assertEqual(self.pool.stats()["idle"], 2)
+        self.pool.close()
+        self.assertEqual(self.pool.stats()["idle"], 0)
+
+
+class TestOriginPool(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.server.connections = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.address = "%s:%d" % self.server.server_address
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def run_pool(self, paths):
+        async def fetch():
+            pool, bodies = OriginPool(self.address, maxIdle=2), []
+            for path in paths:
+                res = await pool.request(path)
+                body = b""
+                while True:
+                    data = await res.read(2)
+                    if not data:
+                        break
+                    body += data
+                res.close()
+                res.close()  # a second close does nothing
+                bodies.append(body)
+                if path == "/shutdown":
+                    self.server.connections[-1].shutdown(2)
+                    await asyncio.sleep(0.1)
+            stats = pool.stats()
+            pool.close()
+            return bodies, stats
+        return asyncio.run(fetch())
+
+    def test_reuse(self):
+        bodies, stats = self.run_pool(["/"] * 5)
+        self.assertEqual(bodies, [b"hello"] * 5)
+        self.assertEqual(stats, {"idle": 1, "connects": 1, "reuses": 4})
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_not_reused(self):
+        _, stats = self.run_pool(["/close", "/", "/shutdown", "/"])
+        self.assertEqual(stats["connects"], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
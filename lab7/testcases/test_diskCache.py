@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+'''Testcases for the disk tier of the cache
+
+Run from lab7/:
+    $ python3 -m unittest testcases.test_diskCache
+'''
+
+import os
+import time
+import tempfile
+import unittest
+from cachingServer.cacheTable import CacheTable
+from cachingServer.diskCache import DiskCache, JOURNAL, SUBDIR
+
+
+HEADERS = [("Content-Type", "application/octet-stream")]
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = self.tmpdir.name
+        self.disk = DiskCache(self.root)
+
+    def tearDown(self):
+        self.disk.close()
+        self.tmpdir.cleanup()
+
+    def put(self, key, body, expires=None):
+        self.disk.commit(key, self.disk.write(body), HEADERS, time.time(), expires)
+
+    def read(self, disk, key):
+        with disk.open(key) as file:
+            return file.read()
+
+    def restart(self):
+        self.disk.close()
+        self.disk = DiskCache(self.root)
+        return self.disk
+
+    def test_recovery(self):
+        for i in range(10):
+            self.put(f"/{i}", b"%d" % i * 100, expires=1234.5)
+        self.disk.remove("/3")
+        self.put("/4", b"new")
+        self.disk.refresh("/5", HEADERS + [("ETag", '"5"')], 1.0, 99.0)
+        disk = self.restart()
+        self.assertEqual(len(disk), 9)
+        self.assertNotIn("/3", disk)
+        self.assertEqual(self.read(disk, "/4"), b"new")
+        self.assertEqual(self.read(disk, "/7"), b"7" * 100)
+        self.assertEqual(disk.bytes, 8 * 100 + 3)
+        self.assertEqual(disk.entry("/0").headers, HEADERS)
+        self.assertEqual(disk.entry("/0").expires, 1234.5)
+        entry = disk.entry("/5")
+        self.assertEqual((entry.headers[-1], entry.timestamp, entry.expires),
+                         (("ETag", '"5"'), 1.0, 99.0))
+
+    def test_torn_journal(self):
+        self.put("/a", b"a" * 10)
+        self.disk.journal.write('{"op": "put", "key": "/b", "hea')
+        disk = self.restart()
+        self.assertEqual(list(disk.index), ["/a"])
+
+    def test_cleanup(self):
+        self.put("/a", b"a" * 10)
+        directory = self.disk.directory
+        stray = os.path.join(directory, "0" * 40)
+        partial = os.path.join(directory, "partial-x1y2.tmp")
+        for path in (stray, partial):
+            with open(path, "wb") as f:
+                f.write(b"left by a crash")
+        os.unlink(self.disk._path("/a"))
+        mine = os.path.join(directory, "notes.txt")
+        nearby = os.path.join(self.root, "notes.txt")
+        for path in (mine, nearby):
+            with open(path, "w") as f:
+                f.write("keep me")
+        os.mkdir(os.path.join(directory, "f" * 40))
+        disk = self.restart()
+        self.assertNotIn("/a", disk)  # its body is gone
+        self.assertFalse(os.path.exists(stray))
+        self.assertFalse(os.path.exists(partial))
+        self.assertTrue(os.path.exists(mine))
+        self.assertTrue(os.path.exists(nearby))
+        self.assertTrue(os.path.isdir(os.path.join(directory, "f" * 40)))
+        self.assertEqual(sorted(os.listdir(self.root)), sorted(["notes.txt", SUBDIR]))
+        self.assertIn(JOURNAL, os.listdir(directory))
+
+    def test_capacity(self):
+        self.disk.capacity = 250
+        for key in ("/a", "/b", "/c"):
+            self.put(key, b"x" * 100)
+        self.assertEqual((len(self.disk), self.disk.evictions), (2, 1))
+        self.assertNotIn("/a", self.disk)
+        self.assertEqual(len(self.restart()), 2)
+
+
+class TestCacheTableRestart(unittest.TestCase):
+    def test_warm_after_restart(self):
+        with tempfile.TemporaryDirectory() as root:
+            disk = DiskCache(root)
+            table = CacheTable(capacity=0, disk=disk)  # every body goes to disk
+            body = os.urandom(5000)
+            table.setHeaders("/big", HEADERS + [("Cache-Control", "max-age=60")])
+            table.appendBody("/big", body)
+            table.finishBody("/big")
+            self.assertNotIn("/big", table.data)
+            disk.close()
+
+            disk = DiskCache(root)
+            table = CacheTable(disk=disk)
+            self.assertIn("/big", table)
+            self.assertFalse(table.expired("/big"))
+            item = table.getItem("/big")
+            self.assertIsNone(item.body)
+            with item.file:
+                self.assertEqual(item.file.read(), body)
+            self.assertEqual(table.getHeaders("/big")[0], HEADERS[0])
+            disk.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
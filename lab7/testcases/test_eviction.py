@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+'''Testcases for the eviction policies and the byte bound of CacheTable
+
+Run from lab7/:
+    $ python3 -m unittest testcases.test_eviction
+'''
+
+import unittest
+from cachingServer.cacheTable import CacheTable
+from cachingServer.evictionPolicy import LRUPolicy, LFUPolicy, TinyLFUPolicy
+
+
+HEADERS = [("Content-Type", "text/plain")]  # 22 bytes
+
+
+class TestLRUPolicy(unittest.TestCase):
+    def test_order(self):
+        policy = LRUPolicy()
+        for key in "abc":
+            policy.insert(key)
+        policy.access("a")
+        self.assertEqual(list(policy.victims()), ["b", "c", "a"])
+        policy.remove("c")
+        policy.remove("missing")
+        self.assertEqual(list(policy.victims()), ["b", "a"])
+
+
+class TestLFUPolicy(unittest.TestCase):
+    def test_order(self):
+        policy = LFUPolicy()
+        for key in "abcd":
+            policy.insert(key)
+        for key in "aaabbd":
+            policy.access(key)
+        # c is used once, then d and b on ties of recency, then a
+        self.assertEqual(list(policy.victims()), ["c", "d", "b", "a"])
+
+    def test_reinsert(self):
+        policy = LFUPolicy()
+        policy.insert("a")
+        policy.insert("b")
+        policy.access("a")
+        policy.insert("a")  # fetched again, counted from 1
+        self.assertEqual(list(policy.victims()), ["b", "a"])
+        policy.remove("b")
+        self.assertEqual(list(policy.victims()), ["a"])
+
+
+class TestTinyLFUPolicy(unittest.TestCase):
+    def test_keeps_popular(self):
+        policy = TinyLFUPolicy()
+        for i in range(100):
+            policy.insert(i)
+        for _ in range(5):
+            policy.access(1)
+        for i in range(100, 200):
+            policy.insert(i)
+            policy.remove(next(policy.victims()))
+            self.assertEqual(len(policy), 100)
+        # one-hit keys went through, the popular one stayed
+        self.assertIn(1, list(policy.victims()))
+
+    def test_victims_cover_all(self):
+        policy = TinyLFUPolicy()
+        for i in range(50):
+            policy.insert(i)
+        for i in range(0, 50, 3):
+            policy.access(i)
+        victims = list(policy.victims())
+        self.assertEqual(sorted(victims), list(range(50)))
+        policy.remove(victims[0])
+        self.assertNotIn(victims[0], list(policy.victims()))
+
+
+class TestCacheTableBytes(unittest.TestCase):
+    def put(self, table, key, size):
+        table.setHeaders(key, HEADERS)
+        table.appendBody(key, b"x" * size)
+        table.finishBody(key)
+
+    def test_accounting(self):
+        table = CacheTable()
+        self.put(table, "/a", 100)
+        self.put(table, "/b", 50)
+        self.assertEqual(table.bytes, 22 * 2 + 150)
+        table.setHeaders("/a", HEADERS + [("ETag", '"1"')])
+        self.assertEqual(table.bytes, 22 * 2 + 7 + 150)
+        table.discard("/a", table.getItem("/a"))
+        self.assertEqual(table.bytes, 22 + 50)
+        table.setHeaders("/c", HEADERS)
+        table.appendBody("/c", b"x" * 10)
+        table.finishBody("/c", failed=True)
+        self.assertEqual(table.bytes, 22 + 50)
+        self.assertNotIn("/c", table)
+
+    def test_evicts_to_capacity(self):
+        table = CacheTable(capacity=3 * 122)
+        for key in ("/a", "/b", "/c"):
+            self.put(table, key, 100)
+        table.getItem("/a")
+        self.put(table, "/d", 100)
+        self.assertEqual(table.evictions, 1)
+        self.assertNotIn("/b", table)
+        self.assertEqual(table.bytes, 3 * 122)
+        self.assertLessEqual(table.bytes, table.capacity)
+
+    def test_keeps_incomplete(self):
+        table = CacheTable(capacity=100)
+        table.setHeaders("/big", HEADERS)
+        table.appendBody("/big", b"x" * 200)
+        self.assertIn("/big", table)  # still being filled
+        table.finishBody("/big")
+        self.assertNotIn("/big", table)
+        self.assertEqual(table.bytes, 0)
+
+    def test_policies(self):
+        for policy in ("lru", "lfu", "tinylfu"):
+            table = CacheTable(capacity=10 * 122, policy=policy)
+            for i in range(30):
+                self.put(table, f"/{i}", 100)
+                self.assertLessEqual(table.bytes, table.capacity, policy)
+            self.assertEqual(len(table.data), 10, policy)
+            self.assertEqual(table.bytes, sum(item.size for item in table.data.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+'''Testcases for the expiration of cached responses
+
+Run from lab7/:
+    $ python3 -m unittest testcases.test_freshness
+'''
+
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+import urllib.request
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from cachingServer.cacheTable import CacheTable, _freshness, storable
+from cachingServer.cachingServer import ThreadingCachingServer, CachingServerHttpHandler
+from cachingServer.asyncCachingServer import AsyncCachingServer, AsyncCachingHandler
+
+
+class TestFreshness(unittest.TestCase):
+    def test_cache_control(self):
+        self.assertEqual(_freshness([("Cache-Control", "public, max-age=60")]), 60)
+        self.assertEqual(_freshness([("cache-control", "max-age=60, s-maxage=5")]), 5)
+        self.assertEqual(_freshness([("Cache-Control", 'max-age="30"')]), 30)
+        self.assertEqual(_freshness([("Cache-Control", "max-age=60"), ("Age", "50")]), 10)
+        self.assertEqual(_freshness([("Cache-Control", "max-age=60"), ("Age", "90")]), 0)
+        self.assertEqual(_freshness([("Cache-Control", "max-age=60"), ("Age", "x")]), 60)
+
+    def test_not_cacheable(self):
+        for value in ("no-store", "no-cache", "private, max-age=60", "max-age=soon"):
+            self.assertEqual(_freshness([("Cache-Control", value)]), 0, value)
+
+    def test_expires(self):
+        ttl = _freshness([("Expires", formatdate(time.time() + 100, usegmt=True))])
+        self.assertAlmostEqual(ttl, 100, delta=2)
+        self.assertEqual(_freshness([("Expires", formatdate(time.time() - 100, usegmt=True))]), 0)
+        self.assertEqual(_freshness([("Expires", "0")]), 0)
+        # Cache-Control wins over Expires
+        headers = [("Expires", formatdate(time.time() + 100, usegmt=True)),
+                   ("Cache-Control", "max-age=5")]
+        self.assertEqual(_freshness(headers), 5)
+
+    def test_unknown(self):
+        self.assertIsNone(_freshness([]))
+        self.assertIsNone(_freshness([("Cache-Control", "public")]))
+
+    def test_storable(self):
+        for value in ("no-store", "public, no-store", "private", 'private="Set-Cookie"'):
+            self.assertFalse(storable([("Cache-Control", value)]), value)
+        for value in ("no-cache", "max-age=0", "public"):
+            self.assertTrue(storable([("Cache-Control", value)]), value)
+        self.assertTrue(storable([("Pragma", "no-store")]))
+        self.assertTrue(storable([]))
+
+
+class TestSweep(unittest.TestCase):
+    def put(self, table, key, headers):
+        table.setHeaders(key, headers)
+        table.appendBody(key, b"body")
+        table.finishBody(key)
+
+    def test_sweep(self):
+        table = CacheTable(timeout=100, grace=60)
+        self.put(table, "/stale", [("Cache-Control", "max-age=0")])
+        self.put(table, "/fresh", [("Cache-Control", "max-age=60")])
+        self.put(table, "/default", [])
+        self.put(table, "/etag", [("Cache-Control", "max-age=0"), ("ETag", '"1"')])
+        time.sleep(0.01)
+        self.assertEqual(table.sweep(), 1)
+        self.assertEqual(sorted(table.data), ["/default", "/etag", "/fresh"])
+        self.assertEqual(table.expirations, 1)
+        self.assertTrue(table.expired("/etag"))  # kept for revalidation
+        self.assertIn("/etag", table)
+        self.assertFalse(table.expired("/default"))
+
+    def test_incomplete(self):
+        table = CacheTable()
+        table.setHeaders("/filling", [("Cache-Control", "max-age=0")])
+        time.sleep(0.01)
+        self.assertFalse(table.expired("/filling"))
+        self.assertEqual(table.sweep(), 0)
+
+
+class Origin(BaseHTTPRequestHandler):
+    ''' Serves a large body with the Cache-Control given by the path '''
+    protocol_version = "HTTP/1.1"
+    body = b"x" * (2 * 1024 * 1024)  # large enough for the disk cache
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        self.send_response(200)
+        self.send_header("Cache-Control", self.path.strip("/"))
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class NoStoreMixin:
+    ''' Tests of a server engine, set in the subclasses '''
+    engine = handler = None
+
+    def setUp(self):
+        self.origin = ThreadingHTTPServer(("127.0.0.1", 0), Origin)
+        self.origin.daemon_threads = True
+        self.origin.requests = []
+        threading.Thread(target=self.origin.serve_forever, daemon=True).start()
+        self.directory = tempfile.mkdtemp()
+        self.handler.log_message = lambda *args: None
+        self.server = self.engine(("127.0.0.1", 0), self.handler,
+                                  "%s:%d" % self.origin.server_address, cacheDir=self.directory)
+        self.server.log_info = self.server.log_error = self.server.log_warning = \
+            lambda *args: None
+        self.server.cacheTable.stopSweeping()  # it would drop expired items too
+        self.serving = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.serving.start()
+        self.base = "http://127.0.0.1:%d" % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.serving.join(5)
+        self.server.server_close()
+        self.origin.shutdown()
+        self.origin.server_close()
+        shutil.rmtree(self.directory)
+
+    def get(self, path):
+        with urllib.request.urlopen(self.base + path, timeout=10) as f:
+            return f.read()
+
+    def settle(self, path, kept=True):
+        ''' Wait until the fetch of `path` ends, after its client has the
+        last byte, and its item is `kept` or dropped
+        '''
+        table = self.server.cacheTable
+        for _ in range(100):
+            with table.lock:
+                if path in table.data and table.data[path].complete if kept else \
+                        path not in table.data:
+                    return
+            time.sleep(0.05)
+
+    def test_no_store(self):
+        for path in ("/no-store", "/private"):
+            for _ in range(2):
+                self.assertEqual(self.get(path), Origin.body)
+                self.settle(path, kept=False)
+            self.assertEqual(self.origin.requests, [path] * 2)
+            self.assertNotIn(path, self.server.cacheTable)
+            self.origin.requests.clear()
+        self.assertEqual(self.server.cacheTable.stats()["bytes"], 0)
+        self.assertEqual(len(self.server.cacheTable.disk), 0)
+
+    def test_stored(self):
+        self.get("/max-age=60")
+        self.settle("/max-age=60")
+        self.assertEqual(self.get("/max-age=60"), Origin.body)
+        self.assertEqual(self.origin.requests, ["/max-age=60"])
+
+
+class TestThreadingNoStore(NoStoreMixin, unittest.TestCase):
+    engine, handler = ThreadingCachingServer, CachingServerHttpHandler
+
+
+class TestAsyncNoStore(NoStoreMixin, unittest.TestCase):
+    engine, handler = AsyncCachingServer, AsyncCachingHandler
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+'''Testcases for the memory-mapped location database
+
+Run from lab7/:
+    $ python3 -m unittest testcases.test_geoip
+'''
+
+import random
+import tempfile
+import unittest
+import pathlib
+from utils.ip_utils import IP_Utils, RangeTableBackend
+from utils.genRangeTable import syntheticRanges
+
+
+class TestRangeTable(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.tmpdir.name) / "ranges.bin"
+        self.ranges = syntheticRanges(1000, seed=7)
+        RangeTableBackend.write(self.path, self.ranges)
+        self.backend = RangeTableBackend(self.path)
+
+    def tearDown(self):
+        IP_Utils.setBackend(None)
+        self.backend.close()
+        self.tmpdir.cleanup()
+
+    def test_range_bounds(self):
+        for first, last, location in random.Random(1).sample(self.ranges, 100):
+            self.assertEqual(self.backend.lookup(first), location)
+            self.assertEqual(self.backend.lookup(last), location)
+
+    def test_not_covered(self):
+        self.assertIsNone(self.backend.lookup("0.0.0.0"))
+        self.assertIsNone(self.backend.lookup("not an ip"))
+
+    def test_ip_utils_backend(self):
+        first, _, location = self.ranges[0]
+        with self.assertRaises(ValueError):
+            IP_Utils.getIpLocation(first)
+        IP_Utils.setBackend(self.backend)
+        self.assertEqual(IP_Utils.getIpLocation(first), location)
+        self.assertEqual(IP_Utils.getIpLocation("127.0.0.1"), (0, 0))
+
+    def test_bad_magic(self):
+        self.path.write_bytes(b"\0" * 16)
+        with self.assertRaises(ValueError):
+            RangeTableBackend(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+'''Testcases for the consistent hashing of paths to caching servers
+
+Run from lab7/:
+    $ python3 -m unittest testcases.test_hashRing
+'''
+
+import unittest
+from collections import Counter
+from cachingServer.hashRing import HashRing
+
+
+NODES = ["10.0.0.%d:1222" % i for i in range(1, 5)]
+
+PATHS = ["/doc/%d.html" % i for i in range(4000)]
+
+
+class TestHashRing(unittest.TestCase):
+    def test_empty(self):
+        ring = HashRing()
+        self.assertEqual(len(ring), 0)
+        self.assertIsNone(ring.owner("/index.html"))
+
+    def test_single(self):
+        ring = HashRing(NODES[:1])
+        self.assertTrue(all(ring.owner(path) == NODES[0] for path in PATHS[:100]))
+
+    def test_stable(self):
+        # owners depend on the addresses only, not on their order
+        ring, other = HashRing(NODES), HashRing(reversed(NODES))
+        self.assertEqual([ring.owner(path) for path in PATHS],
+                         [other.owner(path) for path in PATHS])
+
+    def test_balanced(self):
+        ring = HashRing(NODES)
+        counts = Counter(ring.owner(path) for path in PATHS)
+        self.assertEqual(set(counts), set(NODES))
+        for node in NODES:
+            self.assertGreater(counts[node], len(PATHS) / len(NODES) / 2)
+
+    def test_add_remove(self):
+        ring = HashRing(NODES)
+        before = {path: ring.owner(path) for path in PATHS}
+        ring.add("10.0.0.5:1222")
+        moved = [path for path in PATHS if ring.owner(path) != before[path]]
+        # only paths taken by the new server move
+        self.assertTrue(all(ring.owner(path) == "10.0.0.5:1222" for path in moved))
+        self.assertLess(len(moved), len(PATHS) / 3)
+        ring.remove("10.0.0.5:1222")
+        self.assertEqual({path: ring.owner(path) for path in PATHS}, before)
+        ring.remove("10.0.0.9:1222")  # not in the ring
+        self.assertEqual(len(ring), len(NODES))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+'''Testcases for the memo of the nearest servers of the DNS server
+
+Run from lab7/:
+    $ python3 -m unittest testcases.test_nearest
+'''
+
+import random
+import pathlib
+import tempfile
+import unittest
+from dnslib import DNSRecord
+from dnsServer.dns_server import DNSHandler, DNSTableMixIn, great_circle_distance, locate
+from utils.ip_utils import IP_Utils, RangeTableBackend
+from utils.genRangeTable import syntheticRanges
+
+
+class Server(DNSTableMixIn):
+    def __init__(self, dns_file):
+        self.load_dns_file(dns_file)
+
+
+class Socket:
+    ''' Keeps what a handler sends '''
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data, address):
+        self.sent.append((data, address))
+
+
+class QuietHandler(DNSHandler):
+    def _logMsg(self, info, msg):
+        pass
+
+
+def nearest(client_ip, record):
+    ''' The uncached choice of the server of `record` closest to the client '''
+    src = locate(client_ip)
+    candidates = [(ip, locate(ip)) for ip in record.value]
+    candidates = [(ip, location) for ip, location in candidates if location is not None]
+    if src is None or not candidates:
+        return None
+    return min(candidates, key=lambda candidate: great_circle_distance(src, candidate[1]))[0]
+
+
+class NearestTestcase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dir = pathlib.Path(self.tmpdir.name)
+        self.backends = []
+
+    def tearDown(self):
+        IP_Utils.setBackend(None)
+        for backend in self.backends:
+            backend.close()
+        self.tmpdir.cleanup()
+
+    def setBackend(self, ranges):
+        path = self.dir / f"ranges{len(self.backends)}.bin"
+        RangeTableBackend.write(path, ranges)
+        self.backends.append(RangeTableBackend(path))
+        IP_Utils.setBackend(self.backends[-1])
+
+    def zone(self, *lines):
+        path = self.dir / "zone.txt"
+        path.write_text("".join(line + "\n" for line in lines))
+        return str(path)
+
+
+class TestMemo(NearestTestcase):
+    def test_uncached_choice(self):
+        ranges = syntheticRanges(300, seed=5)
+        self.setBackend(ranges)
+        rand = random.Random(5)
+        servers = [first for first, _, _ in rand.sample(ranges, 8)]
+        server = Server(self.zone("home.nasa.org. A 10.0.0.1 10.0.0.2 10.0.0.3",
+                                  "cdn.example. A " + " ".join(servers),
+                                  "mixed.example. A 0.0.0.0 " + " ".join(servers[:2]),
+                                  "nowhere.example. A 0.0.0.0"))
+        clients = [first for first, _, _ in ranges] + list(IP_Utils.test_cases) + ["0.0.0.0"]
+        records = [record for record in server.table if record.type == 'A']
+        for _ in range(2):  # computed, then from the memo
+            for client in clients:
+                for record in records:
+                    self.assertEqual(server.nearest_server(client, record),
+                                     nearest(client, record), (client, record))
+        info = server.nearest_server.cache_info()
+        self.assertEqual(info.hits, info.misses)
+
+
+class TestInvalidation(NearestTestcase):
+    CLIENT = "192.0.2.1"
+
+    def ranges(self, client, near, far):
+        return [("192.0.2.0", "192.0.2.255", client),
+                ("198.51.100.1", "198.51.100.1", near),
+                ("198.51.100.2", "198.51.100.2", far)]
+
+    def query(self, server, name):
+        sock = Socket()
+        QuietHandler((DNSRecord.question(name).pack(), sock), (self.CLIENT, 5353), server)
+        return str(DNSRecord.parse(sock.sent[-1][0]).a.rdata)
+
+    def test_backend(self):
+        self.setBackend(self.ranges((0, 0), (0, 1), (50, 50)))
+        server = Server(self.zone("cdn.example. A 198.51.100.1 198.51.100.2"))
+        self.assertEqual(self.query(server, "cdn.example."), "198.51.100.1")
+        self.assertEqual(self.query(server, "cdn.example."), "198.51.100.1")
+        # the client moves
+        self.setBackend(self.ranges((50, 49), (0, 1), (50, 50)))
+        self.assertEqual(self.query(server, "cdn.example."), "198.51.100.2")
+        record = server.table[0]
+        self.assertEqual(server.nearest_server(self.CLIENT, record), nearest(self.CLIENT, record))
+        # the servers move
+        self.setBackend(self.ranges((50, 49), (50, 50), (0, 1)))
+        self.assertEqual(self.query(server, "cdn.example."), "198.51.100.1")
+
+    def test_zone(self):
+        self.setBackend(self.ranges((0, 0), (0, 1), (50, 50)))
+        server = Server(self.zone("cdn.example. A 198.51.100.1 198.51.100.2"))
+        self.assertEqual(self.query(server, "cdn.example."), "198.51.100.1")
+        server.load_dns_file(self.zone("cdn.example. A 198.51.100.2"))
+        self.assertEqual(server.nearest_server.cache_info().currsize, 0)
+        self.assertEqual(self.query(server, "cdn.example."), "198.51.100.2")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+'''Testcases for the warm-up of the cache
+
+Run from lab7/:
+    $ python3 -m unittest testcases.test_prefetch
+'''
+
+import unittest
+from http.client import HTTPException, IncompleteRead
+from cachingServer.prefetch import Prefetcher, readPaths
+
+
+LOG = '2021/01/01-00:00:00| [From 127.0.0.1:50000] "%s %s HTTP/1.1" %s -'
+
+
+class TestReadPaths(unittest.TestCase):
+    def test_manifest(self):
+        lines = ["/index.html\n", "\n", "# a comment\n", "/doc/a.jpg extra\n",
+                 "not a path\n", "/index.html\n"]
+        self.assertEqual(readPaths(lines), ["/index.html", "/doc/a.jpg"])
+
+    def test_log(self):
+        lines = [LOG % ("GET", "/a", 200), LOG % ("GET", "/b", 200),
+                 LOG % ("HEAD", "/b", 304), LOG % ("GET", "/c", 404),
+                 LOG % ("POST", "/d", 200), LOG % ("GET", "/e", 206),
+                 "2021/01/01-00:00:00| [INFO] Cache: 1 items"]
+        self.assertEqual(readPaths(lines), ["/b", "/a", "/e"])
+
+    def test_mixed(self):
+        lines = ["/x", LOG % ("GET", "/y", 200), LOG % ("GET", "/y", 200), "/x", "/z",
+                 LOG % ("GET", "/x", 200)]
+        self.assertEqual(readPaths(lines), ["/x", "/y", "/z"])
+
+    def test_empty(self):
+        self.assertEqual(readPaths([]), [])
+
+
+class FakeServer:
+    ''' Just what Prefetcher uses of a CachingServer '''
+    def __init__(self, sizes, cached=(), foreign=()):
+        self.sizes = sizes
+        self.cached = set(cached).__contains__
+        self.owns = lambda path: path not in foreign
+        self.fetched = []
+        self.errors = []
+
+    def prefetchItem(self, path):
+        self.fetched.append(path)
+        size = self.sizes[path]
+        if isinstance(size, Exception):
+            raise size
+        return size
+
+    def log_error(self, msg):
+        self.errors.append(msg)
+
+    def log_info(self, msg):
+        pass
+
+
+class TestPrefetcher(unittest.TestCase):
+    def test_counts(self):
+        server = FakeServer({"/a": 10, "/b": None, "/c": OSError("unreachable"), "/d": 5},
+                            cached=["/e"])
+        prefetcher = Prefetcher(server, ["/a", "/b", "/c", "/d", "/e"], workers=3)
+        prefetcher.run()
+        self.assertEqual(sorted(server.fetched), ["/a", "/b", "/c", "/d"])
+        self.assertEqual((prefetcher.fetched, prefetcher.bytes), (2, 15))
+        self.assertEqual((prefetcher.skipped, prefetcher.failed), (1, 2))
+        self.assertEqual(len(server.errors), 1)
+
+    def test_errors(self):
+        server = FakeServer({"/a": IncompleteRead(b""), "/b": HTTPException("bad"),
+                             "/c": ConnectionResetError(), "/d": 5})
+        prefetcher = Prefetcher(server, ["/a", "/b", "/c", "/d"], workers=2)
+        prefetcher.run()
+        self.assertEqual((prefetcher.fetched, prefetcher.failed), (1, 3))
+        self.assertEqual(len(server.errors), 3)
+
+    def test_cluster(self):
+        server = FakeServer({"/a": 10, "/b": 10}, foreign=["/b", "/c"])
+        prefetcher = Prefetcher(server, ["/a", "/b", "/c"], workers=2)
+        prefetcher.run()
+        self.assertEqual(server.fetched, ["/a"])
+        self.assertEqual((prefetcher.fetched, prefetcher.skipped), (1, 2))
+
+    def test_budget(self):
+        server = FakeServer({f"/{i}": 100 for i in range(10)})
+        prefetcher = Prefetcher(server, [f"/{i}" for i in range(10)], workers=1, budget=250)
+        prefetcher.run()
+        self.assertEqual(server.fetched, ["/0", "/1", "/2"])
+
+
+if __name__ == '__main__':
+    unittest.main()
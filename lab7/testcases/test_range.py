@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+'''Testcases for the byte ranges of the caching server
+
+Run from lab7/:
+    $ python3 -m unittest testcases.test_range
+'''
+
+import os
+import tempfile
+import unittest
+from cachingServer.cachingServer import FileSlice, _parseRange, _resolveRange, _sliceBody
+
+
+class TestParseRange(unittest.TestCase):
+    def test_ranges(self):
+        self.assertEqual(_parseRange("bytes=0-99"), (0, 99))
+        self.assertEqual(_parseRange("bytes=100-"), (100, None))
+        self.assertEqual(_parseRange("bytes=-500"), (None, 500))
+        self.assertEqual(_parseRange(" Bytes = 5-5"), (5, 5))
+
+    def test_ignored(self):
+        for value in (None, "", "bytes=", "bytes=-", "items=0-1", "bytes=0-1,5-6",
+                      "bytes=9-1", "bytes=a-1", "bytes=1", "bytes=+1-2"):
+            self.assertIsNone(_parseRange(value), value)
+
+
+class TestResolveRange(unittest.TestCase):
+    def test_satisfiable(self):
+        self.assertEqual(_resolveRange((0, 99), 1000), (0, 100))
+        self.assertEqual(_resolveRange((900, 2000), 1000), (900, 1000))
+        self.assertEqual(_resolveRange((10, None), 1000), (10, 1000))
+        self.assertEqual(_resolveRange((None, 100), 1000), (900, 1000))
+        self.assertEqual(_resolveRange((None, 2000), 1000), (0, 1000))
+
+    def test_not_satisfiable(self):
+        self.assertIsNone(_resolveRange((1000, None), 1000))
+        self.assertIsNone(_resolveRange((0, None), 0))
+        self.assertIsNone(_resolveRange((None, 0), 1000))
+        self.assertIsNone(_resolveRange((None, 10), 0))
+
+
+class TestSliceBody(unittest.TestCase):
+    def setUp(self):
+        self.data = bytes(range(256)) * 40
+
+    def join(self, chunks):
+        out = b""
+        for chunk in chunks:
+            if isinstance(chunk, FileSlice):
+                with chunk.file:
+                    chunk.file.seek(chunk.offset)
+                    out += chunk.file.read(chunk.count)
+            else:
+                out += bytes(chunk)
+        return out
+
+    def test_chunks(self):
+        body = [self.data[i:i + 1000] for i in range(0, len(self.data), 1000)]
+        for start, stop in ((0, len(self.data)), (0, 1), (999, 1001), (2500, 7300),
+                            (len(self.data) - 1, len(self.data))):
+            self.assertEqual(self.join(_sliceBody(body, start, stop)),
+                             self.data[start:stop])
+
+    def test_file(self):
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(self.data)
+        self.addCleanup(os.unlink, f.name)
+        with open(f.name, "rb") as file:
+            chunks = _sliceBody([file], 100, 300)
+            chunk = next(chunks)
+            self.assertEqual(chunk, FileSlice(file, 100, 200))
+            self.assertEqual(self.join([chunk]), self.data[100:300])
+            self.assertIsNone(next(chunks, None))
+        after = open(f.name, "rb")
+        self.assertEqual(list(_sliceBody([b"x" * len(self.data), after], 0, 10)),
+                         [b"x" * 10])
+        self.assertTrue(after.closed)  # not sent, so closed
+
+    def test_closes_stream(self):
+        closed = []
+
+        def stream():
+            try:
+                for i in range(0, len(self.data), 1000):
+                    yield self.data[i:i + 1000]
+            finally:
+                closed.append(True)
+
+        self.assertEqual(self.join(_sliceBody(stream(), 10, 20)), self.data[10:20])
+        self.assertEqual(closed, [True])
+
+
+if __name__ == '__main__':
+    unittest.main()
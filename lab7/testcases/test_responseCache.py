@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+'''Testcases for the cache of DNS responses
+
+Run from lab7/:
+    $ python3 -m unittest testcases.test_responseCache
+'''
+
+import time
+import unittest
+from dnslib import DNSRecord, QTYPE
+from dnsServer.dns_server import ResponseCache, DNSHandler, DNSTableMixIn
+
+
+class TestResponseCache(unittest.TestCase):
+    def test_hit(self):
+        cache = ResponseCache()
+        self.assertIsNone(cache.get(("a.", (0, 0))))
+        cache.put(("a.", (0, 0)), b"raw")
+        self.assertEqual(cache.get(("a.", (0, 0))), b"raw")
+        self.assertIsNone(cache.get(("a.", (1, 0))))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_ttl(self):
+        cache = ResponseCache(ttl=0.05)
+        cache.put("a", b"1")
+        self.assertEqual(cache.get("a"), b"1")
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("a"))
+        self.assertNotIn("a", cache.data)
+        cache.put("a", b"2")  # stored again, with a new lifetime
+        self.assertEqual(cache.get("a"), b"2")
+
+    def test_lru(self):
+        cache = ResponseCache(capacity=2)
+        cache.put("a", b"1")
+        cache.put("b", b"2")
+        cache.get("a")
+        cache.put("c", b"3")  # b is used least recently
+        self.assertEqual(list(cache.data), ["a", "c"])
+        cache.put("a", b"4")
+        cache.put("d", b"5")
+        self.assertEqual(list(cache.data), ["a", "d"])
+        self.assertEqual(cache.get("a"), b"4")
+
+
+class Socket:
+    ''' Keeps what a handler sends '''
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data, address):
+        self.sent.append((data, address))
+
+
+class Server(DNSTableMixIn):
+    def __init__(self, dns_file="dnsServer/dns_table.txt"):
+        self.load_dns_file(dns_file)
+
+
+class QuietHandler(DNSHandler):
+    def _logMsg(self, info, msg):
+        pass
+
+
+class TestHandler(unittest.TestCase):
+    def setUp(self):
+        self.server = Server()
+        self.socket = Socket()
+
+    def query(self, name, client="127.0.0.1", id=1):
+        request = DNSRecord.question(name)
+        request.header.id = id
+        QuietHandler((request.pack(), self.socket), (client, 5353), self.server)
+        data, address = self.socket.sent[-1]
+        self.assertEqual(address, (client, 5353))
+        return data
+
+    def test_transaction_id(self):
+        first = self.query("home.nasa.org.", id=1)
+        second = self.query("home.nasa.org.", id=0xbeef)
+        self.assertEqual(self.server.response_cache.hits, 1)
+        self.assertEqual(DNSRecord.parse(first).header.id, 1)
+        self.assertEqual(DNSRecord.parse(second).header.id, 0xbeef)
+        self.assertEqual(first[2:], second[2:])
+
+    def test_answers(self):
+        for name, qtype, answer in (("home.nasa.org.", QTYPE.A, "10.0.0.1"),
+                                    ("lab.nasa.org", QTYPE.A, "10.0.0.5"),
+                                    ("test.cncourse.org.", QTYPE.CNAME, "home.nasa.org.")):
+            for id in (1, 2):  # a miss, then a hit
+                response = DNSRecord.parse(self.query(name, "10.0.0.1", id))
+                self.assertEqual(response.header.id, id)
+                self.assertEqual(response.a.rtype, qtype)
+                self.assertEqual(str(response.a.rdata), answer)
+        self.assertEqual(self.server.response_cache.hits, 3)
+
+    def test_per_location(self):
+        self.query("home.nasa.org.", "10.0.0.1")
+        self.query("home.nasa.org.", "10.0.0.3")
+        self.query("home.nasa.org.", "10.0.0.3")
+        self.assertEqual(len(self.server.response_cache.data), 2)
+        self.assertEqual(self.server.response_cache.hits, 1)
+
+    def test_no_location(self):
+        # the answer of a client of unknown location is random, so not kept
+        for id in (1, 2):
+            response = DNSRecord.parse(self.query("home.nasa.org.", "192.168.0.1", id))
+            self.assertEqual(response.header.id, id)
+            self.assertIn(str(response.a.rdata), ("10.0.0.1", "10.0.0.2", "10.0.0.3"))
+        self.assertEqual(len(self.server.response_cache.data), 0)
+        self.assertEqual(self.server.response_cache.hits, 0)
+
+    def test_nxdomain(self):
+        for id in (1, 2):
+            response = DNSRecord.parse(self.query("domain.non.exists", id=id))
+            self.assertEqual(response.header.id, id)
+            self.assertEqual(response.header.rcode, 3)
+        self.assertEqual(self.server.response_cache.hits, 1)
+
+    def test_expired(self):
+        self.server.response_cache = ResponseCache(ttl=0.05)
+        self.query("home.nasa.org.")
+        time.sleep(0.1)
+        self.query("home.nasa.org.")
+        self.assertEqual(self.server.response_cache.hits, 0)
+        self.assertEqual(self.server.response_cache.misses, 2)
+
+    def test_invalid(self):
+        QuietHandler((b"\x00\x01garbage", self.socket), ("127.0.0.1", 5353), self.server)
+        self.assertEqual(DNSRecord.parse(self.socket.sent[-1][0]).header.rcode, 1)
+        self.assertEqual(len(self.server.response_cache.data), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+'''Testcases for the revalidation of expired responses
+
+Run from lab7/:
+    $ python3 -m unittest testcases.test_revalidation
+'''
+
+import os
+import shutil
+import tempfile
+import time
+import threading
+import unittest
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from cachingServer.cachingServer import ThreadingCachingServer, CachingServerHttpHandler
+from cachingServer.asyncCachingServer import AsyncCachingServer, AsyncCachingHandler
+
+
+SMALL = b"a small body\n" * 100
+
+LARGE = os.urandom(2 * 1024 * 1024)  # kept on disk, see DISK_MIN_SIZE
+
+
+class Origin(BaseHTTPRequestHandler):
+    ''' Serves /small and /large with an ETag, expired at once.
+    A conditional request is answered as server.mode says: "same" for 304,
+    "changed" for a new version, "drop" to close the connection unanswered.
+    '''
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        condition = self.headers.get("If-None-Match")
+        self.server.requests.append((self.path, condition))
+        if condition is not None and self.server.mode == "drop":
+            self.close_connection = True
+            return
+        if condition == self.server.etag and self.server.mode == "same":
+            self.send_response(304)
+            self.send_header("ETag", self.server.etag)
+            self.send_header("Cache-Control", "max-age=60")
+            self.end_headers()
+            return
+        body = LARGE if self.path == "/large" else SMALL
+        if self.server.mode == "changed":
+            body = body[::-1]
+        self.send_response(200)
+        self.send_header("ETag", self.server.etag)
+        self.send_header("Cache-Control", "max-age=0")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class RevalidationMixin:
+    ''' Tests of a server engine, set in the subclasses '''
+    engine = handler = None
+
+    def setUp(self):
+        self.origin = ThreadingHTTPServer(("127.0.0.1", 0), Origin)
+        self.origin.daemon_threads = True
+        self.origin.requests = []
+        self.origin.mode = "same"
+        self.origin.etag = '"1"'
+        threading.Thread(target=self.origin.serve_forever, daemon=True).start()
+        self.directory = tempfile.mkdtemp()
+        self.handler.log_message = lambda *args: None
+        # large bodies do not fit in memory, they are read from disk
+        self.server = self.engine(("127.0.0.1", 0), self.handler,
+                                  "%s:%d" % self.origin.server_address,
+                                  cacheCapacity=len(LARGE) // 2, cacheDir=self.directory)
+        self.server.log_info = self.server.log_error = self.server.log_warning = \
+            self.server.handle_error = lambda *args: None
+        self.serving = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.serving.start()
+        self.base = "http://127.0.0.1:%d" % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.serving.join(5)
+        self.server.server_close()
+        self.origin.shutdown()
+        self.origin.server_close()
+        shutil.rmtree(self.directory)
+
+    def get(self, path):
+        with urllib.request.urlopen(self.base + path, timeout=10) as f:
+            return f.headers, f.read()
+
+    def fetch(self, path):
+        ''' GET `path` and wait until it is stored, which its fetch does
+        after the client has the last byte.
+        '''
+        body = self.get(path)[1]
+        table = self.server.cacheTable
+        for _ in range(100):
+            with table.lock:
+                if path in table.disk if path == "/large" else \
+                        path in table.data and table.data[path].complete:
+                    break
+            time.sleep(0.05)
+        return body
+
+    def test_not_modified(self):
+        for path, body in (("/small", SMALL), ("/large", LARGE)):
+            self.assertEqual(self.fetch(path), body)
+            headers, data = self.get(path)
+            self.assertEqual(data, body)
+            self.assertEqual(headers["Cache-Control"], "max-age=60")
+            self.assertEqual(self.get(path)[1], body)  # fresh again
+            self.assertEqual(self.origin.requests, [(path, None), (path, '"1"')])
+            self.origin.requests.clear()
+
+    def test_changed(self):
+        self.fetch("/large")
+        self.origin.mode, self.origin.etag = "changed", '"2"'
+        self.assertEqual(self.get("/large")[1], LARGE[::-1])
+        self.assertEqual(self.origin.requests, [("/large", None), ("/large", '"1"')])
+
+    def test_failed(self):
+        items = []
+        getItem = self.server.cacheTable.getItem
+
+        def keepItem(key):
+            items.append(getItem(key))
+            return items[-1]
+        self.server.cacheTable.getItem = keepItem
+        self.fetch("/large")
+        self.origin.mode = "drop"
+        with self.assertRaises(Exception):
+            self.get("/large")
+        stale = [item for item in items if item.file is not None]
+        self.assertTrue(stale)
+        self.assertTrue(all(item.file.closed for item in stale))
+        # the revalidation ended, the next request goes on
+        self.origin.mode = "same"
+        self.assertEqual(self.get("/large")[1], LARGE)
+
+
+class TestThreadingRevalidation(RevalidationMixin, unittest.TestCase):
+    engine, handler = ThreadingCachingServer, CachingServerHttpHandler
+
+
+class TestAsyncRevalidation(RevalidationMixin, unittest.TestCase):
+    engine, handler = AsyncCachingServer, AsyncCachingHandler
+
+
+if __name__ == '__main__':
+    unittest.main()
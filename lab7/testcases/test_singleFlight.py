@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+'''Testcases for concurrent misses sharing one fetch
+
+Run from lab7/:
+    $ python3 -m unittest testcases.test_singleFlight
+'''
+
+import os
+import time
+import socket
+import threading
+import unittest
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from cachingServer.cacheTable import CacheTable
+from cachingServer.cachingServer import CachingServer, ThreadingCachingServer, \
+    CachingServerHttpHandler
+from cachingServer.asyncCachingServer import AsyncCachingServer, AsyncCachingHandler
+
+
+DATA = os.urandom(1 << 20)
+
+TEXT = b"".join(b"line %d of some text\n" % i for i in range(50000))
+
+PIECE = 64 * 1024
+
+
+class TestCacheTableFlight(unittest.TestCase):
+    def setUp(self):
+        self.table = CacheTable()
+
+    def follow(self, item, results):
+        headers = self.table.waitHeaders(item)
+        if headers is None:
+            results.append(None)
+            return
+        with self.table.lock:
+            body = self.table.readBody(item, 1000)
+        try:
+            results.append(b"".join(body))
+        except ConnectionAbortedError as e:
+            results.append(e)
+
+    def start(self, item, results, count=4):
+        threads = [threading.Thread(target=self.follow, args=(item, results))
+                   for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def test_followers(self):
+        item = self.table.reserve("/a")
+        results = []
+        early = self.start(item, results)  # before the headers
+        self.table.setHeaders("/a", [("Content-Length", "3000")])
+        self.table.appendBody("/a", DATA[:1500])
+        late = self.start(item, results)  # in the middle of the body
+        time.sleep(0.05)
+        self.table.appendBody("/a", DATA[1500:3000])
+        self.table.finishBody("/a")
+        for thread in early + late:
+            thread.join(5)
+        self.assertEqual(results, [DATA[:3000]] * 8)
+
+    def test_failed_before_headers(self):
+        item = self.table.reserve("/a")
+        results = []
+        threads = self.start(item, results)
+        time.sleep(0.05)
+        self.table.finishBody("/a", failed=True)
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(results, [None] * 4)
+        self.assertNotIn("/a", self.table)
+
+    def test_failed_in_body(self):
+        item = self.table.reserve("/a")
+        self.table.setHeaders("/a", [("Content-Length", "3000")])
+        self.table.appendBody("/a", DATA[:1000])
+        results = []
+        threads = self.start(item, results)
+        time.sleep(0.05)
+        self.table.finishBody("/a", failed=True)
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(isinstance(result, ConnectionAbortedError) for result in results))
+        self.assertNotIn("/a", self.table)
+
+
+class Origin(BaseHTTPRequestHandler):
+    ''' Sends the body slowly, so that clients arrive while it is fetched '''
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        body = TEXT if self.path.startswith("/text") else DATA
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain" if body is TEXT else "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        for i in range(0, len(body), PIECE):
+            if self.path.startswith("/broken") and i >= len(body) // 2:
+                self.close_connection = True
+                self.connection.shutdown(socket.SHUT_RDWR)
+                return
+            self.wfile.write(body[i:i + PIECE])
+            self.wfile.flush()
+            time.sleep(0.01)
+
+    def log_message(self, *args):
+        pass
+
+
+class ServerFlightMixin:
+    ''' Tests of a server engine, set in the subclasses '''
+    engine = handler = None
+
+    def setUp(self):
+        self.origin = ThreadingHTTPServer(("127.0.0.1", 0), Origin)
+        self.origin.daemon_threads = True
+        self.origin.requests = []
+        threading.Thread(target=self.origin.serve_forever, daemon=True).start()
+        self.handler.log_message = lambda *args: None
+        self.server = self.engine(("127.0.0.1", 0), self.handler,
+                                  "%s:%d" % self.origin.server_address, compress=True)
+        self.server.log_info = self.server.log_error = self.server.log_warning = \
+            self.server.handle_error = lambda *args: None
+        self.serving = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.serving.start()
+        self.base = "http://127.0.0.1:%d" % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.serving.join(5)
+        self.server.server_close()
+        self.origin.shutdown()
+        self.origin.server_close()
+
+    def get(self, path, delay=0, headers={}):
+        time.sleep(delay)
+        request = urllib.request.Request(self.base + path, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=10) as f:
+                return f.headers, f.read()
+        except Exception as e:
+            return None, e
+
+    def getMany(self, path, delays, headers={}):
+        with ThreadPoolExecutor(len(delays)) as executor:
+            return list(executor.map(lambda delay: self.get(path, delay, headers), delays))
+
+    def test_one_fetch(self):
+        results = self.getMany("/a", [0] * 8)
+        self.assertEqual([body for _, body in results], [DATA] * 8)
+        self.assertEqual(self.origin.requests, ["/a"])
+
+    def test_follower_mid_body(self):
+        results = self.getMany("/a", [0, 0.05, 0.1])
+        self.assertEqual([body for _, body in results], [DATA] * 3)
+        self.assertEqual(self.origin.requests, ["/a"])
+
+    def test_follower_before_compression(self):
+        # followers take the plain body, even though the item is gzipped
+        # once complete
+        results = self.getMany("/text", [0, 0.05, 0.1], {"Accept-Encoding": "identity"})
+        for headers, body in results:
+            self.assertEqual(body, TEXT)
+            self.assertEqual(headers["Content-Length"], str(len(TEXT)))
+            self.assertIsNone(headers["Content-Encoding"])
+        # the leader compresses it after its client has the last byte
+        for _ in range(100):
+            with self.server.cacheTable.lock:
+                if self.server.cacheTable.data["/text"].encoding == "gzip":
+                    break
+            time.sleep(0.05)
+        headers, body = self.get("/text", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(headers["Content-Encoding"], "gzip")
+        self.assertEqual(self.origin.requests, ["/text"])
+
+    def test_leader_fails(self):
+        results = self.getMany("/broken", [0, 0.05, 0.05])
+        self.assertTrue(all(isinstance(body, Exception) for _, body in results), results)
+        # nothing incomplete is left behind: the next client fetches again
+        _, body = self.get("/broken")
+        self.assertIsInstance(body, Exception)
+        self.assertEqual(self.origin.requests, ["/broken"] * 2)
+        self.assertNotIn("/broken", self.server.cacheTable)
+
+
+class TestThreadingFlight(ServerFlightMixin, unittest.TestCase):
+    engine, handler = ThreadingCachingServer, CachingServerHttpHandler
+
+
+class TestAsyncFlight(ServerFlightMixin, unittest.TestCase):
+    engine, handler = AsyncCachingServer, AsyncCachingHandler
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+'''Testcases for the index of the DNS zone
+
+Run from lab7/:
+    $ python3 -m unittest testcases.test_zone
+'''
+
+import random
+import unittest
+from itertools import zip_longest
+from dnsServer.dns_server import ZoneIndex, DNS_Record
+
+
+def match(name, domain):
+    ''' The linear scan the index replaces '''
+    return all(y == '*' or x == y or (not x and not y)
+               for x, y in zip_longest(name.split('.'), domain.split('.')))
+
+
+class TestZoneIndex(unittest.TestCase):
+    def setUp(self):
+        self.records = [DNS_Record("home.nasa.org.", "A", ("1.1.1.1",)),
+                        DNS_Record("*.nasa.org", "A", ("2.2.2.2",)),
+                        DNS_Record("www.nasa.org.", "A", ("3.3.3.3",)),
+                        DNS_Record("*.*.localhost.computer.", "CNAME", ("cdn.",)),
+                        DNS_Record("stfw.*", "A", ("4.4.4.4",))]
+        self.zone = ZoneIndex(self.records)
+
+    def search(self, name):
+        record = self.zone.search(name)
+        return None if record is None else self.records.index(record)
+
+    def test_exact(self):
+        self.assertEqual(self.search("home.nasa.org."), 0)
+        self.assertEqual(self.search("home.nasa.org"), 0)
+
+    def test_wildcard(self):
+        self.assertEqual(self.search("ftp.nasa.org."), 1)
+        self.assertEqual(self.search("a.b.localhost.computer"), 3)
+        self.assertEqual(self.search("stfw.localhost."), 4)
+        # a '*' stands for exactly one label
+        self.assertIsNone(self.search("a.localhost.computer."))
+        self.assertIsNone(self.search("a.b.c.localhost.computer."))
+
+    def test_first_match(self):
+        # the wildcard comes first in the file, so it wins over the exact name
+        self.assertEqual(self.search("www.nasa.org."), 1)
+        self.zone.add(DNS_Record("ftp.nasa.org.", "A", ("5.5.5.5",)))
+        self.assertEqual(self.search("ftp.nasa.org."), 1)
+
+    def test_no_match(self):
+        self.assertIsNone(self.search("nasa.org."))
+        self.assertIsNone(self.search("example.com."))
+        self.assertIsNone(ZoneIndex().search("home.nasa.org."))
+
+    def test_linear_scan(self):
+        rand = random.Random(3)
+        labels = ["a", "b", "c", "*"]
+
+        def name(wildcard):
+            result = ".".join(rand.choice(labels if wildcard else labels[:3])
+                              for _ in range(rand.randint(1, 4)))
+            return result + "." if rand.random() < 0.5 else result
+
+        for _ in range(1000):
+            records = [DNS_Record(name(True), "A", ("1.1.1.1",))
+                       for _ in range(rand.randint(1, 8))]
+            zone = ZoneIndex(records)
+            for _ in range(10):
+                query = name(False)
+                expected = next((record for record in records
+                                 if match(query, record.domain)), None)
+                self.assertIs(zone.search(query), expected, (query, records))
+
+
+class TestPrecedence(unittest.TestCase):
+    ''' The record found is the first one the linear scan would match '''
+    def first(self, domains, name):
+        records = [DNS_Record(domain, "A", (f"10.0.0.{i}",)) for i, domain in enumerate(domains)]
+        record = ZoneIndex(records).search(name)
+        expected = next((record for record in records if match(name, record.domain)), None)
+        self.assertIs(record, expected)
+        return None if record is None else records.index(record)
+
+    def test_exact_first(self):
+        self.assertEqual(self.first(["www.nasa.org.", "*.nasa.org."], "www.nasa.org."), 0)
+        self.assertEqual(self.first(["*.nasa.org.", "www.nasa.org."], "www.nasa.org."), 0)
+
+    def test_wildcards(self):
+        # the order in the zone decides, not which one is more specific
+        self.assertEqual(self.first(["a.*.c.", "*.b.c."], "a.b.c."), 0)
+        self.assertEqual(self.first(["*.b.c.", "a.*.c."], "a.b.c."), 0)
+        self.assertEqual(self.first(["*.*.c.", "a.b.*"], "a.b.c"), 0)
+        self.assertEqual(self.first(["x.*.c.", "a.b.*", "*.*.c."], "a.b.c"), 1)
+
+    def test_duplicates(self):
+        self.assertEqual(self.first(["home.org", "home.org."], "home.org."), 0)
+        self.assertEqual(self.first(["*.org.", "*.org"], "home.org"), 0)
+
+    def test_trailing_wildcard(self):
+        # as in the linear scan, a trailing `*` also matches no label at all
+        self.assertEqual(self.first(["stfw.*"], "stfw."), 0)
+        self.assertIsNone(self.first(["stfw.a"], "stfw."))
+        self.assertEqual(self.first(["stfw.*", "*"], "stfw.a"), 0)
+        self.assertEqual(self.first(["*", "stfw.*"], "a"), 0)
+
+    def test_zone_file(self):
+        with open("dnsServer/dns_table.txt") as f:
+            records = [DNS_Record(line.split()[0], line.split()[1], tuple(line.split()[2:]))
+                       for line in f if line.strip()]
+        zone = ZoneIndex(records)
+        names = [record.domain for record in records] + \
+                ["a.cncourse.org", "homepage.cncourse.org", "x.netlab.org.", "nasa.org.",
+                 "a.localhost.computer.", "localhost.computer", "home.nasa.org"]
+        for name in names:
+            expected = next((record for record in records if match(name, record.domain)), None)
+            self.assertIs(zone.search(name), expected, name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -20,10 +20,30 @@ class DNS_Request:
     it easier for you to finish the lab, without caring many details on the
     protocol itself. We also do not consider about the performance issue.
     """
-    def __init__(self, raw_data):
+    def __init__(self, raw_data, record=None):
+        """
+        record: the DNSRecord parsed from raw_data, if the caller already has
+                it. Otherwise raw_data is parsed here.
+        """
         self._raw_data = raw_data
+        self._record = DNSRecord.parse(raw_data) if record is None else record
         # Only support one question now.
-        self._domain_name = DNSRecord.parse(raw_data).questions[0].get_qname()
+        self._domain_name = self._record.questions[0].get_qname()
+
+    @classmethod
+    def parse(cls, raw_data):
+        """
+        This function validates and decodes a dns request in one pass.
+        return: DNS_Request object, or None if the format is invalid
+        usage: DNS_Request.parse(udp_data)
+        """
+        try:
+            record = DNSRecord.parse(raw_data)
+        except DNSError:
+            return None
+        if len(record.questions) < 1:
+            return None
+        return cls(raw_data, record)
 
     @property
     def domain_name(self):
@@ -32,6 +52,10 @@ class DNS_Request:
     @property
     def raw_data(self):
         return self._raw_data
+
+    @property
+    def record(self):
+        return self._record
     
     def to_bytes(self):
         return self._raw_data
@@ -46,13 +70,13 @@ class DNS_Request:
         rd : Recursion Desired
         """
         if response[0] == "CNAME":
-            return DNS_Response(DNSRecord(header=DNSHeader(qr=1,aa=1,ra=1, rcode=DNS_Rcode.NoError.value),
-                                          q=DNSQuestion(self._domain_name),
-                                          a=RR(self._domain_name, rtype=QTYPE.CNAME, rdata=CNAME(response[1]))).pack())
+            return DNS_Response.from_record(DNSRecord(header=DNSHeader(qr=1,aa=1,ra=1, rcode=DNS_Rcode.NoError.value),
+                                                      q=DNSQuestion(self._domain_name),
+                                                      a=RR(self._domain_name, rtype=QTYPE.CNAME, rdata=CNAME(response[1]))))
         elif response[0] == "A":
-            return DNS_Response(DNSRecord(header=DNSHeader(qr=1,aa=1,ra=1, rcode=DNS_Rcode.NoError.value),
-                                          q=DNSQuestion(self._domain_name),
-                                          a=RR(self._domain_name, rdata=A(response[1]))).pack())
+            return DNS_Response.from_record(DNSRecord(header=DNSHeader(qr=1,aa=1,ra=1, rcode=DNS_Rcode.NoError.value),
+                                                      q=DNSQuestion(self._domain_name),
+                                                      a=RR(self._domain_name, rdata=A(response[1]))))
 
     @classmethod
     def generate_error_response(cls, error_code):
@@ -61,7 +85,7 @@ class DNS_Request:
         return: DNS_Response object
         usage: req_obj.generate_error_response(DNS_Rcode.FormErr)
         """
-        return DNS_Response(DNSRecord(header=DNSHeader(qr=1,aa=1,ra=1, rcode=error_code.value)).pack())
+        return DNS_Response.from_record(DNSRecord(header=DNSHeader(qr=1,aa=1,ra=1, rcode=error_code.value)))
 
     @classmethod
     def construct_dns_request(cls, domain_name):
@@ -84,9 +108,13 @@ class DNS_Request:
         return True
     
 class DNS_Response:
-    def __init__(self, raw_data):
+    def __init__(self, raw_data, record=None):
+        """
+        record: the DNSRecord that raw_data was packed from, if known.
+                Otherwise raw_data is parsed here.
+        """
         self._raw_data = raw_data
-        d = DNSRecord.parse(raw_data)
+        d = DNSRecord.parse(raw_data) if record is None else record
         self._rcode = d.header.get_rcode()
         self._response_type = None
         self._response_val = None
@@ -95,6 +123,14 @@ class DNS_Response:
             self._response_val = d.a.rdata    
             self._domain_name = d.questions[0].get_qname()
 
+    @classmethod
+    def from_record(cls, record):
+        """
+        This function packs a dnslib DNSRecord without parsing it back.
+        return: DNS_Response object
+        """
+        return cls(record.pack(), record)
+
     @property
     def domain_name(self):
         return self._domain_name
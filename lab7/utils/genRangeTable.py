@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+'''Generate a synthetic ip range table for RangeTableBackend
+
+The address space is cut into `count` random, non-overlapping ranges, each
+with a random location. Useful for tests and benchmarks when no real GeoIP
+data is at hand.
+
+Usage:
+    $ python3 -m utils.genRangeTable <output> [--count N] [--seed S]
+'''
+
+import sys
+import random
+import socket
+import struct
+import argparse
+from utils.ip_utils import RangeTableBackend
+
+
+def syntheticRanges(count, seed=None):
+    ''' Return `count` ranges of (first ip, last ip, (latitude, longitude)) '''
+    rand = random.Random(seed)
+    bounds = sorted(rand.sample(range(1, 1 << 32), 2 * count))
+    toStr = lambda addr: socket.inet_ntoa(struct.pack("!I", addr))
+    return [(toStr(bounds[2 * i]), toStr(bounds[2 * i + 1]),
+             (rand.uniform(-90, 90), rand.uniform(-180, 180)))
+            for i in range(count)]
+
+
+def parse_args(argv):
+    ''' Parse arguments of the program '''
+    parser = argparse.ArgumentParser(description="Generate a synthetic ip range table")
+    parser.add_argument("output", type=str, help="file to write")
+    parser.add_argument("--count", "-n", default=100000, type=int,
+                        help="number of ranges (default: 100000)")
+    parser.add_argument("--seed", "-s", default=None, type=int,
+                        help="random seed")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    RangeTableBackend.write(args.output, syntheticRanges(args.count, args.seed))
+    print(f"Wrote {args.count} ranges to '{args.output}'")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
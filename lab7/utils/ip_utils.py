@@ -1,8 +1,91 @@
 import os
+import mmap
+import socket
+import struct
 import pathlib
+from array import array
+from bisect import bisect_right
 # import geoip2.webservice
 # import geoip2.database
 
+
+RANGE_TABLE_MAGIC = b"IPRT"
+
+RANGE_TABLE_HEADER = struct.Struct("=4sI")  # magic, number of ranges
+
+
+class RangeTableBackend:
+    ''' A location database backed by a memory-mapped range table.
+
+    The file holds, in native byte order, a header (magic, count) followed by
+    three arrays sorted by start address:
+        - starts: uint32[count], first address of each range
+        - ends: uint32[count], last address of each range
+        - locations: double[2 * count], (latitude, longitude) of each range
+    The file is opened and mapped once. A lookup is a binary search over the
+    mapped start addresses and reads no more than the matching entry.
+
+    Example:
+        >>> RangeTableBackend.write(path, [("10.0.0.0", "10.0.0.255", (20, 0))])
+        >>> backend = RangeTableBackend(path)
+        >>> backend.lookup("10.0.0.1")
+        (20.0, 0.0)
+    '''
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, count = RANGE_TABLE_HEADER.unpack_from(view)
+        if magic != RANGE_TABLE_MAGIC:
+            view.release()
+            self._mmap.close()
+            raise ValueError(f"'{path}' is not an ip range table")
+        offset = RANGE_TABLE_HEADER.size
+        self.starts = view[offset:offset + 4 * count].cast("I")
+        offset += 4 * count
+        self.ends = view[offset:offset + 4 * count].cast("I")
+        offset += 4 * count
+        self.locations = view[offset:offset + 16 * count].cast("d")
+        view.release()
+
+    def lookup(self, ip_str):
+        ''' (latitude, longitude) of `ip_str`, or None if it is not covered '''
+        try:
+            addr, = struct.unpack("!I", socket.inet_aton(ip_str))
+        except OSError:
+            return None
+        i = bisect_right(self.starts, addr) - 1
+        if i < 0 or addr > self.ends[i]:
+            return None
+        return (self.locations[2 * i], self.locations[2 * i + 1])
+
+    def close(self):
+        for view in (self.starts, self.ends, self.locations):
+            view.release()
+        self._mmap.close()
+
+    @staticmethod
+    def write(path, ranges):
+        ''' Write a range table.
+        Params:
+            ranges: iterable of (first ip, last ip, (latitude, longitude)).
+                Ranges must not overlap.
+        '''
+        toInt = lambda ip: struct.unpack("!I", socket.inet_aton(ip))[0]
+        ranges = sorted((toInt(first), toInt(last), location)
+                        for first, last, location in ranges)
+        starts, ends, locations = array("I"), array("I"), array("d")
+        for start, end, (latitude, longitude) in ranges:
+            starts.append(start)
+            ends.append(end)
+            locations.extend((latitude, longitude))
+        with open(path, "wb") as f:
+            f.write(RANGE_TABLE_HEADER.pack(RANGE_TABLE_MAGIC, len(starts)))
+            f.write(starts.tobytes())
+            f.write(ends.tobytes())
+            f.write(locations.tobytes())
+
+
 class IP_Utils:
     test_cases = {
         "127.0.0.1": (0,0),
@@ -13,6 +96,18 @@ class IP_Utils:
         "10.0.0.5" : (28.5,50),
     }
 
+    backend = None  # shared location database, see setBackend()
+    generation = 0  # changed by setBackend(), so that users can drop cached locations
+
+    @staticmethod
+    def setBackend(backend):
+        """ Use `backend` for addresses that are not in test_cases.
+        backend: an object with lookup(ip_str) returning a location tuple or
+                 None, e.g. RangeTableBackend. None to disable.
+        """
+        IP_Utils.backend = backend
+        IP_Utils.generation += 1
+
     @staticmethod
     def getIpLocation(ip_str):
         """ Read the latitude and Longitude of an ip address.
@@ -26,6 +121,8 @@ class IP_Utils:
         """
         if ip_str in IP_Utils.test_cases.keys():
             return IP_Utils.test_cases[ip_str]
+        if IP_Utils.backend is not None:
+            return IP_Utils.backend.lookup(ip_str)
         raise ValueError(f"IP address {ip_str} is not in location databse")
         # database = pathlib.Path(__file__).parent / 'data/GeoLite2-City.mmdb'
         # reader = geoip2.database.Reader(str(database))